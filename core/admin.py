@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser
+from .models import AuditEntry, CustomUser
+from . import exports
 
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
@@ -12,4 +13,31 @@ class CustomUserAdmin(UserAdmin):
     search_fields = ['username', 'email', 'first_name', 'last_name']
 
     # which columns to display in the users table
-    list_display = ['username', 'email', 'first_name', 'last_name', 'is_active']
\ No newline at end of file
+    list_display = ['username', 'email', 'first_name', 'last_name', 'is_active']
+    actions = ['export_members_csv', 'export_members_xlsx']
+
+    @admin.action(description="Експорт на избраните (CSV)")
+    def export_members_csv(self, request, queryset):
+        return exports.members_response(queryset, 'csv', request)
+
+    @admin.action(description="Експорт на избраните (XLSX)")
+    def export_members_xlsx(self, request, queryset):
+        return exports.members_response(queryset, 'xlsx', request)
+
+
+@admin.register(AuditEntry)
+class AuditEntryAdmin(admin.ModelAdmin):
+    """The audit log is append-only: it can be browsed here, but not edited."""
+    list_display = ['at', 'target_type', 'target_id', 'old_value', 'new_value', 'source', 'actor_id']
+    list_filter = ['target_type', 'source', 'new_value']
+    search_fields = ['=target_id', '=actor_id']
+    date_hierarchy = 'at'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Case, CharField, Count, Q, Value, When
+from django.utils import timezone
+
+from . import audit
+from .auth import invalidate_cached_users
+from .emails import queue_templated_emails
+from .models import AuditEntry
+
+User = get_user_model()
+
+APPROVAL_EMAIL = {
+    'subject': "LuxeLadies – Регистрацията е одобрена",
+    'txt_template': "email/user_approved.txt",
+    'html_template': "email/user_approved.html",
+}
+
+# why a pending user does not pass the rules, in the order they are checked
+REASONS = {
+    'age_missing': "Няма посочена възраст",
+    'under_age': "Под минималната възраст",
+    'no_occupation': "Нито учи, нито работи",
+}
+
+
+def min_age() -> int:
+    return getattr(settings, 'APPROVAL_MIN_AGE', 18)
+
+
+def eligible_q() -> Q:
+    """The approval rules as a filter: of age and studying or working. A NULL age never matches."""
+    return Q(age__gte=min_age()) & (Q(studies=True) | Q(works=True))
+
+
+def pending_users():
+    return User.objects.filter(is_superuser=False, is_approved=False, is_active=True)
+
+
+def summary() -> dict:
+    """Counts of the pending users by outcome of the rules, in one query."""
+    return pending_users().aggregate(
+        total=Count('pk'),
+        eligible=Count('pk', filter=eligible_q()),
+        age_missing=Count('pk', filter=Q(age__isnull=True)),
+        under_age=Count('pk', filter=Q(age__lt=min_age())),
+        no_occupation=Count('pk', filter=Q(age__gte=min_age(), studies=False, works=False)),
+    )
+
+
+def ineligible_users():
+    """The pending users that fail the rules, annotated with the first failing `reason` (a REASONS label)."""
+    return pending_users().exclude(eligible_q()).annotate(reason=Case(
+        When(age__isnull=True, then=Value(REASONS['age_missing'])),
+        When(age__lt=min_age(), then=Value(REASONS['under_age'])),
+        default=Value(REASONS['no_occupation']),
+        output_field=CharField(),
+    ))
+
+
+def approve(users=None, limit=None, *, actor=None, source=AuditEntry.SOURCE_BATCH) -> int:
+    """
+    Approves the users of `users` (all pending users by default) that pass the rules,
+    at most `limit` (APPROVAL_BATCH_LIMIT) of them, oldest signups first: one UPDATE,
+    plus one INSERT that queues their approval emails in the same transaction.
+    The approvals are audited as made by the user id `actor` through `source`.
+    Returns the number of approved users.
+
+    queryset.update() skips the pre_save/post_save signals, so neither the re-fetch of
+    capture_old_is_approved nor the synchronous email of notify_on_user_approved runs.
+    """
+    users = pending_users() if users is None else users
+    limit = limit or getattr(settings, 'APPROVAL_BATCH_LIMIT', 5000)
+    with transaction.atomic():
+        rows = list(
+            users.filter(eligible_q(), is_approved=False, is_active=True)
+            .select_for_update()
+            .order_by('date_joined', 'pk')
+            .values_list('pk', 'email', 'first_name', 'username')[:limit]
+        )
+        ids = [pk for pk, *_ in rows]
+        if not ids:
+            return 0
+        User.objects.filter(pk__in=ids).update(is_approved=True, approved_at=timezone.now())
+        queue_templated_emails(
+            **APPROVAL_EMAIL,
+            recipients=[(email, {'recipient_name': first_name or username}) for _, email, first_name, username in rows],
+        )
+        audit.record(AuditEntry.TARGET_USER, [(pk, 'pending') for pk in ids], 'approved', actor=actor, source=source)
+    invalidate_cached_users(ids)
+    return len(ids)
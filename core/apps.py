@@ -12,3 +12,24 @@ class CoreConfig(AppConfig):
     def ready(self):
         from . import signals  # we avoid cyclic imports during startup and
                                # make sure that the models and app registry are initialized;
+        from django.db.backends.signals import connection_created
+        from .db import configure_sqlite_connection
+
+        connection_created.connect(
+            configure_sqlite_connection,
+            dispatch_uid="core.configure_sqlite_connection",
+        )
+
+        # the queries of every connection, in any thread, count for the current request
+        from django.conf import settings
+        from .request_stats import instrument_connection
+
+        if getattr(settings, 'REQUEST_TIMING_ENABLE', False):
+            connection_created.connect(instrument_connection, dispatch_uid="core.instrument_connection")
+
+        # last_login is written by core.auth.update_last_login instead (throttled, no signals)
+        from django.contrib.auth.signals import user_logged_in
+        from .auth import update_last_login
+
+        user_logged_in.disconnect(dispatch_uid="update_last_login")
+        user_logged_in.connect(update_last_login, dispatch_uid="core.update_last_login")
@@ -0,0 +1,137 @@
+import struct
+from contextvars import ContextVar
+from datetime import datetime, time, timezone as dt_timezone
+from django.db import transaction
+from django.utils import timezone
+
+from .models import AuditArchive, AuditEntry
+
+# the codes of AuditEntry.STATE_CHOICES
+STATES = {'pending': 1, 'approved': 2, 'rejected': 3, 'waitlisted': 4, 'deleted': 5}
+
+# entries of the request handled in the current thread/task (set by AuditMiddleware)
+_pending = ContextVar('audit_pending', default=None)
+
+# an archived entry: target id, epoch seconds, actor id (0 = none), source, old and new value
+_PACKED = struct.Struct('<IIIBBB')
+# targets archived together: most have a handful of entries in all, so a row per target
+# would cost more than its entries
+ARCHIVE_BUCKET = 256
+
+
+def membership(user) -> str:
+    return 'approved' if user.is_approved else 'pending'
+
+
+def record(target_type, changes, new, *, actor=None, source) -> None:
+    """
+    Logs that the targets of `changes`, (target id, old state) pairs, are now in
+    state `new` (STATES keys). The entries are kept only if the current transaction
+    commits; during a request they are written together at its end (AuditMiddleware),
+    otherwise right after the commit.
+    """
+    now = timezone.now()
+    entries = [
+        AuditEntry(at=now, actor_id=actor, source=source, target_type=target_type, target_id=target_id,
+                   old_value=STATES[old], new_value=STATES[new])
+        for target_id, old in changes
+    ]
+    if entries:
+        transaction.on_commit(lambda: _committed(entries))
+
+
+def _committed(entries) -> None:
+    pending = _pending.get()
+    if pending is None:
+        write(entries)
+    else:
+        pending.extend(entries)
+
+
+def write(entries) -> None:
+    if entries:
+        AuditEntry.objects.bulk_create(entries)
+
+
+def start_buffer():
+    """Collects the committed entries until end_buffer(token) instead of writing them one by one."""
+    return _pending.set([])
+
+
+def end_buffer(token) -> list:
+    """Stops collecting and returns the collected entries, for write()."""
+    entries = _pending.get()
+    _pending.reset(token)
+    return entries
+
+
+def month_start(month):
+    return timezone.make_aware(datetime.combine(month, time.min))
+
+
+def _next_month(month):
+    return month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1)
+
+
+def archive(before) -> int:
+    """
+    Moves the entries of the months before `before` (an aware datetime at the start
+    of a local month) into AuditArchive, one row per bucket of targets and month, and
+    returns how many were moved. Entries of an already archived month are appended.
+    """
+    moved = 0
+    old = AuditEntry.objects.filter(at__lt=before)
+    while (first := old.order_by('at').values_list('at', flat=True).first()) is not None:
+        month = timezone.localdate(first).replace(day=1)
+        moved += _archive_month(month, min(month_start(_next_month(month)), before))
+    return moved
+
+
+def _archive_month(month, end) -> int:
+    entries = AuditEntry.objects.filter(at__gte=month_start(month), at__lt=end)
+    packed, counts = {}, {}
+    with transaction.atomic():
+        rows = (
+            entries.order_by('target_type', 'target_id', 'at', 'pk')
+            .values_list('target_type', 'target_id', 'at', 'actor_id', 'source', 'old_value', 'new_value')
+        )
+        for target_type, target_id, at, actor_id, source, old_value, new_value in rows.iterator(chunk_size=5000):
+            key = (target_type, target_id // ARCHIVE_BUCKET)
+            packed.setdefault(key, bytearray()).extend(
+                _PACKED.pack(target_id, int(at.timestamp()), actor_id or 0, source, old_value, new_value)
+            )
+            counts[key] = counts.get(key, 0) + 1
+
+        # only when entries of an archived month turn up again, e.g. after a change of AUDIT_HOT_DAYS
+        archived = AuditArchive.objects.filter(month=month)
+        for row in archived:
+            key = (row.target_type, row.bucket)
+            if key in packed:
+                row.entries = bytes(row.entries) + packed.pop(key)
+                row.count += counts[key]
+                row.save(update_fields=['entries', 'count'])
+        AuditArchive.objects.bulk_create([
+            AuditArchive(target_type=target_type, bucket=bucket, month=month,
+                         entries=bytes(data), count=counts[target_type, bucket])
+            for (target_type, bucket), data in packed.items()
+        ], batch_size=500)
+        deleted, _ = entries.delete()
+    return deleted
+
+
+def history(target_type, target_id) -> list:
+    """
+    All entries of one target, oldest first: the archived ones (as unsaved AuditEntry
+    objects, with second precision) and the recent ones, by two index lookups.
+    """
+    result = []
+    archives = AuditArchive.objects.filter(target_type=target_type, bucket=target_id // ARCHIVE_BUCKET)
+    for data in archives.order_by('month').values_list('entries', flat=True):
+        for entry_target, ts, actor_id, source, old_value, new_value in _PACKED.iter_unpack(bytes(data)):
+            if entry_target == target_id:
+                result.append(AuditEntry(
+                    at=datetime.fromtimestamp(ts, dt_timezone.utc), actor_id=actor_id or None, source=source,
+                    target_type=target_type, target_id=target_id, old_value=old_value, new_value=new_value,
+                ))
+    result.extend(AuditEntry.objects.filter(target_type=target_type, target_id=target_id).order_by('at', 'pk'))
+    return result
@@ -0,0 +1,64 @@
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.utils import timezone
+
+
+def _version_key(user_id) -> str:
+    return f"auth:user:{user_id}:version"
+
+
+def invalidate_cached_user(user_id) -> None:
+    """
+    Moves the user to a new cache version. A request that read the user from the
+    DB before the change can only write it under the old, unreachable version.
+    """
+    cache.set(_version_key(user_id), uuid.uuid4().hex, None)
+
+
+def invalidate_cached_users(user_ids) -> None:
+    """For queryset.update() paths, which send no post_save."""
+    cache.set_many({_version_key(user_id): uuid.uuid4().hex for user_id in user_ids}, None)
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend whose get_user (run by AuthenticationMiddleware on every request)
+    is served from the cache. The user is loaded together with the questionnaire,
+    so the QuestionnaireRequiredMiddleware check needs no query either.
+    Saving the user or the questionnaire invalidates the entry (core.signals).
+    """
+    def get_user(self, user_id):
+        version = cache.get(_version_key(user_id))
+        if version is None:
+            version = uuid.uuid4().hex
+            if not cache.add(_version_key(user_id), version, None):
+                version = cache.get(_version_key(user_id))
+        key = f"auth:user:{user_id}:{version}"
+
+        user = cache.get(key)
+        if user is None:
+            UserModel = get_user_model()
+            try:
+                user = UserModel._default_manager.select_related('questionnaire').get(pk=user_id)
+            except UserModel.DoesNotExist:
+                return None
+            cache.set(key, user, getattr(settings, 'AUTH_USER_CACHE_TTL', 300))
+        return user if self.user_can_authenticate(user) else None
+
+
+def update_last_login(sender, user, **kwargs):
+    """
+    Replaces django.contrib.auth.models.update_last_login: writes last_login with a
+    plain UPDATE (no pre_save re-fetch, no post_save) and skips the write if the stored
+    value is less than LAST_LOGIN_RESOLUTION seconds old.
+    """
+    now = timezone.now()
+    resolution = timedelta(seconds=getattr(settings, 'LAST_LOGIN_RESOLUTION', 3600))
+    if user.last_login and now - user.last_login < resolution:
+        return
+    user.last_login = now
+    type(user)._default_manager.filter(pk=user.pk).update(last_login=now)
@@ -0,0 +1,127 @@
+import re
+import secrets
+import struct
+import zlib
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:  # optional: without it every client gets gzip
+    brotli = None
+
+# text formats are worth it; images, fonts and the zip-based xlsx export are compressed already
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml', 'image/svg+xml')
+# an open SSE stream has to reach the browser event by event, not once a deflate block is full
+NEVER_COMPRESS_TYPES = ('text/event-stream',)
+
+_QVALUE = re.compile(r'\bq\s*=\s*([0-9.]+)')
+
+
+def is_compressible(response):
+    if response.has_header('Content-Encoding') or 'no-transform' in response.get('Cache-Control', ''):
+        return False
+    content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES) and not content_type.startswith(NEVER_COMPRESS_TYPES)
+
+
+def accepted_encodings(header):
+    """'gzip;q=0.5, br' -> {'gzip': 0.5, 'br': 1.0}"""
+    codings = {}
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        match = _QVALUE.search(params)
+        try:
+            codings[coding] = float(match.group(1)) if match else 1.0
+        except ValueError:
+            codings[coding] = 0.0
+    return codings
+
+
+def negotiate(header, sensitive=False):
+    """
+    The coding for a client sending this Accept-Encoding: 'br', 'gzip' or None.
+    Brotli wins a tie. Sensitive responses only get gzip, whose length can be masked.
+    """
+    codings = accepted_encodings(header)
+    default = codings.get('*', 0.0)
+    options = ['gzip'] if sensitive or brotli is None else ['br', 'gzip']
+    best = max(options, key=lambda coding: codings.get(coding, default))
+    return best if codings.get(best, default) > 0 else None
+
+
+class GzipEncoder:
+    """
+    Incremental gzip. With mask_bytes the header gets a file name of random length
+    (0 to mask_bytes - 1 bytes), so the size of a response no longer tells how well a
+    secret in it compressed together with attacker-controlled text (BREACH). This is
+    the length masking Django's GZipMiddleware does.
+    """
+    def __init__(self, level=6, mask_bytes=0):
+        self._deflate = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self._crc = 0
+        self._size = 0
+        flags, name = 0, b''
+        if mask_bytes:
+            flags, name = 0x08, b'a' * secrets.randbelow(mask_bytes) + b'\x00'  # FNAME
+        # magic, deflate, flags, mtime 0, no extra flags, unknown OS
+        self._header = b'\x1f\x8b\x08' + bytes([flags]) + b'\x00\x00\x00\x00\x00\xff' + name
+
+    def compress(self, data):
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        out, self._header = self._header + self._deflate.compress(data), b''
+        return out
+
+    def flush(self):
+        """Everything compressed so far, ending on a byte boundary (Z_SYNC_FLUSH)."""
+        out, self._header = self._header + self._deflate.flush(zlib.Z_SYNC_FLUSH), b''
+        return out
+
+    def finish(self):
+        return self._header + self._deflate.flush() + struct.pack('<II', self._crc, self._size & 0xffffffff)
+
+
+class BrotliEncoder:
+    def __init__(self, quality=4):
+        self._compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+def encoder_for(coding, sensitive=False):
+    if coding == 'br':
+        return BrotliEncoder(getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 4))
+    return GzipEncoder(
+        getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6),
+        getattr(settings, 'COMPRESSION_MASK_BYTES', 100) if sensitive else 0,
+    )
+
+
+def compress(data, encoder):
+    return encoder.compress(data) + encoder.finish()
+
+
+# Streamed chunks are flushed one by one, like Django's compress_sequence: otherwise deflate
+# holds them back until a block is full and a streaming export would not start downloading.
+def compress_chunks(chunks, encoder):
+    for chunk in chunks:
+        if chunk:
+            yield encoder.compress(chunk) + encoder.flush()
+    yield encoder.finish()
+
+
+async def acompress_chunks(chunks, encoder):
+    async for chunk in chunks:
+        if chunk:
+            yield encoder.compress(chunk) + encoder.flush()
+    yield encoder.finish()
@@ -0,0 +1,63 @@
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+
+REPLICA_ALIAS = 'replica'
+
+# set by core.middleware.ReplicaRoutingMiddleware for the duration of a read-only view
+use_replica = ContextVar('use_replica', default=False)
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """
+    Applies settings.SQLITE_PRAGMAS to every new SQLite connection.
+    WAL lets readers and one writer work in parallel. The busy timeout, which makes
+    concurrent writers wait instead of failing with "database is locked", comes
+    from OPTIONS['timeout'] of the database, not from here.
+    """
+    if connection.vendor != 'sqlite':
+        return
+
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if not pragmas:
+        return
+
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value};')
+
+
+def close_stale_connections():
+    """
+    django.db.close_old_connections for code running outside of a request (jobs, the
+    live counters thread), except that it never closes a connection inside a transaction,
+    e.g. when a job is called directly from a TestCase.
+    """
+    for conn in connections.all(initialized_only=True):
+        if not conn.in_atomic_block:
+            conn.close_if_unusable_or_obsolete()
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+class PrimaryReplicaRouter:
+    """
+    All writes go to 'default'. Reads go to 'replica' only while
+    use_replica is set, i.e. inside a view from settings.DB_REPLICA_VIEWS.
+    """
+    def db_for_read(self, model, **hints):
+        if use_replica.get() and replica_configured():
+            return REPLICA_ALIAS
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica holds the same data, so objects from both aliases can be related
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
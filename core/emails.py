@@ -1,7 +1,32 @@
-from typing import Mapping
+import logging
+from typing import Iterable, Mapping
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import F
 from django.template.loader import render_to_string
+from .models import QueuedEmail
+
+logger = logging.getLogger(__name__)
+
+
+def build_templated_email(*, subject, to, txt_template, html_template, context) -> EmailMultiAlternatives:
+    """The text + HTML message of send_templated_email, unsent."""
+    text_body = render_to_string(txt_template, context)
+    try:
+        html_body = render_to_string(html_template, context)
+    except Exception:
+        html_body = None
+
+    email = EmailMultiAlternatives(
+        subject=subject,
+        body=text_body,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=to,
+    )
+    if html_body:
+        email.attach_alternative(html_body, "text/html")
+    return email
+
 
 def send_templated_email(
     *,
@@ -20,18 +45,65 @@ def send_templated_email(
     if not to:
         return
 
-    text_body = render_to_string(txt_template, context)
-    try:
-        html_body = render_to_string(html_template, context)
-    except Exception:
-        html_body = None
-
-    email = EmailMultiAlternatives(
-        subject=subject,
-        body=text_body,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        to=to,
+    email = build_templated_email(
+        subject=subject, to=to, txt_template=txt_template, html_template=html_template, context=context,
     )
-    if html_body:
-        email.attach_alternative(html_body, "text/html")
     email.send(fail_silently=fail_silently)
+
+
+def queue_templated_emails(
+    *,
+    subject: str,
+    txt_template: str,
+    html_template: str,
+    recipients: Iterable[tuple[str, Mapping]],
+) -> int:
+    """
+    Queues one email per (address, context) with a single INSERT; the
+    send_queued_emails job renders and sends them. Called inside the transaction
+    that causes them, the emails are queued if and only if it commits.
+    """
+    queued = QueuedEmail.objects.bulk_create([
+        QueuedEmail(
+            to=address, subject=subject, txt_template=txt_template,
+            html_template=html_template, context=dict(context),
+        )
+        for address, context in recipients if address
+    ])
+    return len(queued)
+
+
+def send_queued_emails(limit: int | None = None) -> int:
+    """
+    Sends the oldest queued emails over one connection and deletes them. A failed
+    email stays queued for the next call, up to EMAIL_QUEUE_MAX_ATTEMPTS attempts.
+    Returns the number of emails sent.
+    """
+    limit = limit or getattr(settings, 'EMAIL_QUEUE_BATCH', 200)
+    batch = list(QueuedEmail.objects.order_by('id')[:limit])
+    if not batch:
+        return 0
+
+    sent, failed = [], []
+    with get_connection() as connection:
+        for item in batch:
+            try:
+                email = build_templated_email(
+                    subject=item.subject, to=[item.to], txt_template=item.txt_template,
+                    html_template=item.html_template, context=item.context,
+                )
+                email.connection = connection
+                email.send()
+                sent.append(item.pk)
+            except Exception:
+                logger.warning("Queued email %s to %s failed.", item.pk, item.to, exc_info=True)
+                failed.append(item.pk)
+
+    QueuedEmail.objects.filter(pk__in=sent).delete()
+    if failed:
+        last_attempt = getattr(settings, 'EMAIL_QUEUE_MAX_ATTEMPTS', 5) - 1
+        dropped, _ = QueuedEmail.objects.filter(pk__in=failed, attempts__gte=last_attempt).delete()
+        if dropped:
+            logger.error("Dropped %d queued emails after %d attempts.", dropped, last_attempt + 1)
+        QueuedEmail.objects.filter(pk__in=failed).update(attempts=F('attempts') + 1)
+    return len(sent)
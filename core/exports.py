@@ -0,0 +1,252 @@
+import csv
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+# rows fetched from the DB per round trip and rows written per chunk sent to the browser
+CHUNK_SIZE = 2000
+FLUSH_EVERY = 500
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+REGISTRATION_HEADER = [
+    'Събитие', 'Дата на събитието', 'Град', 'Потребител', 'Имейл', 'Име',
+    'Дете', 'Възраст на детето', 'Статус', 'Подадена на',
+]
+
+MEMBER_HEADER = [
+    'Потребител', 'Имейл', 'Име', 'Фамилия', 'Възраст', 'Град', 'Одобрен', 'Регистриран на',
+    'Пълно име', 'Град (въпросник)', 'Пътува до София', 'Има деца', 'Събития с деца',
+    'Интереси', 'За мен', 'Защо се присъединява', 'Откъде научи', 'Instagram', 'TikTok', 'LinkedIn',
+]
+
+# text cells starting with these are run as formulas by Excel (CSV injection)
+_FORMULA_START = ('=', '+', '-', '@', '\t', '\r')
+
+# characters that are not allowed in XML 1.0
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _dt(value):
+    return timezone.localtime(value).strftime('%Y-%m-%d %H:%M') if value else ''
+
+
+def _yes_no(value):
+    return 'Да' if value else 'Не'
+
+
+def registration_rows(queryset):
+    # plain tuples: building three model instances per row costs more than the query itself
+    statuses = dict(queryset.model.STATUS_CHOICES)
+    regs = queryset.order_by('event__date_time', 'event_id', 'created_at').values_list(
+        'event__title', 'event__date_time', 'event__city', 'user__username', 'user__email',
+        'full_name', 'child_name', 'child_age', 'status', 'created_at',
+    )
+    for title, date_time, city, username, email, full_name, child_name, child_age, status, created_at in (
+        regs.iterator(chunk_size=CHUNK_SIZE)
+    ):
+        yield [
+            title, _dt(date_time), city, username, email, full_name,
+            child_name or '', child_age, statuses.get(status, status), _dt(created_at),
+        ]
+
+
+def member_rows(queryset):
+    # prefetch_related works together with iterator() once chunk_size is given:
+    # the interests are fetched with one query per chunk
+    users = (
+        queryset
+        .select_related('questionnaire')
+        .prefetch_related('questionnaire__interests')
+        .order_by('id')
+    )
+    for user in users.iterator(chunk_size=CHUNK_SIZE):
+        q = getattr(user, 'questionnaire', None)
+        row = [
+            user.username, user.email, user.first_name, user.last_name, user.age, user.city,
+            _yes_no(user.is_approved), _dt(user.date_joined),
+        ]
+        if q is None:
+            row += [''] * (len(MEMBER_HEADER) - len(row))
+        else:
+            row += [
+                q.full_name, q.city, _yes_no(q.can_travel_to_sofia), _yes_no(q.has_children),
+                _yes_no(q.wants_events_with_children),
+                ', '.join(i.name for i in q.interests.all()),
+                q.about, q.why_join, q.how_did_you_hear, q.instagram or '', q.tiktok or '', q.linkedin or '',
+            ]
+        yield row
+
+
+def _csv_cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, str) and value.startswith(_FORMULA_START):
+        # member-controlled text: a leading ' makes Excel show it as plain text
+        return "'" + value
+    return value
+
+
+def stream_csv(header, rows):
+    """CSV with a BOM, so Excel opens the Cyrillic text as UTF-8."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(header)
+
+    def drain():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    # the header goes out before the first query runs
+    yield drain()
+    for n, row in enumerate(rows, 1):
+        writer.writerow([_csv_cell(value) for value in row])
+        if n % FLUSH_EVERY == 0:
+            yield drain()
+    yield drain()
+
+
+class _ChunkBuffer:
+    """Write-only file for zipfile; the bytes are taken out with drain() and sent."""
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Export" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _xlsx_row(values):
+    cells = []
+    for value in values:
+        if value is None or value == '':
+            cells.append('<c/>')
+        elif isinstance(value, int) and not isinstance(value, bool):
+            cells.append(f'<c t="n"><v>{value}</v></c>')
+        else:
+            text = escape(_XML_ILLEGAL.sub('', str(value)))
+            cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+    return f'<row>{"".join(cells)}</row>'
+
+
+def stream_xlsx(header, rows):
+    """
+    Minimal XLSX (one sheet, inline strings) written straight into a zip stream:
+    the sheet is compressed as the rows come, so nothing is kept in memory but
+    the current chunk. The zip uses data descriptors, so it needs no seeking.
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, content in _XLSX_PARTS.items():
+            zf.writestr(name, content)
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(_xlsx_row(header).encode())
+            yield buffer.drain()
+
+            for n, row in enumerate(rows, 1):
+                sheet.write(_xlsx_row(row).encode())
+                if n % FLUSH_EVERY == 0:
+                    chunk = buffer.drain()
+                    if chunk:
+                        yield chunk
+            sheet.write(b'</sheetData></worksheet>')
+    yield buffer.drain()
+
+
+async def _astream(chunks):
+    """
+    The chunks of a sync export generator for an ASGI response. Django would read a sync
+    iterator to the end with list() before sending anything; here each chunk (FLUSH_EVERY
+    rows, fetched CHUNK_SIZE at a time) is produced in the request's sync thread, where
+    the database connection of the iterator lives, and sent as soon as it is ready.
+    """
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    try:
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            yield chunk
+    finally:
+        # closes the DB cursor too when the client goes away mid-download
+        await sync_to_async(chunks.close, thread_sensitive=True)()
+
+
+def export_response(basename, header, rows, fmt='csv', request=None):
+    stream = stream_xlsx if fmt == 'xlsx' else stream_csv
+    content = stream(header, rows)
+    if isinstance(request, ASGIRequest):
+        content = _astream(content)
+    response = StreamingHttpResponse(content, content_type=FORMATS[fmt])
+    filename = f"{basename}-{timezone.localdate():%Y-%m-%d}.{fmt}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def registrations_response(queryset, fmt='csv', request=None):
+    return export_response('registrations', REGISTRATION_HEADER, registration_rows(queryset), fmt, request)
+
+
+def members_response(queryset=None, fmt='csv', request=None):
+    if queryset is None:
+        queryset = get_user_model().objects.filter(is_superuser=False)
+    return export_response('members', MEMBER_HEADER, member_rows(queryset), fmt, request)
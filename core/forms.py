@@ -1,7 +1,29 @@
 from django import forms
+from django.core.cache import cache
 from .models import Questionnaire, Interest, NotificationSettings
 from django.contrib.auth import get_user_model
 
+INTEREST_CHOICES_CACHE_KEY = "core:interest_choices"
+# upper bound of staleness in other processes; this process invalidates on every change
+INTEREST_CHOICES_TTL = 10 * 60
+
+
+def interest_choices():
+    """
+    (id, name) of all interests for the checkbox lists, cached. Rendering the
+    questionnaire form then needs no query for the choices.
+    """
+    choices = cache.get(INTEREST_CHOICES_CACHE_KEY)
+    if choices is None:
+        choices = list(Interest.objects.order_by('id').values_list('id', 'name'))
+        cache.set(INTEREST_CHOICES_CACHE_KEY, choices, INTEREST_CHOICES_TTL)
+    return choices
+
+
+def invalidate_interest_choices():
+    cache.delete(INTEREST_CHOICES_CACHE_KEY)
+
+
 class CustomUserRegistrationForm(forms.Form):
     """
     User self-registration form (without directly creating the model).
@@ -100,6 +122,8 @@ class UserQuestionnaireForm(forms.ModelForm):
         Sets initial values
         """
         super().__init__(*args, **kwargs)
+        # the queryset is still used to validate a submitted form
+        self.fields['interests'].choices = interest_choices()
 
         inst = self.instance if getattr(self.instance, 'pk', None) else None
 
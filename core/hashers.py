@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, ScryptPasswordHasher
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    """
+    scrypt with the cost from settings.PASSWORD_SCRYPT (work_factor, block_size,
+    parallelism). The algorithm name stays "scrypt", so hashes made with other
+    parameters still verify and are rehashed with the current ones on login.
+    """
+    def __init__(self):
+        params = getattr(settings, 'PASSWORD_SCRYPT', {})
+        self.work_factor = params.get('work_factor', self.work_factor)
+        self.block_size = params.get('block_size', self.block_size)
+        self.parallelism = params.get('parallelism', self.parallelism)
+        # hashlib refuses anything above 32 MiB unless maxmem is given; scrypt needs 128 * r * n bytes
+        self.maxmem = max(self.maxmem, 2 * 128 * self.block_size * self.work_factor)
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """
+    Argon2id with the cost from settings.PASSWORD_ARGON2 (time_cost, memory_cost
+    in KiB, parallelism). Needs argon2-cffi, which is only imported on first use.
+    """
+    def __init__(self):
+        params = getattr(settings, 'PASSWORD_ARGON2', {})
+        self.time_cost = params.get('time_cost', self.time_cost)
+        self.memory_cost = params.get('memory_cost', self.memory_cost)
+        self.parallelism = params.get('parallelism', self.parallelism)
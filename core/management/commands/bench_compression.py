@@ -0,0 +1,84 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from core import compression
+
+User = get_user_model()
+
+# body sizes the largest page is cut (or repeated) to, in bytes
+SIZES = (512, 4 * 1024, 32 * 1024, 256 * 1024, 2 * 1024 * 1024)
+
+
+class Command(BaseCommand):
+    help = (
+        "Мери компресията на отговорите: колко байта спестяват gzip (нива 1/6/9, с и без "
+        "маскиране на дължината) и brotli (ако е инсталиран) на реалните страници и на тела "
+        "с различен размер, и колко процесорно време струва това на отговор."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=20, help="Компресирания на тяло")
+        parser.add_argument("--admin", help="Администратор (по подразбиране първият superuser)")
+
+    def handle(self, *args, **opts):
+        qs = User.objects.filter(username=opts["admin"]) if opts["admin"] else User.objects.filter(is_superuser=True)
+        admin = qs.order_by("id").first()
+        if admin is None:
+            raise CommandError("Няма администратор. Пуснете seed_synthetic.")
+
+        client = Client()
+        client.force_login(admin)
+        setup_test_environment()
+        try:
+            pages = {
+                "admin_panel": client.get(reverse("admin_panel")),
+                "admin_event_registrations": client.get(reverse("admin_event_registrations")),
+                "all_events": client.get(reverse("all_events")),
+                "export_registrations.csv": client.get(reverse("export_registrations")),
+            }
+        finally:
+            teardown_test_environment()
+        bodies = {
+            name: b"".join(r.streaming_content) if r.streaming else r.content
+            for name, r in pages.items()
+        }
+
+        largest = max(bodies.values(), key=len)
+        for size in SIZES:
+            bodies[f"{size // 1024 or size} {'KiB' if size >= 1024 else 'B'}"] = (
+                largest * (size // len(largest) + 1)
+            )[:size]
+
+        codecs = {
+            "gzip-1": lambda: compression.GzipEncoder(1),
+            "gzip-6": lambda: compression.GzipEncoder(6),
+            "gzip-9": lambda: compression.GzipEncoder(9),
+            "gzip-6 masked": lambda: compression.GzipEncoder(6, mask_bytes=100),
+        }
+        if compression.brotli is not None:
+            for quality in (1, 4, 6, 11):
+                codecs[f"br-{quality}"] = lambda quality=quality: compression.BrotliEncoder(quality)
+        else:
+            self.stdout.write(self.style.WARNING("brotli не е инсталиран: мери се само gzip"))
+
+        self.stdout.write(
+            f"{'тяло':28}{'размер':>10}  {'кодек':14}{'изход':>10}{'спестено':>10}{'ms':>9}{'MB/s':>8}"
+        )
+        for name, body in bodies.items():
+            for codec, make in codecs.items():
+                timings = []
+                for _ in range(opts["repeat"]):
+                    start = time.perf_counter()
+                    out = compression.compress(body, make())
+                    timings.append(time.perf_counter() - start)
+                p50 = statistics.median(timings)
+                self.stdout.write(
+                    f"{name:28}{len(body):>10}  {codec:14}{len(out):>10}"
+                    f"{100 * (1 - len(out) / len(body)):>9.1f}%{p50 * 1000:>9.2f}{len(body) / p50 / 1e6:>8.0f}"
+                )
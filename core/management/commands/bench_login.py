@@ -0,0 +1,103 @@
+import importlib.util
+import os
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+User = get_user_model()
+
+PROFILES = {
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'core.hashers.TunedScryptPasswordHasher',
+    'argon2': 'core.hashers.TunedArgon2PasswordHasher',
+    'md5': 'django.contrib.auth.hashers.MD5PasswordHasher',
+}
+PASSWORD = "Bench-login-Pa55word"
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Мери цената на хеширането на пароли за всеки профил (pbkdf2, scrypt, argon2): "
+        "време за хеш при регистрация и за authenticate() при вход, и колко входа в секунда "
+        "поема едно ядро. Помага да се оразмерят web worker-ите. Нищо не остава в базата."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profiles", default="pbkdf2,scrypt,argon2", help="Профили, разделени със запетая")
+        parser.add_argument("--repeat", type=int, default=10, help="Входове на профил")
+        parser.add_argument("--scrypt", action="append", default=[], metavar="N,R,P",
+                            help="Допълнителни scrypt параметри за сравнение, напр. 32768,8,1 (може няколко пъти)")
+
+    def handle(self, *args, **opts):
+        configs = []
+        for profile in opts["profiles"].split(","):
+            profile = profile.strip()
+            if profile not in PROFILES:
+                raise CommandError(f"Непознат профил: {profile}")
+            if profile == "argon2" and importlib.util.find_spec("argon2") is None:
+                self.stdout.write(self.style.WARNING("argon2: пропуснат, argon2-cffi не е инсталиран"))
+                continue
+            configs.append((profile, PROFILES[profile], {}))
+        for spec in opts["scrypt"]:
+            try:
+                n, r, p = (int(part) for part in spec.split(","))
+            except ValueError:
+                raise CommandError(f"Очаква се N,R,P, а не {spec}")
+            configs.append((f"scrypt {n},{r},{p}", PROFILES["scrypt"],
+                            {"PASSWORD_SCRYPT": {"work_factor": n, "block_size": r, "parallelism": p}}))
+
+        cores = os.cpu_count() or 1
+        self.stdout.write(
+            f"ядра: {cores}, текущ профил: {settings.PASSWORD_HASHING_PROFILE}, "
+            f"scrypt: {settings.PASSWORD_SCRYPT}"
+        )
+        for name, hasher, extra in configs:
+            with override_settings(PASSWORD_HASHERS=[hasher], **extra):
+                r = self._measure(opts["repeat"])
+            self.stdout.write(
+                f"{name:22} hash={r['hash_ms']:7.1f} ms  login p50={r['p50_ms']:7.1f} ms  "
+                f"p95={r['p95_ms']:7.1f} ms  входа/s на ядро={r['per_core']:6.1f}  "
+                f"при {cores} ядра={r['per_core'] * cores:7.1f}"
+            )
+
+    def _measure(self, repeat):
+        # the hash a registration computes once
+        start = time.perf_counter()
+        encoded = make_password(PASSWORD)
+        hash_ms = (time.perf_counter() - start) * 1000
+
+        timings = []
+        request = RequestFactory().post("/login/")
+        try:
+            with transaction.atomic():
+                User.objects.create(username="bench-login-user", password=encoded, is_approved=True)
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    user = authenticate(request, username="bench-login-user", password=PASSWORD)
+                    timings.append((time.perf_counter() - start) * 1000)
+                    if user is None:
+                        raise CommandError(f"authenticate() се провали с {get_hasher().algorithm}")
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        timings.sort()
+        p50 = statistics.median(timings)
+        return {
+            "hash_ms": hash_ms,
+            "p50_ms": p50,
+            "p95_ms": timings[max(0, int(round(0.95 * len(timings))) - 1)],
+            # one login keeps one core busy for its whole duration: the hash is pure CPU
+            "per_core": 1000 / p50 if p50 else 0.0,
+        }
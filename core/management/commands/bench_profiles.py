@@ -0,0 +1,126 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from django.utils import timezone
+
+from events.models import Event
+
+User = get_user_model()
+
+PROFILES = ("development", "production")
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнява профилите на настройките (DEPLOY_PROFILE=development/production): "
+        "време за рендериране на ключовите шаблони (първо и повторно) и ръст на паметта, "
+        "когато код извън заявка (напр. нишката на APScheduler) пуска много заявки към базата. "
+        "Всеки профил се пуска в отделен процес; за production преди това се пуска collectstatic "
+        "във временна директория."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profiles", default=",".join(PROFILES), help="Профили, разделени със запетая")
+        parser.add_argument("--repeat", type=int, default=200, help="Рендерирания на шаблон")
+        parser.add_argument("--queries", type=int, default=5000, help="Заявки към базата за теста за памет")
+        parser.add_argument("--single", action="store_true", help="Мери само текущия процес и печата JSON")
+
+    def handle(self, *args, **opts):
+        if opts["single"]:
+            self.stdout.write(json.dumps(self._measure(opts["repeat"], opts["queries"])))
+            return
+
+        results = {}
+        for profile in opts["profiles"].split(","):
+            if profile not in PROFILES:
+                raise CommandError(f"Непознат профил: {profile}")
+            results[profile] = self._run_profile(profile, opts)
+
+        self.stdout.write(f"{'':34}" + "".join(f"{profile:>16}" for profile in results))
+        rows = [
+            ("DEBUG", "debug", "{}"),
+            ("заявки в connection.queries", "queries_logged", "{}"),
+            ("ръст на паметта (KiB)", "memory_growth_kib", "{:.0f}"),
+        ]
+        for name in next(iter(results.values()))["templates"]:
+            rows.append((f"{name} първо (ms)", ("templates", name, "first_ms"), "{:.2f}"))
+            rows.append((f"{name} p50 (ms)", ("templates", name, "p50_ms"), "{:.3f}"))
+        for label, key, fmt in rows:
+            cells = []
+            for result in results.values():
+                value = result
+                for part in (key if isinstance(key, tuple) else (key,)):
+                    value = value[part]
+                cells.append(fmt.format(value))
+            self.stdout.write(f"{label:34}" + "".join(f"{cell:>16}" for cell in cells))
+
+    def _run_profile(self, profile, opts):
+        manage = os.path.join(settings.BASE_DIR, "manage.py")
+        with tempfile.TemporaryDirectory() as static_root:
+            env = dict(os.environ, DEPLOY_PROFILE=profile, STATIC_ROOT=static_root)
+            env.pop("DEBUG", None)
+            if profile == "production":
+                env.setdefault("SECRET_KEY", "bench-profiles-" + "x" * 50)
+                env.setdefault("ALLOWED_HOSTS", "localhost")
+                subprocess.run(
+                    [sys.executable, manage, "collectstatic", "--noinput", "-v", "0"], env=env, check=True
+                )
+            out = subprocess.run(
+                [sys.executable, manage, "bench_profiles", "--single",
+                 "--repeat", str(opts["repeat"]), "--queries", str(opts["queries"])],
+                env=env, check=True, capture_output=True, text=True,
+            ).stdout
+        return json.loads(out.strip().splitlines()[-1])
+
+    def _measure(self, repeat, queries):
+        events = list(Event.objects.filter(date_time__gte=timezone.now()).select_related("series").order_by("date_time")[:50])
+        if not events:
+            raise CommandError("Няма предстоящи събития. Пуснете seed_synthetic.")
+        request = RequestFactory().get("/")
+        request.user = User.objects.filter(is_superuser=False).first() or AnonymousUser()
+
+        pages = {
+            "home.html": {},
+            "events/all_events.html": {"events": events},
+            "events/event_detail.html": {
+                "event": events[0], "interests": [], "free_spots": 1,
+                "existing_registration": None, "waitlist_position": None, "is_past": False,
+            },
+        }
+        templates = {}
+        for name, context in pages.items():
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                render_to_string(name, context, request=request)
+                timings.append((time.perf_counter() - start) * 1000)
+            templates[name] = {"first_ms": timings[0], "p50_ms": statistics.median(timings[1:] or timings)}
+
+        # code outside the request cycle (the scheduler thread) never gets reset_queries()
+        reset_queries()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for n in range(queries):
+            Event.objects.filter(pk=events[n % len(events)].pk).values_list("title", flat=True).first()
+        growth = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+
+        return {
+            "debug": settings.DEBUG,
+            "queries_logged": len(connection.queries_log),
+            "memory_growth_kib": growth / 1024,
+            "templates": templates,
+        }
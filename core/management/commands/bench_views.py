@@ -0,0 +1,113 @@
+import json
+import subprocess
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from events.jobs import send_event_reminders_job
+from events.metrics import percentile
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Мери ключовите входни точки (all_events, recommended_events, admin_panel, "
+        "admin_event_registrations, my_profile, send_event_reminders_job) през test client-а "
+        "и записва брой заявки към базата и p50/p95 в JSON за сравнение между commit-и."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=20, help="Повторения на всяка входна точка")
+        parser.add_argument("--member", help="Потребител за членските страници (по подразбиране първият одобрен с въпросник)")
+        parser.add_argument("--admin", help="Администратор (по подразбиране първият superuser)")
+        parser.add_argument("--output", default="bench_views.json", help="JSON файл с резултатите")
+        parser.add_argument("--compare", help="JSON от предишно пускане, спрямо което да се покажат разликите")
+
+    def handle(self, *args, **opts):
+        member = self._pick_user(opts["member"], is_superuser=False, is_approved=True, questionnaire__isnull=False)
+        admin = self._pick_user(opts["admin"], is_superuser=True)
+
+        member_client, admin_client = Client(), Client()
+        member_client.force_login(member)
+        admin_client.force_login(admin)
+
+        entry_points = {
+            "all_events": lambda: member_client.get(reverse("all_events")),
+            "recommended_events": lambda: member_client.get(reverse("recommended_events")),
+            "my_profile": lambda: member_client.get(reverse("my_profile")),
+            "admin_panel": lambda: admin_client.get(reverse("admin_panel")),
+            "admin_event_registrations": lambda: admin_client.get(reverse("admin_event_registrations")),
+            # bypass the lease, otherwise every call after the first is skipped
+            "send_event_reminders_job": send_event_reminders_job.__wrapped__,
+        }
+
+        results = {}
+        setup_test_environment()
+        try:
+            for name, call in entry_points.items():
+                results[name] = self._measure(call, opts["repeat"])
+                r = results[name]
+                self.stdout.write(
+                    f"{name:28} queries={r['queries']:5}  p50={r['p50_ms']:8.1f} ms  p95={r['p95_ms']:8.1f} ms"
+                )
+        finally:
+            teardown_test_environment()
+
+        report = {"commit": self._git_commit(), "repeat": opts["repeat"], "results": results}
+        with open(opts["output"], "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(f"Записано в {opts['output']}"))
+
+        if opts["compare"]:
+            self._compare(opts["compare"], results)
+
+    def _pick_user(self, username, **filters):
+        qs = User.objects.filter(username=username) if username else User.objects.filter(**filters)
+        user = qs.order_by("id").first()
+        if user is None:
+            raise CommandError(f"Няма подходящ потребител ({username or filters}). Пуснете seed_synthetic.")
+        return user
+
+    def _measure(self, call, repeat):
+        call()  # warm-up: caches, lazy imports, connection
+        timings = []
+        with CaptureQueriesContext(connection) as ctx:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                response = call()
+                timings.append((time.perf_counter() - start) * 1000)
+                if response is not None and response.status_code >= 400:
+                    raise CommandError(f"HTTP {response.status_code}")
+        timings.sort()
+        return {
+            "queries": len(ctx.captured_queries) // repeat,
+            "p50_ms": round(percentile(timings, 50), 2),
+            "p95_ms": round(percentile(timings, 95), 2),
+        }
+
+    def _git_commit(self):
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def _compare(self, path, results):
+        with open(path, encoding="utf-8") as fh:
+            previous = json.load(fh)
+        self.stdout.write(f"Сравнение с {previous.get('commit') or path}:")
+        for name, now in results.items():
+            before = previous["results"].get(name)
+            if not before:
+                continue
+            self.stdout.write(
+                f"{name:28} queries {before['queries']:5} -> {now['queries']:5}  "
+                f"p95 {before['p95_ms']:8.1f} -> {now['p95_ms']:8.1f} ms"
+            )
@@ -0,0 +1,197 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.forms import invalidate_interest_choices
+from core.models import Interest, NotificationSettings, Questionnaire
+from events.models import Event, EventRegistration
+
+User = get_user_model()
+
+USER_PREFIX = "synthetic_"
+EVENT_PREFIX = "[synthetic] "
+
+INTEREST_NAMES = [
+    "Изкуство", "Спорт", "Готвене", "Йога", "Книги",
+    "Фотография", "Пътувания", "Музика", "Бизнес", "Танци",
+]
+CITIES = ["София", "Пловдив", "Варна", "Бургас", "Русе", "Стара Загора"]
+CHANNELS = ["instagram", "tiktok", "facebook", "youtube", "friend", "google"]
+STATUSES = ["approved"] * 7 + ["pending"] * 2 + ["rejected"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Създава синтетични данни за натоварващи тестове (по подразбиране 100k потребители "
+        "с въпросници, 50k събития и 1M заявки) с bulk_create на партиди."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100_000)
+        parser.add_argument("--events", type=int, default=50_000)
+        parser.add_argument("--registrations", type=int, default=1_000_000)
+        parser.add_argument("--batch-size", type=int, default=5_000)
+        parser.add_argument("--seed", type=int, default=42, help="Seed за възпроизводими данни")
+        parser.add_argument("--flush", action="store_true", help="Само изтрива синтетичните данни")
+
+    def handle(self, *args, **opts):
+        self.batch_size = opts["batch_size"]
+        self.rng = random.Random(opts["seed"])
+
+        self._flush()
+        if opts["flush"]:
+            self.stdout.write(self.style.SUCCESS("Синтетичните данни са изтрити."))
+            return
+
+        interest_ids = self._ensure_interests()
+        user_ids = self._create_users(opts["users"], interest_ids)
+        event_ids = self._create_events(opts["events"], interest_ids)
+        self._create_registrations(opts["registrations"], user_ids, event_ids)
+        self.stdout.write(self.style.SUCCESS("Готово."))
+
+    def _batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield range(start, min(start + self.batch_size, total))
+
+    def _flush(self):
+        # one plain DELETE instead of QuerySet.delete(): that sends post_delete per row and the
+        # waitlist promotion behind it would cost queries per registration, while the synthetic
+        # registrations only ever belong to synthetic events, which are deleted right after
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {connection.ops.quote_name(EventRegistration._meta.db_table)} "
+                f"WHERE user_id IN (SELECT id FROM {connection.ops.quote_name(User._meta.db_table)} "
+                f"WHERE username LIKE %s)",
+                [USER_PREFIX + "%"],
+            )
+        Event.objects.filter(title__startswith=EVENT_PREFIX).delete()
+        User.objects.filter(username__startswith=USER_PREFIX).delete()
+
+    def _ensure_interests(self):
+        existing = set(Interest.objects.filter(name__in=INTEREST_NAMES).values_list("name", flat=True))
+        Interest.objects.bulk_create([Interest(name=n) for n in INTEREST_NAMES if n not in existing])
+        invalidate_interest_choices()
+        return list(Interest.objects.values_list("id", flat=True))
+
+    def _create_users(self, total, interest_ids):
+        rng = self.rng
+        joined = timezone.now() - timedelta(days=365)
+        QInterest = Questionnaire.interests.through
+
+        for batch in self._batches(total):
+            with transaction.atomic():
+                users = User.objects.bulk_create([
+                    User(
+                        username=f"{USER_PREFIX}{i}",
+                        email=f"{USER_PREFIX}{i}@example.com",
+                        password="!",  # unusable, these accounts never log in with a password
+                        first_name=f"Име{i}",
+                        last_name=f"Фамилия{i}",
+                        age=rng.randint(18, 65),
+                        city=rng.choice(CITIES),
+                        studies=rng.random() < 0.3,
+                        works=rng.random() < 0.8,
+                        is_approved=rng.random() < 0.9,
+                        date_joined=joined + timedelta(minutes=i),
+                    )
+                    for i in batch
+                ])
+                NotificationSettings.objects.bulk_create([NotificationSettings(user=u) for u in users])
+                questionnaires = Questionnaire.objects.bulk_create([
+                    Questionnaire(
+                        user=u,
+                        full_name=f"{u.first_name} {u.last_name}",
+                        city=u.city,
+                        can_travel_to_sofia=rng.random() < 0.5,
+                        about="",
+                        has_children=(has_children := rng.random() < 0.4),
+                        wants_events_with_children=has_children and rng.random() < 0.5,
+                        why_join="",
+                        how_did_you_hear=rng.choice(CHANNELS),
+                        completed=True,
+                    )
+                    for u in users
+                ])
+                QInterest.objects.bulk_create([
+                    QInterest(questionnaire_id=q.id, interest_id=interest_id)
+                    for q in questionnaires
+                    for interest_id in rng.sample(interest_ids, rng.randint(1, 3))
+                ])
+            self.stdout.write(f"Потребители: {batch.stop}/{total}")
+
+        return list(
+            User.objects.filter(username__startswith=USER_PREFIX).order_by("id").values_list("id", flat=True)
+        )
+
+    def _create_events(self, total, interest_ids):
+        rng = self.rng
+        now = timezone.now()
+        EInterest = Event.interests.through
+
+        for batch in self._batches(total):
+            with transaction.atomic():
+                events = Event.objects.bulk_create([
+                    Event(
+                        title=f"{EVENT_PREFIX}Събитие #{i}",
+                        description="Синтетично събитие за натоварващи тестове.",
+                        date_time=now + timedelta(minutes=rng.randint(-180 * 24 * 60, 180 * 24 * 60)),
+                        city=rng.choice(CITIES),
+                        location_details="Център",
+                        is_kid_friendly=rng.random() < 0.2,
+                        capacity=rng.choice([10, 20, 30, 50, 100]),
+                        price=rng.choice([0, 10, 25, 40]),
+                    )
+                    for i in batch
+                ])
+                EInterest.objects.bulk_create([
+                    EInterest(event_id=e.id, interest_id=interest_id)
+                    for e in events
+                    for interest_id in rng.sample(interest_ids, rng.randint(1, 2))
+                ])
+            self.stdout.write(f"Събития: {batch.stop}/{total}")
+
+        return list(
+            Event.objects.filter(title__startswith=EVENT_PREFIX).order_by("id").values_list("id", flat=True)
+        )
+
+    def _create_registrations(self, total, user_ids, event_ids):
+        """
+        Every user gets total/len(users) registrations for consecutive events from a random offset,
+        which keeps (event, user) unique without remembering the pairs already used.
+        """
+        if not user_ids or not event_ids:
+            return
+        rng = self.rng
+        per_user, extra = divmod(total, len(user_ids))
+        per_user = min(per_user, len(event_ids))
+
+        def rows():
+            for n, user_id in enumerate(user_ids):
+                count = min(per_user + (1 if n < extra else 0), len(event_ids))
+                offset = rng.randrange(len(event_ids))
+                for j in range(count):
+                    yield EventRegistration(
+                        user_id=user_id,
+                        event_id=event_ids[(offset + j) % len(event_ids)],
+                        full_name=f"Синтетична {user_id}",
+                        status=rng.choice(STATUSES),
+                    )
+
+        created = 0
+        batch = []
+        for reg in rows():
+            batch.append(reg)
+            if len(batch) >= self.batch_size:
+                EventRegistration.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+                if created % (self.batch_size * 20) == 0:
+                    self.stdout.write(f"Заявки: {created}/{total}")
+        if batch:
+            EventRegistration.objects.bulk_create(batch)
+            created += len(batch)
+        self.stdout.write(f"Заявки: {created}/{total}")
@@ -1,32 +1,283 @@
+import logging
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
 from django.shortcuts import redirect
 from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+
+from . import audit, compression, request_stats
+from .db import use_replica, replica_configured
+
+logger = logging.getLogger(__name__)
 
 class QuestionnaireRequiredMiddleware:
     """
     Middleware that ensures that each logged-in user has completed the questionnaire 
     before accessing the rest of the site.
     """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
-    def __call__(self, request):
-        user = request.user
-
-        if not user.is_authenticated:
-            return self.get_response(request)
-
-        if user.is_superuser:
-            return self.get_response(request)
+    def _is_exempt(self, request, user):
+        if not user.is_authenticated or user.is_superuser:
+            return True
 
         # We miss some specific paths
         allowed_paths = [
             reverse('logout'),
             reverse('questionnaire'),
         ]
-        if request.path in allowed_paths or request.path.startswith('/admin/'):
+        return request.path in allowed_paths or request.path.startswith('/admin/')
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        user = request.user
+
+        if self._is_exempt(request, user):
             return self.get_response(request)
 
         if not hasattr(user, 'questionnaire'):
             return redirect('questionnaire')
 
-        return self.get_response(request)
\ No newline at end of file
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        # The user is loaded once, without blocking the event loop. request.user is then
+        # a plain object, so the views and templates after this never query it synchronously.
+        user = request.user = await request.auser()
+
+        if self._is_exempt(request, user):
+            return await self.get_response(request)
+
+        field = user._meta.get_field('questionnaire')
+        if field.is_cached(user):
+            has_questionnaire = hasattr(user, 'questionnaire')
+        else:
+            has_questionnaire = await field.related_model.objects.filter(user=user).aexists()
+        if not has_questionnaire:
+            return redirect('questionnaire')
+
+        return await self.get_response(request)
+
+
+class RequestTimingMiddleware:
+    """
+    Opt-in (settings.REQUEST_TIMING_ENABLE) per-request instrumentation.
+    Counts queries, DB time, template render time and total latency per URL name,
+    adds them as a Server-Timing header and keeps per-process histograms
+    (core.request_stats.snapshot, served at /admin-panel/request-stats/).
+    Views listed in settings.QUERY_BUDGETS may not run more queries than their budget:
+    with QUERY_BUDGET_STRICT (on in tests) the request fails, otherwise a warning is logged.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_TIMING_ENABLE', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        request_stats.instrument_templates()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timing = request_stats.RequestTiming()
+        token = request_stats.current_timing.set(timing)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_stats.current_timing.reset(token)
+        return self._finish(request, response, timing, start)
+
+    async def __acall__(self, request):
+        # The ORM calls of async views run in a worker thread with a copy of this context;
+        # the wrapper of that thread's connections (request_stats.instrument_connection)
+        # finds current_timing there.
+        timing = request_stats.RequestTiming()
+        token = request_stats.current_timing.set(timing)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_stats.current_timing.reset(token)
+        return self._finish(request, response, timing, start)
+
+    def _finish(self, request, response, timing, start):
+        total_ms = (time.perf_counter() - start) * 1000
+
+        match = request.resolver_match
+        url_name = match.view_name if match else 'unresolved'
+        request_stats.record(url_name, timing, total_ms)
+
+        response['Server-Timing'] = (
+            f'db;dur={timing.db_ms:.1f};desc="{timing.queries} queries", '
+            f'tpl;dur={timing.template_ms:.1f}, '
+            f'total;dur={total_ms:.1f}'
+        )
+
+        budget = getattr(settings, 'QUERY_BUDGETS', {}).get(url_name)
+        if budget is not None and timing.queries > budget:
+            message = f"{url_name} ran {timing.queries} queries, budget is {budget}"
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise request_stats.QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Routes GET requests to the views in settings.DB_REPLICA_VIEWS to the read replica.
+    After a POST (e.g. event registration) the client gets a short-lived cookie
+    and reads from the primary until it expires, so it always sees its own writes.
+    """
+    cookie_name = 'db_primary_pin'
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = use_replica.set(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            use_replica.reset(token)
+        return self._pin_after_write(request, response)
+
+    async def __acall__(self, request):
+        token = use_replica.set(False)
+        try:
+            response = await self.get_response(request)
+        finally:
+            use_replica.reset(token)
+        return self._pin_after_write(request, response)
+
+    def _pin_after_write(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and replica_configured():
+            response.set_cookie(
+                self.cookie_name, '1',
+                max_age=settings.DB_REPLICA_STICKY_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        if request.COOKIES.get(self.cookie_name):
+            return None
+        if request.resolver_match.url_name in settings.DB_REPLICA_VIEWS:
+            use_replica.set(True)
+        return None
+
+
+class AuditMiddleware:
+    """
+    Collects the audit entries (core.audit) committed while handling a request and
+    writes them with one bulk INSERT at its end, instead of one INSERT per change.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = audit.start_buffer()
+        try:
+            return self.get_response(request)
+        finally:
+            # the changes are committed, so their entries are written even if the response failed
+            audit.write(audit.end_buffer(token))
+
+    async def __acall__(self, request):
+        token = audit.start_buffer()
+        try:
+            return await self.get_response(request)
+        finally:
+            await sync_to_async(audit.write)(audit.end_buffer(token))
+
+
+class CompressionMiddleware:
+    """
+    Compresses text responses with brotli (if installed) or gzip, whichever the client
+    prefers. Streaming responses such as the CSV exports are compressed chunk by chunk.
+    Media, responses that are already encoded, the SSE streams and bodies smaller than
+    COMPRESSION_MIN_SIZE are passed through.
+
+    A response that sets the CSRF cookie has a CSRF token in its body. Against BREACH
+    it only gets gzip with a length-masking header (core.compression.GzipEncoder).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'COMPRESSION_ENABLE', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 512)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self._compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self._compress(request, await self.get_response(request))
+
+    def _compress(self, request, response):
+        if not compression.is_compressible(response):
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        # the CSRF middleware only sets the cookie when get_token() ran for this response
+        sensitive = settings.CSRF_COOKIE_NAME in response.cookies
+        coding = compression.negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''), sensitive)
+        if coding is None:
+            return response
+
+        encoder = compression.encoder_for(coding, sensitive)
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = compression.acompress_chunks(response.streaming_content, encoder)
+            else:
+                response.streaming_content = compression.compress_chunks(response.streaming_content, encoder)
+            response.headers.pop('Content-Length', None)
+        else:
+            content = compression.compress(response.content, encoder)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        # the compressed body is a different representation (RFC 9110 8.8.1)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = coding
+        return response
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.15 on 2026-10-18 23:31
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_approved_at(apps, schema_editor):
+    # the real approval time was never stored; the signup time is the closest known
+    CustomUser = apps.get_model("core", "CustomUser")
+    CustomUser.objects.filter(is_approved=True).update(approved_at=F("date_joined"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0007_queuedemail"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="approved_at",
+            field=models.DateTimeField(
+                blank=True,
+                db_index=True,
+                editable=False,
+                null=True,
+                verbose_name="Одобрен на",
+            ),
+        ),
+        migrations.AddField(
+            model_name="questionnaire",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.RunPython(backfill_approved_at, migrations.RunPython.noop),
+    ]
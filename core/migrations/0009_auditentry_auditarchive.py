@@ -0,0 +1,127 @@
+# Generated by Django 5.1.15 on 2026-10-18 23:37
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0008_approved_at_questionnaire_updated_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AuditArchive",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "target_type",
+                    models.PositiveSmallIntegerField(
+                        choices=[(1, "Потребител"), (2, "Заявка за събитие")]
+                    ),
+                ),
+                ("bucket", models.PositiveIntegerField()),
+                ("month", models.DateField()),
+                ("entries", models.BinaryField()),
+                ("count", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "Архив на одита",
+                "verbose_name_plural": "Архиви на одита",
+                "unique_together": {("target_type", "bucket", "month")},
+            },
+        ),
+        migrations.CreateModel(
+            name="AuditEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "at",
+                    models.DateTimeField(
+                        db_index=True,
+                        default=django.utils.timezone.now,
+                        verbose_name="Време",
+                    ),
+                ),
+                (
+                    "actor_id",
+                    models.PositiveIntegerField(
+                        blank=True, null=True, verbose_name="Извършено от"
+                    ),
+                ),
+                (
+                    "source",
+                    models.PositiveSmallIntegerField(
+                        choices=[
+                            (1, "Административен панел"),
+                            (2, "Django admin"),
+                            (3, "Групово одобрение"),
+                            (4, "Автоматично одобрение"),
+                        ],
+                        verbose_name="Източник",
+                    ),
+                ),
+                (
+                    "target_type",
+                    models.PositiveSmallIntegerField(
+                        choices=[(1, "Потребител"), (2, "Заявка за събитие")],
+                        verbose_name="Обект",
+                    ),
+                ),
+                ("target_id", models.PositiveIntegerField(verbose_name="ID на обекта")),
+                (
+                    "old_value",
+                    models.PositiveSmallIntegerField(
+                        choices=[
+                            (1, "Очаква одобрение"),
+                            (2, "Одобрено"),
+                            (3, "Отказано"),
+                            (4, "В листата на чакащите"),
+                            (5, "Изтрит"),
+                        ],
+                        verbose_name="Преди",
+                    ),
+                ),
+                (
+                    "new_value",
+                    models.PositiveSmallIntegerField(
+                        choices=[
+                            (1, "Очаква одобрение"),
+                            (2, "Одобрено"),
+                            (3, "Отказано"),
+                            (4, "В листата на чакащите"),
+                            (5, "Изтрит"),
+                        ],
+                        verbose_name="След",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Запис в одита",
+                "verbose_name_plural": "Одит на промените",
+                "indexes": [
+                    models.Index(
+                        fields=["target_type", "target_id"],
+                        name="core_audite_target__f1cadb_idx",
+                    )
+                ],
+            },
+        ),
+    ]
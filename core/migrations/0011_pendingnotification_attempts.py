@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 23:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_pendingnotification"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pendingnotification",
+            name="attempts",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
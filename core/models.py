@@ -3,6 +3,7 @@ from django.db import models
 from django.conf import settings
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from django.utils import timezone
 
 class Interest(models.Model):
     name = models.CharField(max_length=100)
@@ -30,6 +31,8 @@ class Questionnaire(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     friend_name = models.CharField(max_length=255, blank=True, null=True)
     completed = models.BooleanField(default=False)
+    # the analytics rollups (events.analytics) pick up the questionnaires changed since their last run
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"Въпросник – {self.user.username}"
@@ -51,6 +54,7 @@ class CustomUser(AbstractUser):
     about = models.TextField(blank=True, null=True, verbose_name='Информация за Вас')
 
     is_approved = models.BooleanField(default=False, verbose_name='Одобрен ли е потребителят')
+    approved_at = models.DateTimeField(null=True, blank=True, editable=False, db_index=True, verbose_name='Одобрен на')
     avatar = models.ImageField(
         upload_to='avatars/',
         blank=True,
@@ -104,3 +108,110 @@ def create_default_notifications(sender, instance, created, **kwargs):
     """
     if created:
         NotificationSettings.objects.create(user=instance)
+
+
+class QueuedEmail(models.Model):
+    """
+    A templated email waiting for the send_queued_emails job. Bulk operations queue
+    their emails here instead of sending them one by one inside the request.
+    """
+    to = models.EmailField()
+    subject = models.CharField(max_length=255)
+    txt_template = models.CharField(max_length=255)
+    html_template = models.CharField(max_length=255)
+    context = models.JSONField(default=dict)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.subject} → {self.to}'
+
+
+class PendingNotification(models.Model):
+    """
+    A notification in its recipient's coalescing window (core.notifications): when the
+    window ends, everything pending for the user goes out as one email.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    kind = models.CharField(max_length=30)
+    event = models.ForeignKey('events.Event', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    context = models.JSONField(default=dict, blank=True)
+    send_after = models.DateTimeField(db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.kind} → {self.user_id}'
+
+
+class AuditEntry(models.Model):
+    """
+    One membership or event registration state change: who made it, on what, from
+    which value to which. Append-only and written through core.audit; everything is a
+    small integer code and the targets are plain ids, so an entry outlives a deleted
+    user or registration.
+    """
+    TARGET_USER = 1
+    TARGET_REGISTRATION = 2
+    TARGET_CHOICES = [
+        (TARGET_USER, 'Потребител'),
+        (TARGET_REGISTRATION, 'Заявка за събитие'),
+    ]
+    # the membership (pending/approved/deleted) and the registration status share the codes
+    STATE_CHOICES = [
+        (1, 'Очаква одобрение'),
+        (2, 'Одобрено'),
+        (3, 'Отказано'),
+        (4, 'В листата на чакащите'),
+        (5, 'Изтрит'),
+    ]
+    SOURCE_PANEL = 1
+    SOURCE_ADMIN = 2
+    SOURCE_BATCH = 3
+    SOURCE_AUTO = 4
+    SOURCE_CHOICES = [
+        (SOURCE_PANEL, 'Административен панел'),
+        (SOURCE_ADMIN, 'Django admin'),
+        (SOURCE_BATCH, 'Групово одобрение'),
+        (SOURCE_AUTO, 'Автоматично одобрение'),
+    ]
+
+    at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='Време')
+    # None for the scheduled jobs
+    actor_id = models.PositiveIntegerField(null=True, blank=True, verbose_name='Извършено от')
+    source = models.PositiveSmallIntegerField(choices=SOURCE_CHOICES, verbose_name='Източник')
+    target_type = models.PositiveSmallIntegerField(choices=TARGET_CHOICES, verbose_name='Обект')
+    target_id = models.PositiveIntegerField(verbose_name='ID на обекта')
+    old_value = models.PositiveSmallIntegerField(choices=STATE_CHOICES, verbose_name='Преди')
+    new_value = models.PositiveSmallIntegerField(choices=STATE_CHOICES, verbose_name='След')
+
+    class Meta:
+        indexes = [models.Index(fields=['target_type', 'target_id'])]
+        verbose_name = 'Запис в одита'
+        verbose_name_plural = 'Одит на промените'
+
+    def __str__(self):
+        return (f'{self.get_target_type_display()} {self.target_id}: '
+                f'{self.get_old_value_display()} → {self.get_new_value_display()}')
+
+
+class AuditArchive(models.Model):
+    """
+    The audit entries of one month for a bucket of targets (core.audit.ARCHIVE_BUCKET
+    consecutive ids), moved out of AuditEntry by archive_audit_log_job and packed into
+    fixed-size records by core.audit; core.audit.history unpacks them.
+    """
+    target_type = models.PositiveSmallIntegerField(choices=AuditEntry.TARGET_CHOICES)
+    bucket = models.PositiveIntegerField()
+    month = models.DateField()
+    entries = models.BinaryField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # the lookups by target use the index of this constraint
+        unique_together = ('target_type', 'bucket', 'month')
+        verbose_name = 'Архив на одита'
+        verbose_name_plural = 'Архиви на одита'
+
+    def __str__(self):
+        return f'{self.get_target_type_display()} #{self.bucket}, {self.month:%m.%Y}: {self.count}'
@@ -0,0 +1,180 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db.models import F, Min
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .emails import build_templated_email
+from .models import NotificationSettings, PendingNotification
+
+logger = logging.getLogger(__name__)
+
+# what each kind of notification is sent with; `pref` is the NotificationSettings
+# field that turns it off (None: always sent)
+KINDS = {
+    'event_reminder': {
+        'pref': 'email_event_reminders',
+        'subject': "Напомняне: {event.title} – скоро започва",
+        'template': "email/event_reminder",
+    },
+    'event_approved': {
+        'pref': 'email_event_status_changes',
+        'subject': "Одобрение за участие: {event.title}",
+        'template': "email/status_approved",
+    },
+    'event_rejected': {
+        'pref': 'email_event_status_changes',
+        'subject': "Отказ за участие: {event.title}",
+        'template': "email/status_rejected",
+    },
+    'profile_updated': {
+        'pref': 'email_profile_changes',
+        'subject': "LuxeLadies – Профилът е обновен",
+        'template': "email/profile_updated",
+    },
+    'questionnaire_updated': {
+        'pref': 'email_questionnaire_changes',
+        'subject': "LuxeLadies – Отговорите във въпросника са обновени",
+        'template': "email/questionnaire_updated",
+    },
+    'notifications_updated': {
+        'pref': None,
+        'subject': "LuxeLadies – Настройките за имейл известия са обновени",
+        'template': "email/notifications_updated",
+    },
+}
+
+DIGEST_SUBJECT = "LuxeLadies – {count} нови известия"
+DIGEST_TEMPLATE = "email/notification_digest"
+
+
+def preferences(user_ids) -> dict:
+    """The NotificationSettings of the users, by user id, in one query; the defaults for users without a row."""
+    found = {prefs.user_id: prefs for prefs in NotificationSettings.objects.filter(user_id__in=set(user_ids))}
+    return {user_id: found.get(user_id) or NotificationSettings(user_id=user_id) for user_id in user_ids}
+
+
+def wants(prefs, kind) -> bool:
+    field = KINDS[kind]['pref']
+    return field is None or getattr(prefs, field)
+
+
+def dispatch(notifications, now=None, prefs=None) -> int:
+    """
+    Queues (user, kind, event, context) notifications and returns how many were queued.
+    The kinds the users turned off are dropped here, with one query for all of their
+    preferences. A notification joins the window of its user's pending ones, or opens
+    one of NOTIFICATION_WINDOW_SECONDS; send_due_notifications sends each window as one email.
+    `prefs` (by user id) saves the query when the caller already has the preferences.
+    """
+    notifications = [n for n in notifications if n[0] is not None and n[0].email]
+    if not notifications:
+        return 0
+    now = now or timezone.now()
+    prefs = prefs or preferences({user.pk for user, *_ in notifications})
+    notifications = [n for n in notifications if wants(prefs[n[0].pk], n[1])]
+    if not notifications:
+        return 0
+
+    windows = dict(
+        PendingNotification.objects.filter(user_id__in={user.pk for user, *_ in notifications})
+        .values('user_id').annotate(send_after=Min('send_after')).values_list('user_id', 'send_after')
+    )
+    opens = now + timedelta(seconds=getattr(settings, 'NOTIFICATION_WINDOW_SECONDS', 120))
+    queued = PendingNotification.objects.bulk_create([
+        PendingNotification(user=user, kind=kind, event=event, context=context or {},
+                            send_after=windows.get(user.pk, opens))
+        for user, kind, event, context in notifications
+    ])
+    return len(queued)
+
+
+def notify(user, kind, *, event=None, prefs=None, **context) -> int:
+    return dispatch([(user, kind, event, context)], prefs=prefs and {user.pk: prefs})
+
+
+def _item(notification, prefs, digest):
+    user = notification.user
+    context = {
+        'recipient_name': user.first_name or user.username,
+        'event': notification.event,
+        'prefs': prefs,
+        'digest': digest,
+        **notification.context,
+    }
+    kind = KINDS[notification.kind]
+    return {
+        'subject': kind['subject'].format(event=notification.event),
+        'txt_template': f"{kind['template']}.txt",
+        'html_template': f"{kind['template']}.html",
+        'context': context,
+    }
+
+
+def _email(user, items):
+    if len(items) == 1:
+        return build_templated_email(to=[user.email], **items[0])
+    entries = [
+        {'subject': item['subject'], 'text': render_to_string(item['txt_template'], item['context'])}
+        for item in items
+    ]
+    return build_templated_email(
+        subject=DIGEST_SUBJECT.format(count=len(entries)),
+        to=[user.email],
+        txt_template=f"{DIGEST_TEMPLATE}.txt",
+        html_template=f"{DIGEST_TEMPLATE}.html",
+        context={'recipient_name': user.first_name or user.username, 'items': entries},
+    )
+
+
+def send_due_notifications(now=None, limit=None) -> int:
+    """
+    Sends the notifications of the users whose window has ended, one email per user
+    over one connection: the notification itself, or a digest of all of them.
+    Preferences changed during the window are applied before anything is rendered.
+    Returns the number of emails sent. Like send_queued_emails, a failed email stays
+    pending for the next call, up to EMAIL_QUEUE_MAX_ATTEMPTS attempts.
+    """
+    now = now or timezone.now()
+    limit = limit or getattr(settings, 'EMAIL_QUEUE_BATCH', 200)
+    user_ids = list(
+        PendingNotification.objects.filter(send_after__lte=now)
+        .order_by('user_id').values_list('user_id', flat=True).distinct()[:limit]
+    )
+    if not user_ids:
+        return 0
+    pending = list(
+        PendingNotification.objects.filter(user_id__in=user_ids)
+        .select_related('user', 'event').order_by('created_at', 'pk')
+    )
+    prefs = preferences(user_ids)
+    by_user = {}
+    for notification in pending:
+        if wants(prefs[notification.user_id], notification.kind) and notification.user.email:
+            by_user.setdefault(notification.user_id, []).append(notification)
+
+    sent, failed = 0, []
+    with get_connection() as connection:
+        for user_id, notifications in by_user.items():
+            user = notifications[0].user
+            try:
+                items = [_item(n, prefs[user_id], digest=len(notifications) > 1) for n in notifications]
+                email = _email(user, items)
+                email.connection = connection
+                sent += email.send()
+            except Exception:
+                logger.warning("Notifications for user %s failed.", user_id, exc_info=True)
+                failed.extend(n.pk for n in notifications)
+
+    # the sent ones and the ones the user no longer wants
+    failed_ids = set(failed)
+    PendingNotification.objects.filter(pk__in=[n.pk for n in pending if n.pk not in failed_ids]).delete()
+    if failed:
+        last_attempt = getattr(settings, 'EMAIL_QUEUE_MAX_ATTEMPTS', 5) - 1
+        dropped, _ = PendingNotification.objects.filter(pk__in=failed, attempts__gte=last_attempt).delete()
+        if dropped:
+            logger.error("Dropped %d notifications after %d attempts.", dropped, last_attempt + 1)
+        PendingNotification.objects.filter(pk__in=failed).update(attempts=F('attempts') + 1)
+    return sent
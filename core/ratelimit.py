@@ -0,0 +1,216 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.shortcuts import render
+
+logger = logging.getLogger(__name__)
+
+# the process-local fallback keeps at most this many buckets (least recently used are dropped)
+LOCAL_MAX_BUCKETS = 10_000
+# the lock of a bucket on cache backends without scripting: tries 5 ms apart, seconds held at most
+LOCK_ATTEMPTS = 20
+LOCK_TIMEOUT = 1
+
+
+def parse_rate(rate):
+    """'5/300' -> (5 requests, 300 seconds)."""
+    requests, seconds = rate.split('/')
+    return int(requests), int(seconds)
+
+
+def client_ip(request):
+    # behind a proxy RATELIMIT_IP_HEADER names the header it sets, e.g. HTTP_X_FORWARDED_FOR
+    header = getattr(settings, 'RATELIMIT_IP_HEADER', '')
+    value = request.META.get(header, '') if header else ''
+    return value.split(',')[0].strip() or request.META.get('REMOTE_ADDR', '')
+
+
+def _username(request):
+    return (request.POST.get('username') or '').strip().lower()
+
+
+def _user(request):
+    return str(request.user.pk) if request.user.is_authenticated else ''
+
+
+# what a bucket is kept per
+SCOPES = {
+    'ip': client_ip,
+    'username': _username,
+    'user': _user,
+}
+
+
+def _take(state, now, limit, period):
+    """
+    One token from a bucket of `limit` tokens that refills continuously over `period`
+    seconds. `state` is the bucket's (tokens, updated at), None for a full one.
+    Returns the new state and the seconds until a token is available (0: taken).
+    """
+    tokens, updated = state or (limit, now)
+    tokens = min(limit, tokens + max(0.0, now - updated) * limit / period)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), math.ceil((1 - tokens) * period / limit)
+
+
+class _LocalBuckets:
+    """
+    Token buckets in this process, used when the shared cache is unavailable.
+    Same buckets as in the cache, one (tokens, updated at) pair per key.
+    """
+    def __init__(self):
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, now, limit, period):
+        with self._lock:
+            self._buckets[key], wait = _take(self._buckets.pop(key, None), now, limit, period)
+            if len(self._buckets) > LOCAL_MAX_BUCKETS:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+local_buckets = _LocalBuckets()
+
+
+def _bucket_key(group, scope, ident):
+    digest = hashlib.sha1(ident.encode()).hexdigest()[:16]
+    return f"rl:{group}:{scope}:{digest}"
+
+
+# _take in Redis: all buckets of a request in one atomic call
+_REDIS_TAKE = """
+local now = tonumber(ARGV[1])
+local waits = {}
+for i, key in ipairs(KEYS) do
+    local limit, period = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1])
+    local state = redis.call('HMGET', key, 't', 'u')
+    local tokens = tonumber(state[1]) or limit
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(limit, tokens + math.max(0, now - updated) * limit / period)
+    local wait = 0
+    if tokens >= 1 then tokens = tokens - 1 else wait = math.ceil((1 - tokens) * period / limit) end
+    redis.call('HSET', key, 't', tostring(tokens), 'u', tostring(now))
+    redis.call('EXPIRE', key, math.ceil(period))
+    waits[i] = wait
+end
+return waits
+"""
+
+
+def _take_many(buckets, now):
+    """
+    Takes a token from every (key, limit, period) bucket in the shared cache and returns
+    the waits. On Redis it is one Lua script, i.e. one atomic round trip. Backends that
+    cannot run scripts (memcached, database, locmem) need a short cache.add lock per
+    bucket, then one get_many, one set_many and one delete_many for the locks: 3 + the
+    number of buckets round trips instead of one. A bucket untouched for its period is
+    full again, so the longest period is the TTL.
+    """
+    client = getattr(getattr(cache, '_cache', None), 'get_client', None)
+    if client is not None and hasattr(cache, 'make_and_validate_key'):
+        keys = [cache.make_and_validate_key(key) for key, _, _ in buckets]
+        args = [now] + [value for _, limit, period in buckets for value in (limit, period)]
+        return [int(wait) for wait in client(keys[0], write=True).eval(_REDIS_TAKE, len(keys), *keys, *args)]
+
+    keys = [key for key, _, _ in buckets]
+    held = []
+    try:
+        # always in the same order, so two requests sharing buckets do not wait on each other
+        for lock in sorted(f"{key}:lock" for key in keys):
+            for _ in range(LOCK_ATTEMPTS):
+                if cache.add(lock, 1, LOCK_TIMEOUT):
+                    held.append(lock)
+                    break
+                time.sleep(0.005)
+            else:
+                raise TimeoutError(f"rate limit bucket {lock} stays locked")
+        states = cache.get_many(keys)
+        updated, waits = {}, []
+        for key, limit, period in buckets:
+            updated[key], wait = _take(states.get(key), now, limit, period)
+            waits.append(wait)
+        cache.set_many(updated, math.ceil(max(period for _, _, period in buckets)))
+    finally:
+        if held:
+            cache.delete_many(held)
+    return waits
+
+
+def hit(request, group):
+    """
+    Takes one token from every bucket of `group` (settings.RATELIMITS) for this request.
+    Returns the number of seconds to wait if any bucket is empty, otherwise 0.
+
+    A bucket holds the limit and refills continuously, so no burst goes over it, not
+    even across a window boundary. The buckets live in the shared cache; if the cache
+    is down, every process falls back to its own buckets rather than letting every
+    request through.
+    """
+    now = time.time()
+    buckets = []
+    for scope, rate in getattr(settings, 'RATELIMITS', {}).get(group, {}).items():
+        ident = SCOPES[scope](request)
+        if ident:
+            limit, period = parse_rate(rate)
+            buckets.append((_bucket_key(group, scope, ident), limit, period))
+    if not buckets:
+        return 0
+
+    try:
+        waits = _take_many(buckets, now)
+    except Exception:
+        logger.warning("Rate limit cache unavailable, using process-local buckets.", exc_info=True)
+        waits = [local_buckets.take(key, now, limit, period) for key, limit, period in buckets]
+    return max(waits)
+
+
+def ratelimit(group, methods=('POST',)):
+    """
+    View decorator: requests with one of `methods` go through the buckets of `group`;
+    over the limit the view is not called and the client gets a 429 with Retry-After.
+    """
+    def applies(request):
+        return getattr(settings, 'RATELIMIT_ENABLE', True) and request.method in methods
+
+    def too_many(request, retry_after):
+        response = render(request, '429.html', {'retry_minutes': -(-retry_after // 60)}, status=429)
+        response['Retry-After'] = str(retry_after)
+        return response
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if applies(request):
+                    # the cache client is blocking
+                    retry_after = await sync_to_async(hit)(request, group)
+                    if retry_after:
+                        return too_many(request, retry_after)
+                return await view(request, *args, **kwargs)
+
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if applies(request):
+                retry_after = hit(request, group)
+                if retry_after:
+                    return too_many(request, retry_after)
+            return view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
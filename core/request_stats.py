@@ -0,0 +1,152 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+
+# upper bounds of the histogram buckets; the last bucket is open-ended
+TIME_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# timing of the request handled in the current thread/task (set by RequestTimingMiddleware)
+current_timing = ContextVar('current_timing', default=None)
+
+_lock = threading.Lock()
+_stats = {}
+_templates_instrumented = False
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A view ran more queries than settings.QUERY_BUDGETS allows."""
+
+
+class RequestTiming:
+    """
+    Counters of one request: SQL queries, time spent in the DB and in template rendering.
+    """
+    def __init__(self):
+        self.queries = 0
+        self.db_ms = 0.0
+        self.template_ms = 0.0
+        self._rendering = False
+
+    def sql_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_ms += (time.perf_counter() - start) * 1000
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    """Execute wrapper of every connection: counts the query for the request in current_timing."""
+    timing = current_timing.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    return timing.sql_wrapper(execute, sql, params, many, context)
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """
+    connection_created hook. Async views run their ORM calls through sync_to_async in
+    another thread, on that thread's connections, so the wrapper is on every connection
+    and finds the request through the context (which sync_to_async carries over).
+    First in the list: connection.execute_wrapper() pops the last one on exit.
+    """
+    if sql_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, sql_wrapper)
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'count', 'total')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def percentile(self, pct):
+        """Upper bound of the bucket that holds the pct-th value (None = above the last bound)."""
+        if not self.count:
+            return 0
+        target = pct / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.bounds + (None,), self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return None
+
+    def as_dict(self):
+        labels = [f"le_{b}" for b in self.bounds] + ["inf"]
+        return {
+            'count': self.count,
+            'avg': round(self.total / self.count, 2) if self.count else 0,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+
+def record(url_name, timing, total_ms):
+    with _lock:
+        entry = _stats.get(url_name)
+        if entry is None:
+            entry = _stats[url_name] = {
+                'total_ms': Histogram(TIME_BUCKETS_MS),
+                'db_ms': Histogram(TIME_BUCKETS_MS),
+                'template_ms': Histogram(TIME_BUCKETS_MS),
+                'queries': Histogram(QUERY_BUCKETS),
+            }
+        entry['total_ms'].add(total_ms)
+        entry['db_ms'].add(timing.db_ms)
+        entry['template_ms'].add(timing.template_ms)
+        entry['queries'].add(timing.queries)
+
+
+def snapshot(reset=False):
+    """Histograms of this process per URL name, as a JSON-serializable dict."""
+    with _lock:
+        data = {
+            name: {metric: hist.as_dict() for metric, hist in entry.items()}
+            for name, entry in sorted(_stats.items())
+        }
+        if reset:
+            _stats.clear()
+    return data
+
+
+def instrument_templates():
+    """
+    Wraps the Django template backend's render() once per process, so the time
+    of the top-level render is added to the current request's template_ms.
+    """
+    global _templates_instrumented
+    if _templates_instrumented:
+        return
+    from django.template.backends.django import Template
+
+    original = Template.render
+
+    @wraps(original)
+    def render(self, context=None, request=None):
+        timing = current_timing.get()
+        if timing is None or timing._rendering:
+            return original(self, context, request)
+        timing._rendering = True
+        start = time.perf_counter()
+        try:
+            return original(self, context, request)
+        finally:
+            timing.template_ms += (time.perf_counter() - start) * 1000
+            timing._rendering = False
+
+    Template.render = render
+    _templates_instrumented = True
@@ -1,8 +1,13 @@
-from django.db.models.signals import pre_save, post_save
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
+from .approvals import APPROVAL_EMAIL
+from .auth import invalidate_cached_user
 from .emails import send_templated_email
+from .forms import invalidate_interest_choices
+from .models import Interest, Questionnaire
 
 User = get_user_model()
 
@@ -12,7 +17,8 @@ def capture_old_is_approved(sender, instance: User, **kwargs):
     We store the old is_approved in instance._old_is_approved,
     to detect a change after the save.
     """
-    if not instance.pk:
+    update_fields = kwargs.get('update_fields')
+    if not instance.pk or (update_fields is not None and 'is_approved' not in update_fields):
         instance._old_is_approved = None
         return
     try:
@@ -20,6 +26,8 @@ def capture_old_is_approved(sender, instance: User, **kwargs):
         instance._old_is_approved = old.is_approved
     except sender.DoesNotExist:
         instance._old_is_approved = None
+    if instance._old_is_approved is False and instance.is_approved and update_fields is None:
+        instance.approved_at = timezone.now()
 
 
 @receiver(post_save, sender=User)
@@ -36,10 +44,23 @@ def notify_on_user_approved(sender, instance: User, created, **kwargs):
             ctx = {
                 "recipient_name": instance.first_name or instance.username,
             }
-            send_templated_email(
-                subject="LuxeLadies – Регистрацията е одобрена",
-                to=[instance.email],
-                txt_template="email/user_approved.txt",
-                html_template="email/user_approved.html",
-                context=ctx,
-            )
+            send_templated_email(to=[instance.email], context=ctx, **APPROVAL_EMAIL)
+
+
+@receiver(post_save, sender=Interest)
+@receiver(post_delete, sender=Interest)
+def interests_changed(sender, **kwargs):
+    invalidate_interest_choices()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    invalidate_cached_user(instance.pk)
+
+
+@receiver(post_save, sender=Questionnaire)
+@receiver(post_delete, sender=Questionnaire)
+def questionnaire_changed(sender, instance, **kwargs):
+    # the cached user carries its questionnaire
+    invalidate_cached_user(instance.user_id)
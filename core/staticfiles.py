@@ -0,0 +1,119 @@
+import gzip
+import io
+import os
+import re
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from PIL import Image
+
+try:
+    import brotli
+except ImportError:  # optional: without it only the .gz siblings are written
+    brotli = None
+
+# files that get precompressed siblings, and the size below which compressing is not worth it
+COMPRESSIBLE = ('.css', '.js', '.svg', '.txt', '.json', '.html', '.xml')
+MIN_COMPRESS_SIZE = 256
+
+_COMMENTS = re.compile(r'/\*.*?\*/', re.S)
+_SPACES = re.compile(r'\s+')
+_AROUND_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+
+
+def minify_css(css):
+    """
+    Conservative CSS minifier: drops comments and collapses whitespace. Spaces are only
+    removed around { } ; , > and after ':', never around + and - (calc) or before ':'
+    (":hover" after a descendant combinator means something else than "a:hover").
+    """
+    css = _COMMENTS.sub('', css)
+    css = _SPACES.sub(' ', css)
+    css = _AROUND_PUNCTUATION.sub(r'\1', css)
+    css = css.replace(': ', ':').replace(';}', '}')
+    return css.strip()
+
+
+def bundle_name(name):
+    # next to the sources, so relative url()s inside them keep working
+    return f'css/bundle-{name}.css'
+
+
+def variant_name(path, width, fmt=None):
+    root, ext = os.path.splitext(path)
+    return f'{root}-{width}.{fmt or ext.lstrip(".")}'
+
+
+class BundledManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage with a build step in collectstatic:
+
+    - the CSS bundles of settings.STATIC_BUNDLES are concatenated and minified,
+    - the image variants of settings.STATIC_IMAGE_VARIANTS are resized (and saved
+      as WebP next to the original format),
+    - all of them get content-hashed names and manifest entries like any other file,
+    - every hashed text file gets .gz (and, with the brotli package, .br) siblings,
+      for the web server's gzip_static/brotli_static.
+
+    A hashed name never changes its content, so the web server can send STATIC_URL
+    with Cache-Control: public, max-age=31536000, immutable.
+    """
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            yield from super().post_process(paths, dry_run, **options)
+            return
+
+        built = self._build_bundles() + self._build_image_variants()
+        paths = dict(paths, **{name: (self, name) for name in built})
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                self._compress(hashed_name)
+            yield name, hashed_name, processed
+
+    def _replace(self, name, content):
+        if self.exists(name):
+            self.delete(name)
+        self._save(name, ContentFile(content))
+
+    def _build_bundles(self):
+        names = []
+        for name, sources in getattr(settings, 'STATIC_BUNDLES', {}).items():
+            parts = []
+            for source in sources:
+                with self.open(source) as fh:
+                    parts.append(fh.read().decode('utf-8'))
+            self._replace(bundle_name(name), minify_css('\n'.join(parts)).encode('utf-8'))
+            names.append(bundle_name(name))
+        return names
+
+    def _build_image_variants(self):
+        names = []
+        for path, widths in getattr(settings, 'STATIC_IMAGE_VARIANTS', {}).items():
+            with self.open(path) as fh:
+                original = Image.open(fh)
+                original.load()
+            fmt = original.format
+            for width in widths:
+                image = original.copy()
+                image.thumbnail((width, width * original.height // original.width), Image.LANCZOS)
+                for target, options in ((fmt, {'optimize': True}), ('WEBP', {'quality': 82, 'method': 6})):
+                    buffer = io.BytesIO()
+                    image.save(buffer, target, **options)
+                    name = variant_name(path, width, target.lower() if target == 'WEBP' else None)
+                    self._replace(name, buffer.getvalue())
+                    names.append(name)
+        return names
+
+    def _compress(self, name):
+        if not name.endswith(COMPRESSIBLE):
+            return
+        with self.open(name) as fh:
+            data = fh.read()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return
+        siblings = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            siblings['.br'] = brotli.compress(data, quality=11)
+        for suffix, compressed in siblings.items():
+            if len(compressed) < len(data):
+                self._replace(name + suffix, compressed)
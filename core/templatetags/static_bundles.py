@@ -0,0 +1,40 @@
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+from core.staticfiles import bundle_name, variant_name
+
+register = template.Library()
+
+
+def _bundles_built():
+    # the bundles only exist after collectstatic; in development the sources are linked one by one
+    return getattr(settings, 'STATIC_BUNDLES_ENABLED', False)
+
+
+@register.simple_tag
+def css_bundle(name):
+    """
+    <link> tags for a bundle of settings.STATIC_BUNDLES: one minified file with a
+    content hash in its name (served with a long immutable Cache-Control), or the
+    separate source files when the bundles are not built.
+    """
+    if _bundles_built():
+        return format_html('<link rel="stylesheet" href="{}">', static(bundle_name(name)))
+    return format_html_join(
+        '\n', '<link rel="stylesheet" href="{}">', ((static(source),) for source in settings.STATIC_BUNDLES[name])
+    )
+
+
+@register.simple_tag
+def static_picture(path, width, alt='', css_class=''):
+    """
+    <img> of a static image. With the build, the variant of settings.STATIC_IMAGE_VARIANTS
+    that is `width` px wide, preferably as WebP; otherwise the original file.
+    """
+    if not (_bundles_built() and width in settings.STATIC_IMAGE_VARIANTS.get(path, ())):
+        return format_html('<img src="{}" alt="{}" class="{}">', static(path), alt, css_class)
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}"><img src="{}" alt="{}" class="{}"></picture>',
+        static(variant_name(path, width, 'webp')), static(variant_name(path, width)), alt, css_class,
+    )
@@ -5,18 +5,43 @@ unittests for:
 - Profile: data update, avatar, notifications, future/past events separation.
 - Emails: template helper, HTML alternative, status change alerts.
 """
+import csv
+import gzip
+import importlib
+import io
+import os
+import re
+import tempfile
+import zipfile
+import zlib
 from datetime import timedelta
+from unittest.mock import Mock, patch
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
 from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.template import Context, Template
 from django.template.exceptions import TemplateDoesNotExist
-from django.test import TestCase, Client, override_settings
-from django.urls import reverse
+from django.test import TestCase, Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, resolve, reverse
 from django.utils import timezone
-from core.emails import send_templated_email
+from core import approvals, audit, compression, exports, notifications, ratelimit, request_stats
+from core.db import PrimaryReplicaRouter
+from core.emails import send_queued_emails, send_templated_email
 from core.forms import CustomUserRegistrationForm
-from core.models import NotificationSettings, Questionnaire
-from events.models import Event, EventRegistration
+from core.middleware import ReplicaRoutingMiddleware
+from core.request_stats import QueryBudgetExceeded
+from core.staticfiles import minify_css
+from core.models import AuditArchive, AuditEntry, Interest, NotificationSettings, PendingNotification, Questionnaire, QueuedEmail
+from events.jobs import auto_approve_members_job
+from events.models import Event, EventRegistration, JobRun, JobRunDaily
+import luxeladies.urls
+from PIL import Image
 
 User = get_user_model()
 
@@ -189,6 +214,11 @@ class AdminPanelTests(_RespAssertsMixin, TestCase):
         self.assertFalse(User.objects.filter(id=u3.id).exists())
 
 
+def deliver_notifications():
+    """Sends the pending notifications as if their window had ended."""
+    return notifications.send_due_notifications(now=timezone.now() + timedelta(hours=1))
+
+
 def make_min_questionnaire(user):
     return Questionnaire.objects.create(
         user=user,
@@ -242,6 +272,7 @@ class MyProfileTests(_RespAssertsMixin, TestCase):
         }
         r = self.client.post(reverse("my_profile"), data=data)
         self.assertEqual(r.status_code, 302)
+        deliver_notifications()
         self.assertEqual(len(mail.outbox), 1)
 
     def test_update_profile_no_email_if_disabled(self):
@@ -253,6 +284,7 @@ class MyProfileTests(_RespAssertsMixin, TestCase):
         data = {"form": "profile", "first_name": "X", "last_name": "Y", "username": "puser", "email": "puser@example.com"}
         r = self.client.post(reverse("my_profile"), data=data)
         self.assertEqual(r.status_code, 302)
+        deliver_notifications()
         self.assertEqual(len(mail.outbox), 0)
 
 
@@ -269,6 +301,7 @@ class MyProfileTests(_RespAssertsMixin, TestCase):
         }
         r = self.client.post(reverse("my_profile"), data=data)
         self.assertEqual(r.status_code, 302)
+        deliver_notifications()
         self.assertEqual(len(mail.outbox), 1)
 
     def test_profile_lists_future_and_past_events(self):
@@ -289,6 +322,50 @@ class MyProfileTests(_RespAssertsMixin, TestCase):
         self.assertIn("Past A", pst)
 
 
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class MyProfileQueryCountTests(TestCase):
+    """
+    Read path of my_profile: the view's two queries (user + questionnaire + prefs,
+    approved registrations) and the selected interests of the questionnaire form.
+    Session, user and the middleware's questionnaire check come from the cache
+    (AUTH_FAST_PATH), and so do the interest choices.
+    """
+    PROFILE_GET_QUERIES = 3
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="qc", email="qc@example.com", password="x", is_approved=True, age=30)
+        make_min_questionnaire(self.user).interests.add(Interest.objects.create(name="Йога"))
+        self.client.login(username="qc", password="x")
+        self.client.get(reverse("my_profile"))  # fills the interest choices cache
+
+    def _register(self, days):
+        ev = Event.objects.create(
+            title=f"Ev {days}", city="Sofia", location_details="Center",
+            date_time=timezone.now() + timedelta(days=days), price=0, capacity=10,
+        )
+        EventRegistration.objects.create(user=self.user, event=ev, status="approved", full_name="QC")
+
+    def test_query_count_does_not_depend_on_registrations(self):
+        with self.assertNumQueries(self.PROFILE_GET_QUERIES):
+            self.client.get(reverse("my_profile"))
+        for days in (-30, -2, 3, 10, 40):
+            self._register(days)
+        with self.assertNumQueries(self.PROFILE_GET_QUERIES):
+            r = self.client.get(reverse("my_profile"))
+        self.assertEqual([e.title for e in r.context["approved_events"]], ["Ev 3", "Ev 10", "Ev 40"])
+        self.assertEqual([e.title for e in r.context["past_events"]], ["Ev -2", "Ev -30"])
+
+    def test_new_interest_invalidates_cached_choices(self):
+        Interest.objects.create(name="Танци")
+        r = self.client.get(reverse("my_profile"))
+        self.assertContains(r, "Танци")
+
+    def test_missing_settings_are_not_created_on_get(self):
+        NotificationSettings.objects.filter(user=self.user).delete()
+        self.assertEqual(self.client.get(reverse("my_profile")).status_code, 200)
+        self.assertFalse(NotificationSettings.objects.filter(user=self.user).exists())
+
+
 @override_settings(APSCHEDULER_ENABLE=False)
 class EventRegistrationAdminViewsTests(_RespAssertsMixin, TestCase):
     @classmethod
@@ -345,6 +422,7 @@ class EventRegistrationAdminViewsTests(_RespAssertsMixin, TestCase):
         self.assertEqual(r.status_code, 302)
         self.reg_pending.refresh_from_db()
         self.assertEqual(self.reg_pending.status, "approved")
+        deliver_notifications()
         self.assertEqual(len(mail.outbox), 1)
         self.assertIn(self.user.email, mail.outbox[0].to)
 
@@ -357,6 +435,7 @@ class EventRegistrationAdminViewsTests(_RespAssertsMixin, TestCase):
         self.assertEqual(r.status_code, 302)
         self.reg_pending.refresh_from_db()
         self.assertEqual(self.reg_pending.status, "rejected")
+        deliver_notifications()
         self.assertEqual(len(mail.outbox), 1)
         self.assertIn(self.user.email, mail.outbox[0].to)
 
@@ -396,6 +475,7 @@ class ProfileEmailsDeepTests(TestCase):
             },
         )
         self.assertEqual(r.status_code, 302)
+        deliver_notifications()
         self.assertEqual(len(mail.outbox), 1)
 
         m = mail.outbox[0]
@@ -424,6 +504,7 @@ class ProfileEmailsDeepTests(TestCase):
             },
         )
         self.assertEqual(r.status_code, 302)
+        deliver_notifications()
         self.assertEqual(len(mail.outbox), 1)
         m = mail.outbox[0]
         self.assertTrue(m.subject.startswith("LuxeLadies – Настройките за имейл известия са обновени"))
@@ -503,12 +584,14 @@ class EventRegistrationSignalEmailDeepTests(TestCase):
         )
         mail.outbox = []
         self.client.get(reverse("approve_registration", kwargs={"reg_id": reg.id}))
+        deliver_notifications()
         self.assertEqual(len(mail.outbox), 1)
         self.assertIn(self.user.email, mail.outbox[0].to)
         self.assertIn(self.event.title, mail.outbox[0].subject)
 
         mail.outbox = []
         self.client.get(reverse("approve_registration", kwargs={"reg_id": reg.id}))
+        deliver_notifications()
         self.assertEqual(len(mail.outbox), 0)
 
     def test_email_sent_on_reject_and_contains_event_data(self):
@@ -517,6 +600,7 @@ class EventRegistrationSignalEmailDeepTests(TestCase):
         )
         mail.outbox = []
         self.client.get(reverse("reject_registration", kwargs={"reg_id": reg.id}))
+        deliver_notifications()
         self.assertEqual(len(mail.outbox), 1)
         m = mail.outbox[0]
         self.assertIn(self.user.email, m.to)
@@ -531,6 +615,7 @@ class EventRegistrationSignalEmailDeepTests(TestCase):
         )
         mail.outbox = []
         self.client.get(reverse("approve_registration", kwargs={"reg_id": reg.id}))
+        deliver_notifications()
         self.assertEqual(len(mail.outbox), 0)
 
     def test_no_email_if_pref_disabled(self):
@@ -543,6 +628,7 @@ class EventRegistrationSignalEmailDeepTests(TestCase):
         )
         mail.outbox = []
         self.client.get(reverse("approve_registration", kwargs={"reg_id": reg.id}))
+        deliver_notifications()
         self.assertEqual(len(mail.outbox), 0)
 
     def test_unicode_names_do_not_break_email(self):
@@ -553,6 +639,7 @@ class EventRegistrationSignalEmailDeepTests(TestCase):
         )
         mail.outbox = []
         self.client.get(reverse("approve_registration", kwargs={"reg_id": reg.id}))
+        deliver_notifications()
         self.assertEqual(len(mail.outbox), 1)
         self.assertIn("Весела", mail.outbox[0].body)
 
@@ -593,6 +680,7 @@ class ProfileEmailsEdgeCasesTests(TestCase):
             },
         )
         self.assertEqual(resp.status_code, 302)
+        deliver_notifications()
         self.assertEqual(len(mail.outbox), 1)
         self.assertIn("edge", mail.outbox[0].body)
 
@@ -622,6 +710,7 @@ class EventEmailsUnicodeAndHtmlTests(TestCase):
     def test_approve_unicode_subject_and_html_alt(self):
         mail.outbox = []
         self.client.get(reverse("approve_registration", kwargs={"reg_id": self.reg.id}))
+        deliver_notifications()
         self.assertEqual(len(mail.outbox), 1)
         m = mail.outbox[0]
         self.assertIn("Събитие с Юникод", m.subject)
@@ -682,3 +771,747 @@ class AdminPanelNewestOldestSortTests(TestCase):
         self.assertEqual(self._names(r), ["u3", "u2", "u1"])
         r = self.client.get(reverse("admin_panel") + "?sort=oldest")
         self.assertEqual(self._names(r), ["u1", "u2", "u3"])
+
+
+class SQLitePragmasTests(TestCase):
+    """The connection_created hook applies settings.SQLITE_PRAGMAS."""
+    def _pragma(self, name):
+        with connection.cursor() as c:
+            c.execute(f"PRAGMA {name}")
+            return c.fetchone()[0]
+
+    def test_pragmas_applied_on_connect(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("SQLite only")
+        # the driver timeout is the only source of busy_timeout
+        self.assertNotIn("busy_timeout", settings.SQLITE_PRAGMAS)
+        self.assertEqual(self._pragma("busy_timeout"), settings.DATABASES["default"]["OPTIONS"]["timeout"] * 1000)
+        self.assertEqual(self._pragma("synchronous"), 1)  # NORMAL
+        self.assertEqual(self._pragma("temp_store"), 2)   # MEMORY
+        self.assertEqual(self._pragma("cache_size"), settings.SQLITE_PRAGMAS["cache_size"])
+
+
+class ReplicaRoutingTests(TestCase):
+    """Read-only views go to the replica, writes and sticky clients stay on the primary."""
+    def _route(self, path, method="get", cookies=None):
+        seen = []
+        request = getattr(RequestFactory(), method)(path)
+        request.COOKIES.update(cookies or {})
+        request.resolver_match = resolve(path)
+
+        def view(req):
+            mw.process_view(req, None, (), {})
+            seen.append(PrimaryReplicaRouter().db_for_read(Event))
+            return HttpResponse()
+
+        mw = ReplicaRoutingMiddleware(view)
+        with patch.dict(settings.DATABASES, {"replica": settings.DATABASES["default"]}):
+            response = mw(request)
+        return seen[0], response
+
+    def test_listing_get_reads_from_replica(self):
+        db, _ = self._route(reverse("all_events"))
+        self.assertEqual(db, "replica")
+
+    def test_other_views_read_from_primary(self):
+        db, _ = self._route(reverse("my_profile"))
+        self.assertEqual(db, "default")
+
+    def test_post_pins_client_to_primary(self):
+        db, response = self._route(reverse("event_detail", args=[1]), method="post")
+        self.assertEqual(db, "default")
+        self.assertIn("db_primary_pin", response.cookies)
+
+        db, _ = self._route(reverse("event_detail", args=[1]), cookies={"db_primary_pin": "1"})
+        self.assertEqual(db, "default")
+
+
+class JobMetricsEndpointTests(_RespAssertsMixin, TestCase):
+    def test_admin_only_json(self):
+        JobRunDaily.objects.create(job_name="send_event_reminders_job", day=timezone.localdate(), runs=3, p95_ms=120)
+        User.objects.create_superuser("ops", "ops@example.com", "x")
+        User.objects.create_user("member", "member@example.com", "x", is_approved=True, age=30)
+
+        self.client.login(username="member", password="x")
+        self.assertStatusIn(self.client.get(reverse("job_metrics")), (302, 403))
+
+        self.client.login(username="ops", password="x")
+        r = self.client.get(reverse("job_metrics") + "?days=2")
+        self.assertEqual(r.status_code, 200)
+        data = r.json()
+        self.assertEqual(data["daily"][0]["job_name"], "send_event_reminders_job")
+        self.assertEqual(data["daily"][0]["p95_ms"], 120)
+        self.assertEqual(data["slow_runs"], [])
+
+
+class RequestTimingMiddlewareTests(TestCase):
+    def setUp(self):
+        request_stats.snapshot(reset=True)
+        self.admin = User.objects.create_superuser("timer", "timer@example.com", "x")
+        self.client.login(username="timer", password="x")
+
+    def test_server_timing_header_and_histograms(self):
+        r = self.client.get(reverse("admin_event_registrations"))
+        self.assertEqual(r.status_code, 200)
+        self.assertRegex(r["Server-Timing"], r'db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, total;dur=[\d.]+')
+
+        stats = self.client.get(reverse("request_stats")).json()["views"]
+        self.assertEqual(stats["admin_event_registrations"]["total_ms"]["count"], 1)
+        self.assertGreater(stats["admin_event_registrations"]["queries"]["avg"], 0)
+
+    def test_admin_event_registrations_has_no_n_plus_one(self):
+        statuses = ["pending", "approved", "rejected"]
+
+        def add_registrations(first, count):
+            for i in range(first, first + count):
+                user = User.objects.create_user(f"reg{i}", f"reg{i}@example.com", "x", age=30, is_approved=True)
+                ev = Event.objects.create(title=f"E{i}", city="Sofia", location_details="C",
+                                          date_time=timezone.now() + timedelta(days=i + 1), capacity=5)
+                EventRegistration.objects.create(user=user, event=ev, full_name="R", status=statuses[i % 3])
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as ctx:
+                r = self.client.get(reverse("admin_event_registrations"))
+            self.assertEqual(r.status_code, 200)
+            return len(ctx.captured_queries)
+
+        add_registrations(0, 1)
+        count_queries()  # warms the session and the cached user
+        one = count_queries()
+        add_registrations(1, 9)
+        self.assertEqual(count_queries(), one)
+
+    @override_settings(QUERY_BUDGETS={"home": 0})
+    def test_query_budget_is_enforced(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse("home"))
+
+    async def test_async_view_queries_are_counted(self):
+        # under ASGI the ORM of an async view runs on the sync_to_async thread, not the loop's
+        await self.async_client.aforce_login(self.admin)
+        r = await self.async_client.get(reverse("all_events"))
+        self.assertEqual(r.status_code, 200)
+        queries = int(re.search(r'desc="(\d+) queries"', r["Server-Timing"]).group(1))
+        self.assertGreater(queries, 0)
+        self.assertGreater(request_stats.snapshot()["all_events"]["queries"]["avg"], 0)
+
+    @override_settings(QUERY_BUDGETS={"all_events": 0})
+    async def test_query_budget_is_enforced_for_async_views(self):
+        await self.async_client.aforce_login(self.admin)
+        with self.assertRaises(QueryBudgetExceeded):
+            await self.async_client.get(reverse("all_events"))
+
+
+class SeedSyntheticCommandTests(TestCase):
+    def test_creates_requested_volumes_in_batches(self):
+        call_command("seed_synthetic", users=30, events=12, registrations=100, batch_size=7, stdout=io.StringIO())
+
+        users = User.objects.filter(username__startswith="synthetic_")
+        self.assertEqual(users.count(), 30)
+        self.assertEqual(Questionnaire.objects.filter(user__in=users).count(), 30)
+        self.assertEqual(NotificationSettings.objects.filter(user__in=users).count(), 30)
+        self.assertEqual(Event.objects.filter(title__startswith="[synthetic]").count(), 12)
+        self.assertEqual(EventRegistration.objects.filter(user__in=users).count(), 100)
+
+        call_command("seed_synthetic", flush=True, stdout=io.StringIO())
+        self.assertFalse(User.objects.filter(username__startswith="synthetic_").exists())
+
+
+@override_settings(APSCHEDULER_ENABLE=False)
+class ExportTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser("exp", "exp@example.com", "x")
+        self.member = User.objects.create_user(
+            "anna", "anna@example.com", "x", first_name="Анна", is_approved=True, age=31
+        )
+        q = Questionnaire.objects.create(
+            user=self.member, full_name="Анна Иванова", city="София", can_travel_to_sofia=True,
+            about="", has_children=False, wants_events_with_children=False, why_join="",
+            how_did_you_hear="instagram", completed=True,
+        )
+        q.interests.add(Interest.objects.create(name="Йога"), Interest.objects.create(name="Книги"))
+        self.event = Event.objects.create(
+            title="Вечер & <книги>", city="София", location_details="Център",
+            date_time=timezone.now() + timedelta(days=3), price=0, capacity=10,
+        )
+        EventRegistration.objects.create(event=self.event, user=self.member, full_name="Анна Иванова")
+        self.client.login(username="exp", password="x")
+
+    def _rows(self, response):
+        content = b"".join(response.streaming_content).decode("utf-8-sig")
+        return list(csv.reader(io.StringIO(content)))
+
+    def test_registrations_csv_streams(self):
+        r = self.client.get(reverse("export_registrations") + f"?event={self.event.id}")
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(r.streaming)
+        self.assertIn("attachment;", r["Content-Disposition"])
+        rows = self._rows(r)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][:4], ["Вечер & <книги>", rows[1][1], "София", "anna"])
+
+    def test_members_csv_has_questionnaire_and_interests(self):
+        rows = self._rows(self.client.get(reverse("export_members")))
+        self.assertEqual([row[0] for row in rows[1:]], ["anna"])
+        self.assertEqual(rows[1][13], "Йога, Книги")
+
+    def test_registrations_xlsx_is_valid_zip(self):
+        r = self.client.get(reverse("export_registrations") + "?format=xlsx")
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(r.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        sheet = archive.read("xl/worksheets/sheet1.xml").decode("utf-8")
+        self.assertIn("Вечер &amp; &lt;книги&gt;", sheet)
+        self.assertEqual(sheet.count("<row>"), 2)
+
+    def test_formula_cells_are_neutralised_in_csv(self):
+        Questionnaire.objects.filter(user=self.member).update(about="=HYPERLINK(\"http://x\")", why_join="@SUM(A1)")
+        User.objects.filter(pk=self.member.pk).update(last_name="-2+3", first_name="\tАнна")
+        row = self._rows(self.client.get(reverse("export_members")))[1]
+        self.assertEqual(row[2:4], ["'\tАнна", "'-2+3"])
+        self.assertEqual(row[14:16], ["'=HYPERLINK(\"http://x\")", "'@SUM(A1)"])
+        self.assertEqual(row[4], "31")  # numbers are left alone
+
+    async def test_asgi_export_streams_asynchronously(self):
+        await self.async_client.aforce_login(self.admin)
+        r = await self.async_client.get(reverse("export_registrations"))
+        self.assertTrue(r.is_async)
+        chunks = [chunk async for chunk in r.streaming_content]
+        # the header goes out on its own, before the rows are read
+        self.assertEqual(chunks[0].decode("utf-8-sig").strip(), ",".join(exports.REGISTRATION_HEADER))
+        rows = list(csv.reader(io.StringIO(b"".join(chunks).decode("utf-8-sig"))))
+        self.assertEqual([row[3] for row in rows[1:]], ["anna"])
+
+    async def test_asgi_admin_action_streams_asynchronously(self):
+        await self.async_client.aforce_login(self.admin)
+        r = await self.async_client.post(reverse("admin:core_customuser_changelist"), {
+            "action": "export_members_xlsx", "_selected_action": [self.member.pk],
+        })
+        self.assertTrue(r.streaming)
+        self.assertTrue(r.is_async)
+        archive = zipfile.ZipFile(io.BytesIO(b"".join([chunk async for chunk in r.streaming_content])))
+        self.assertIn("anna", archive.read("xl/worksheets/sheet1.xml").decode("utf-8"))
+
+    def test_unknown_format_and_non_admin(self):
+        self.assertEqual(self.client.get(reverse("export_members") + "?format=pdf").status_code, 400)
+        self.client.login(username="anna", password="x")
+        self.assertIn(self.client.get(reverse("export_members")).status_code, (302, 403))
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+)
+class AuthFastPathTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="fast", email="fast@example.com", password="x", is_approved=True, age=30)
+        make_min_questionnaire(self.user)
+
+    def test_cached_user_is_invalidated_on_save(self):
+        self.client.login(username="fast", password="x")
+        self.client.get(reverse("home"))
+        with self.assertNumQueries(0):
+            r = self.client.get(reverse("home"))
+        self.assertEqual(r.wsgi_request.user.first_name, "")
+
+        self.user.first_name = "Нова"
+        self.user.save()
+        r = self.client.get(reverse("home"))
+        self.assertEqual(r.wsgi_request.user.first_name, "Нова")
+
+    def test_password_change_logs_out_other_sessions(self):
+        other = Client()
+        other.login(username="fast", password="x")
+        other.get(reverse("home"))
+        self.user.set_password("new-pass-123")
+        self.user.save()
+        r = other.get(reverse("events_home"))
+        self.assertIn(settings.LOGIN_URL, r.headers.get("Location", ""))
+
+    def test_last_login_written_once_per_resolution_without_refetch(self):
+        self.client.post(reverse("login"), {"username": "fast", "password": "x"})
+        self.user.refresh_from_db()
+        first = self.user.last_login
+        self.assertIsNotNone(first)
+
+        self.client.logout()
+        self.client.post(reverse("login"), {"username": "fast", "password": "x"})
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.last_login, first)
+
+        User.objects.filter(pk=self.user.pk).update(last_login=first - timedelta(hours=2))
+        self.client.logout()
+        self.client.post(reverse("login"), {"username": "fast", "password": "x"})
+        self.user.refresh_from_db()
+        self.assertGreater(self.user.last_login, first)
+
+
+# tiny scrypt cost, so the rehash test stays fast
+_CHEAP_SCRYPT = {"work_factor": 2**10, "block_size": 8, "parallelism": 1}
+
+
+class PasswordHashingTests(TestCase):
+    def test_tests_use_fast_hasher(self):
+        self.assertEqual(settings.PASSWORD_HASHERS, ["django.contrib.auth.hashers.MD5PasswordHasher"])
+        user = User.objects.create_user(username="quick", password="x")
+        self.assertTrue(user.password.startswith("md5$"))
+
+    @override_settings(
+        PASSWORD_HASHERS=["core.hashers.TunedScryptPasswordHasher", "django.contrib.auth.hashers.PBKDF2PasswordHasher"],
+        PASSWORD_SCRYPT=_CHEAP_SCRYPT,
+    )
+    def test_login_rehashes_legacy_pbkdf2_to_scrypt(self):
+        user = User.objects.create_user(username="legacy", password="x", is_approved=True, age=30)
+        User.objects.filter(pk=user.pk).update(password=make_password("legacy-pass", hasher="pbkdf2_sha256"))
+
+        r = self.client.post(reverse("login"), {"username": "legacy", "password": "legacy-pass"})
+        self.assertEqual(r.status_code, 302)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith("scrypt$1024$"))
+        self.assertTrue(user.check_password("legacy-pass"))
+
+    @override_settings(PASSWORD_HASHERS=["core.hashers.TunedScryptPasswordHasher"], PASSWORD_SCRYPT=_CHEAP_SCRYPT)
+    def test_changed_scrypt_cost_rehashes_on_login(self):
+        user = User.objects.create_user(username="tuned", password="tuned-pass", is_approved=True, age=30)
+        self.assertTrue(user.password.startswith("scrypt$1024$"))
+
+        with override_settings(
+            PASSWORD_HASHERS=["core.hashers.TunedScryptPasswordHasher"],
+            PASSWORD_SCRYPT={**_CHEAP_SCRYPT, "work_factor": 2**11},
+        ):
+            self.assertTrue(self.client.login(username="tuned", password="tuned-pass"))
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith("scrypt$2048$"))
+
+
+@override_settings(
+    RATELIMIT_ENABLE=True,
+    RATELIMITS={"login": {"ip": "3/60", "username": "2/60"}},
+)
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ratelimit.local_buckets.clear()
+
+    def _login(self, username, client=None):
+        return (client or self.client).post(reverse("login"), {"username": username, "password": "wrong"})
+
+    def test_username_and_ip_buckets(self):
+        self.assertEqual(self._login("anna").status_code, 200)
+        self.assertEqual(self._login("Anna").status_code, 200)
+        r = self._login("anna")
+        self.assertEqual(r.status_code, 429)
+        self.assertGreater(int(r["Retry-After"]), 0)
+
+        # a new username from the same address only has the address bucket left (3 per minute)
+        r = self._login("bella")
+        self.assertEqual(r.status_code, 429)
+
+    def test_get_is_not_limited(self):
+        for _ in range(5):
+            self._login("anna")
+        self.assertEqual(self.client.get(reverse("login")).status_code, 200)
+
+    def test_local_fallback_when_cache_fails(self):
+        with patch("core.ratelimit._take_many", side_effect=ConnectionError), self.assertLogs("core.ratelimit", "WARNING"):
+            self.assertEqual(self._login("anna").status_code, 200)
+            self.assertEqual(self._login("anna").status_code, 200)
+            self.assertEqual(self._login("anna").status_code, 429)
+
+    def _burst(self, at, count):
+        """Statuses of `count` logins as "anna" at time `at`, each from its own address."""
+        statuses = []
+        with patch("core.ratelimit.time.time", return_value=at):
+            for _ in range(count):
+                self._ip = getattr(self, "_ip", 0) + 1
+                r = self.client.post(reverse("login"), {"username": "anna", "password": "wrong"},
+                                     REMOTE_ADDR=f"10.0.0.{self._ip}")
+                statuses.append(r.status_code)
+        return statuses
+
+    def _assert_no_double_burst(self):
+        # 2 per 60 s: a fixed window would allow 2 more right after the minute turns
+        self.assertEqual(self._burst(1_000_059.9, 3), [200, 200, 429])
+        self.assertEqual(self._burst(1_000_060.1, 2), [429, 429])
+        # one token is back after half the period
+        self.assertEqual(self._burst(1_000_090.0, 2), [200, 429])
+
+    def test_no_double_burst_across_a_window_boundary(self):
+        self._assert_no_double_burst()
+
+    def test_redis_takes_all_buckets_in_one_script_call(self):
+        redis_cache = Mock(make_and_validate_key=lambda key: f":1:{key}")
+        client = redis_cache._cache.get_client.return_value
+        client.eval.return_value = [0, 7]
+        with patch("core.ratelimit.cache", redis_cache), patch("core.ratelimit.time.time", return_value=100.0):
+            r = self._login("anna")
+        self.assertEqual(r.status_code, 429)
+        self.assertEqual(r["Retry-After"], "7")
+        client.eval.assert_called_once()
+        script, numkeys, *keys_and_args = client.eval.call_args.args
+        self.assertEqual(numkeys, 2)
+        self.assertTrue(all(key.startswith(":1:rl:login:") for key in keys_and_args[:2]))
+        self.assertEqual(keys_and_args[2:], [100.0, 3, 60, 2, 60])
+
+    def test_other_backends_read_and_write_all_buckets_at_once(self):
+        local_cache = Mock(wraps=cache, _cache=None)
+        with patch("core.ratelimit.cache", local_cache):
+            self.assertEqual(self._login("anna").status_code, 200)
+        local_cache.get_many.assert_called_once()
+        self.assertEqual(len(local_cache.get_many.call_args.args[0]), 2)
+        local_cache.set_many.assert_called_once()
+        local_cache.delete_many.assert_called_once()
+        local_cache.get.assert_not_called()
+        self.assertEqual(self._login("anna").status_code, 200)
+        self.assertEqual(self._login("anna").status_code, 429)
+
+    def test_local_fallback_has_the_same_buckets(self):
+        with patch("core.ratelimit._take_many", side_effect=ConnectionError), self.assertLogs("core.ratelimit", "WARNING"):
+            self._assert_no_double_burst()
+
+
+class StaticBundleTests(TestCase):
+    def test_minify_css(self):
+        css = "/* x */\n.a  :hover , .b > .c {\n  width: calc(1px + 2px);\n  color : red;\n}\n"
+        self.assertEqual(minify_css(css), ".a :hover,.b>.c{width:calc(1px + 2px);color :red}")
+
+    def test_dev_links_sources(self):
+        html = Template("{% load static_bundles %}{% css_bundle 'admin' %}").render(Context())
+        self.assertEqual(html.count("<link"), 3)
+
+    def test_collectstatic_builds_bundles_variants_and_gzip(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(
+            STATIC_ROOT=root,
+            STATIC_BUNDLES_ENABLED=True,
+            STORAGES={**settings.STORAGES, "staticfiles": {"BACKEND": "core.staticfiles.BundledManifestStaticFilesStorage"}},
+        ):
+            call_command("collectstatic", interactive=False, verbosity=0)
+            html = Template(
+                "{% load static_bundles %}{% css_bundle 'site' %}{% static_picture 'images/logo.png' 360 alt='Logo' %}"
+            ).render(Context())
+
+            bundle = re.search(r'href="/static/(css/bundle-site\.\w{12}\.css)"', html).group(1)
+            self.assertEqual(html.count("<link"), 1)
+            with open(os.path.join(root, bundle), "rb") as fh:
+                minified = fh.read()
+            self.assertTrue(minified.startswith(b"body{") and b"\n" not in minified)
+            with gzip.open(os.path.join(root, bundle + ".gz")) as fh:
+                self.assertEqual(fh.read(), minified)
+
+            webp = re.search(r'srcset="/static/(images/logo-360\.\w{12}\.webp)"', html).group(1)
+            with Image.open(os.path.join(root, webp)) as image:
+                self.assertEqual(image.size[0], 360)
+
+
+class DevMediaServingTests(TestCase):
+    """luxeladies/urls.py as loaded in development, where static() serves the uploads."""
+
+    def setUp(self):
+        def load_urls():
+            importlib.reload(luxeladies.urls)
+            clear_url_caches()
+
+        with override_settings(DEBUG=True):
+            load_urls()
+        self.addCleanup(load_urls)
+
+    def test_only_uploads_are_served(self):
+        r = self.client.get("/media/event_images/cooking.jpg")
+        self.assertEqual(r.status_code, 200)
+        r.close()
+        for path in ("/db.sqlite3", "/luxeladies/settings.py", "/requests.jsonl"):
+            self.assertEqual(self.client.get(path).status_code, 404, path)
+
+
+class CompressionMiddlewareTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser("gz", "gz@example.com", "x")
+        self.client.force_login(self.admin)
+
+    def test_page_is_gzipped_for_clients_that_accept_it(self):
+        plain = self.client.get(reverse("admin_panel"))
+        self.assertNotIn("Content-Encoding", plain)
+        self.assertIn("Accept-Encoding", plain["Vary"])
+
+        r = self.client.get(reverse("admin_panel"), HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(r["Content-Encoding"], "gzip")
+        self.assertEqual(int(r["Content-Length"]), len(r.content))
+        self.assertEqual(gzip.decompress(r.content), plain.content)
+
+    def test_streaming_export_is_compressed_chunk_by_chunk(self):
+        r = self.client.get(reverse("export_registrations"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertTrue(r.streaming)
+        self.assertEqual(r["Content-Encoding"], "gzip")
+        body = gzip.decompress(b"".join(r.streaming_content)).decode("utf-8-sig")
+        self.assertTrue(body.startswith("Събитие,"))
+
+    def test_each_streamed_chunk_is_flushed(self):
+        chunks = compression.compress_chunks(iter([b"first row\n", b"", b"second row\n"]), compression.GzipEncoder())
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        # every compressed chunk decodes to its rows right away, before the stream ends
+        self.assertEqual(decompressor.decompress(next(chunks)), b"first row\n")
+        self.assertEqual(decompressor.decompress(next(chunks)), b"second row\n")
+        self.assertEqual(decompressor.decompress(next(chunks)), b"")
+        self.assertTrue(decompressor.eof)
+
+    def test_pages_with_csrf_token_get_masked_gzip_only(self):
+        self.client.logout()
+        lengths = set()
+        with patch.object(compression, "brotli", object()):
+            for _ in range(5):
+                r = self.client.get(reverse("login"), HTTP_ACCEPT_ENCODING="br, gzip")
+                self.assertEqual(r["Content-Encoding"], "gzip")
+                self.assertTrue(r.content[3] & gzip.FNAME)
+                lengths.add(len(r.content))
+        self.assertGreater(len(lengths), 1)
+
+    def test_negotiation(self):
+        with patch.object(compression, "brotli", object()):
+            self.assertEqual(compression.negotiate("gzip, br"), "br")
+            self.assertEqual(compression.negotiate("gzip, br;q=0.5"), "gzip")
+            self.assertEqual(compression.negotiate("br, gzip", sensitive=True), "gzip")
+        self.assertEqual(compression.negotiate("br"), None)
+        self.assertEqual(compression.negotiate("*"), "gzip")
+        self.assertEqual(compression.negotiate("gzip;q=0, identity"), None)
+
+    def test_media_event_streams_and_encoded_bodies_are_skipped(self):
+        self.assertFalse(compression.is_compressible(HttpResponse(b"x", content_type="image/png")))
+        self.assertFalse(compression.is_compressible(HttpResponse(b"x", content_type="text/event-stream")))
+        response = HttpResponse(b"x", content_type="text/html")
+        self.assertTrue(compression.is_compressible(response))
+        response["Content-Encoding"] = "br"
+        self.assertFalse(compression.is_compressible(response))
+
+
+class BatchApprovalTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser("boss", "boss@example.com", "x")
+        self.client.force_login(self.admin)
+        self.ok = [
+            User.objects.create_user(f"ok{i}", f"ok{i}@example.com", "x", age=20 + i, works=True)
+            for i in range(3)
+        ]
+        self.no_age = User.objects.create_user("noage", "noage@example.com", "x", studies=True)
+        self.young = User.objects.create_user("young", "young@example.com", "x", age=16, studies=True)
+        self.idle = User.objects.create_user("idle", "idle@example.com", "x", age=30)
+
+    def test_preview_counts_and_reasons(self):
+        r = self.client.get(reverse("approval_queue"))
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(
+            r.context["summary"],
+            {"total": 6, "eligible": 3, "age_missing": 1, "under_age": 1, "no_occupation": 1},
+        )
+        reasons = {u.username: u.reason for u in r.context["ineligible"]}
+        self.assertEqual(reasons, {
+            "noage": approvals.REASONS["age_missing"],
+            "young": approvals.REASONS["under_age"],
+            "idle": approvals.REASONS["no_occupation"],
+        })
+
+    def test_bulk_approve_is_one_update_and_queues_emails(self):
+        with self.assertNumQueries(5):  # savepoint, select, update, insert of the emails, release
+            self.assertEqual(approvals.approve(), 3)
+        self.assertEqual(set(User.objects.filter(is_approved=True, is_superuser=False)), set(self.ok))
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(sorted(QueuedEmail.objects.values_list("to", flat=True)), [u.email for u in self.ok])
+
+        self.assertEqual(send_queued_emails(), 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIn("ok0", mail.outbox[0].body)
+        self.assertFalse(QueuedEmail.objects.exists())
+
+    def test_post_approves_eligible_and_respects_limit(self):
+        with override_settings(APPROVAL_BATCH_LIMIT=2):
+            r = self.client.post(reverse("approval_queue"))
+        self.assertRedirects(r, reverse("approval_queue"))
+        self.assertEqual(User.objects.filter(is_approved=True, is_superuser=False).count(), 2)
+        self.assertEqual(approvals.approve(), 1)
+        self.assertEqual(approvals.approve(), 0)
+
+    def test_approve_user_without_age_does_not_crash(self):
+        r = self.client.get(reverse("approve_user", kwargs={"user_id": self.no_age.id}))
+        self.assertRedirects(r, reverse("admin_panel"))
+        self.no_age.refresh_from_db()
+        self.assertFalse(self.no_age.is_approved)
+
+    def test_failed_email_is_retried_then_dropped(self):
+        approvals.approve(User.objects.filter(pk=self.ok[0].pk))
+        with override_settings(EMAIL_QUEUE_MAX_ATTEMPTS=2), \
+                patch("django.core.mail.EmailMultiAlternatives.send", side_effect=OSError("smtp down")), \
+                self.assertLogs("core.emails", "WARNING"):
+            self.assertEqual(send_queued_emails(), 0)
+            self.assertEqual(QueuedEmail.objects.get().attempts, 1)
+            self.assertEqual(send_queued_emails(), 0)
+        self.assertFalse(QueuedEmail.objects.exists())
+
+    def test_auto_approve_job_is_opt_in(self):
+        auto_approve_members_job.__wrapped__()
+        self.assertFalse(User.objects.filter(is_approved=True, is_superuser=False).exists())
+        with override_settings(AUTO_APPROVE_ENABLE=True):
+            auto_approve_members_job()
+        self.assertEqual(User.objects.filter(is_approved=True, is_superuser=False).count(), 3)
+        run = JobRun.objects.get(job_name="auto_approve_members_job")
+        self.assertEqual((run.items_processed, run.rows_scanned), (3, 0))
+
+
+class AuditLogTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser("auditor", "auditor@example.com", "x")
+        self.client.force_login(self.admin)
+        self.member = User.objects.create_user("mem", "mem@example.com", "x", age=25, works=True)
+        self.event = Event.objects.create(
+            title="Среща", description="", city="София", location_details="",
+            date_time=timezone.now() + timedelta(days=5), capacity=10,
+        )
+        self.reg = EventRegistration.objects.create(event=self.event, user=self.member, full_name="Мем")
+
+    def entries(self, target_type, target_id):
+        return [
+            (e.old_value, e.new_value, e.actor_id, e.source)
+            for e in audit.history(target_type, target_id)
+        ]
+
+    def test_panel_actions_are_logged_with_actor(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse("approve_registration", args=[self.reg.pk]))
+            self.client.get(reverse("reject_registration", args=[self.reg.pk]))
+            self.client.get(reverse("approve_user", args=[self.member.pk]))
+        panel = AuditEntry.SOURCE_PANEL
+        self.assertEqual(self.entries(AuditEntry.TARGET_REGISTRATION, self.reg.pk), [
+            (audit.STATES["pending"], audit.STATES["approved"], self.admin.pk, panel),
+            (audit.STATES["approved"], audit.STATES["rejected"], self.admin.pk, panel),
+        ])
+        self.assertEqual(self.entries(AuditEntry.TARGET_USER, self.member.pk), [
+            (audit.STATES["pending"], audit.STATES["approved"], self.admin.pk, panel),
+        ])
+
+    def test_rejected_user_keeps_the_trail(self):
+        member_id = self.member.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse("reject_user", args=[member_id]))
+        self.assertFalse(User.objects.filter(pk=member_id).exists())
+        self.assertEqual(self.entries(AuditEntry.TARGET_USER, member_id), [
+            (audit.STATES["pending"], audit.STATES["deleted"], self.admin.pk, AuditEntry.SOURCE_PANEL),
+        ])
+
+    def test_buffered_entries_are_one_insert_and_rollback_drops_them(self):
+        token = audit.start_buffer()
+        with self.captureOnCommitCallbacks(execute=True):
+            audit.record(AuditEntry.TARGET_REGISTRATION, [(1, "pending"), (2, "waitlisted")], "approved",
+                         source=AuditEntry.SOURCE_ADMIN)
+            try:
+                with transaction.atomic():
+                    audit.record(AuditEntry.TARGET_USER, [(3, "pending")], "approved", source=AuditEntry.SOURCE_AUTO)
+                    raise ValueError
+            except ValueError:
+                pass
+        entries = audit.end_buffer(token)
+        self.assertEqual([e.target_id for e in entries], [1, 2])
+        self.assertFalse(AuditEntry.objects.exists())
+        with self.assertNumQueries(1):
+            audit.write(entries)
+        self.assertEqual(AuditEntry.objects.count(), 2)
+
+    def test_old_months_move_to_packed_archives(self):
+        cutoff = audit.month_start(timezone.localdate().replace(day=1))
+        # two entries in the previous month, one in each of the two before it, one in this month
+        times = [cutoff - timedelta(days=days) for days in (70, 40, 2, 1)] + [cutoff + timedelta(hours=1)]
+        AuditEntry.objects.bulk_create([
+            AuditEntry(at=at, actor_id=self.admin.pk, source=AuditEntry.SOURCE_PANEL,
+                       target_type=AuditEntry.TARGET_REGISTRATION, target_id=self.reg.pk,
+                       old_value=audit.STATES["pending"], new_value=audit.STATES["approved"])
+            for at in times
+        ])
+        # another registration archived into the same bucket
+        AuditEntry.objects.create(at=times[-2], source=AuditEntry.SOURCE_ADMIN, target_type=AuditEntry.TARGET_REGISTRATION,
+                                  target_id=self.reg.pk + 1, old_value=audit.STATES["pending"],
+                                  new_value=audit.STATES["rejected"])
+
+        def trail():
+            return [(e.at.replace(microsecond=0), e.actor_id, e.new_value)
+                    for e in audit.history(AuditEntry.TARGET_REGISTRATION, self.reg.pk)]
+
+        before = trail()
+        self.assertEqual(audit.archive(cutoff), 5)
+        self.assertEqual(AuditEntry.objects.count(), 1)
+        self.assertEqual(sorted(AuditArchive.objects.values_list("count", flat=True)), [1, 1, 3])
+        self.assertEqual(len(bytes(AuditArchive.objects.get(count=3).entries)), 45)
+        self.assertEqual(trail(), before)
+        self.assertEqual(audit.archive(cutoff), 0)
+
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+class NotificationDispatcherTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("digest", "digest@example.com", "x", first_name="Ива", age=25, is_approved=True)
+        make_min_questionnaire(self.user)
+        self.client.force_login(self.user)
+
+    def test_profile_saves_in_one_window_are_one_digest(self):
+        for last_name in ("А", "Б"):
+            self.client.post(reverse("my_profile"), data={
+                "form": "profile", "username": "digest", "email": "digest@example.com",
+                "first_name": "Ива", "last_name": last_name,
+            })
+        self.client.post(reverse("my_profile"), data={"form": "notifications", "email_profile_changes": "on"})
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(PendingNotification.objects.values("send_after").distinct().count(), 1)
+        # not yet due
+        self.assertEqual(notifications.send_due_notifications(), 0)
+
+        self.assertEqual(deliver_notifications(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        m = mail.outbox[0]
+        self.assertEqual(m.subject, "LuxeLadies – 3 нови известия")
+        self.assertEqual(m.body.count("Здравей, Ива!"), 1)
+        self.assertEqual(m.body.count("Профилът е обновен"), 2)
+        self.assertIn("Настройките за имейл известия са обновени", m.body)
+        self.assertEqual(m.alternatives[0][1], "text/html")
+        self.assertFalse(PendingNotification.objects.exists())
+
+    def test_preferences_of_a_batch_are_one_query(self):
+        others = [User.objects.create_user(f"n{i}", f"n{i}@example.com", "x", age=25) for i in range(5)]
+        NotificationSettings.objects.filter(user=others[0]).update(email_event_reminders=False)
+        NotificationSettings.objects.filter(user=others[1]).delete()  # the defaults apply
+        event = Event.objects.create(title="Среща", city="София", date_time=timezone.now() + timedelta(days=1), capacity=10)
+        batch = [(user, "event_reminder", event, {"label": "1d"}) for user in [self.user, *others]]
+        with self.assertNumQueries(3):  # preferences, open windows, insert
+            self.assertEqual(notifications.dispatch(batch), 5)
+        self.assertFalse(PendingNotification.objects.filter(user=others[0]).exists())
+
+    def test_suppressed_kinds_are_not_rendered(self):
+        NotificationSettings.objects.filter(user=self.user).update(email_profile_changes=False)
+        with patch("core.notifications.render_to_string") as render, \
+             patch("core.emails.render_to_string") as render_email:
+            self.assertEqual(notifications.notify(self.user, "profile_updated"), 0)
+            self.assertEqual(deliver_notifications(), 0)
+        render.assert_not_called()
+        render_email.assert_not_called()
+        self.assertFalse(PendingNotification.objects.exists())
+
+    def test_preferences_changed_in_the_window_apply_when_sent(self):
+        notifications.notify(self.user, "questionnaire_updated")
+        NotificationSettings.objects.filter(user=self.user).update(email_questionnaire_changes=False)
+        self.assertEqual(deliver_notifications(), 0)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertFalse(PendingNotification.objects.exists())
+
+    def test_failed_digest_is_retried_then_dropped(self):
+        notifications.notify(self.user, "profile_updated")
+        notifications.notify(self.user, "notifications_updated")
+        with override_settings(EMAIL_QUEUE_MAX_ATTEMPTS=2), \
+                patch("django.core.mail.EmailMultiAlternatives.send", side_effect=OSError("smtp down")), \
+                self.assertLogs("core.notifications", "WARNING"):
+            self.assertEqual(deliver_notifications(), 0)
+            self.assertEqual(list(PendingNotification.objects.values_list("attempts", flat=True)), [1, 1])
+            self.assertEqual(deliver_notifications(), 0)
+        self.assertFalse(PendingNotification.objects.exists())
+
+    def test_failed_digest_is_sent_on_the_next_run(self):
+        notifications.notify(self.user, "profile_updated")
+        with patch("django.core.mail.EmailMultiAlternatives.send", side_effect=OSError("smtp down")), \
+                self.assertLogs("core.notifications", "WARNING"):
+            deliver_notifications()
+        self.assertEqual(deliver_notifications(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(PendingNotification.objects.exists())
@@ -4,14 +4,21 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
 from core.models import CustomUser
 from django.conf import settings
-from events.models import EventRegistration
+from events import analytics
+from events.live import registration_queue_counts
+from events.models import EventRegistration, JobRun, JobRunDaily
 from .forms import CustomUserRegistrationForm, UserQuestionnaireForm, ProfileForm, NotificationSettingsForm
 from django.db.models import Q
 from django.utils import timezone
+from django.http import JsonResponse, HttpResponseBadRequest
+from django.utils.functional import SimpleLazyObject
+from datetime import timedelta
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth import update_session_auth_hash
-from .models import Questionnaire, NotificationSettings
-from .emails import send_templated_email
+from .models import AuditEntry, Questionnaire, NotificationSettings, QueuedEmail
+from .notifications import notify
+from . import approvals, audit, exports, request_stats
+from .ratelimit import ratelimit
 
 
 def is_admin(user):
@@ -64,9 +71,7 @@ def admin_panel(request):
     else:
         approved_users = approved_users.order_by('first_name', 'last_name')
 
-    event_regs_pending  = EventRegistration.objects.filter(status='pending').count()
-    event_regs_approved = EventRegistration.objects.filter(status='approved').count()
-    event_regs_rejected = EventRegistration.objects.filter(status='rejected').count()
+    event_regs = registration_queue_counts()
 
     return render(request, 'core/admin_panel.html', {
         'pending_users': pending_users,
@@ -74,28 +79,159 @@ def admin_panel(request):
         'search_query': search_query,
         'sort_option': sort_option,
         'selected_options': selected_options,
-        'event_regs_pending': event_regs_pending,
-        'event_regs_approved': event_regs_approved,
-        'event_regs_rejected': event_regs_rejected,
+        'event_regs_pending': event_regs['pending'],
+        'event_regs_approved': event_regs['approved'],
+        'event_regs_rejected': event_regs['rejected'],
     })
 
 
 @login_required
 @user_passes_test(is_admin)
-def approve_user(request, user_id):
-    user = CustomUser.objects.get(id=user_id)
+def export_registrations(request):
+    """Streams the event registrations as CSV/XLSX (?format=), optionally for one ?event= and ?status=."""
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        return HttpResponseBadRequest("Unknown format")
+    regs = EventRegistration.objects.all()
+    if request.GET.get('event', '').isdigit():
+        regs = regs.filter(event_id=int(request.GET['event']))
+    if request.GET.get('status'):
+        regs = regs.filter(status=request.GET['status'])
+    return exports.registrations_response(regs, fmt, request)
+
+
+@login_required
+@user_passes_test(is_admin)
+def export_members(request):
+    """Streams the members with their questionnaire answers and interests as CSV/XLSX."""
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        return HttpResponseBadRequest("Unknown format")
+    members = CustomUser.objects.filter(is_superuser=False)
+    if request.GET.get('approved') in ('0', '1'):
+        members = members.filter(is_approved=request.GET['approved'] == '1')
+    return exports.members_response(members, fmt, request)
+
+
+@login_required
+@user_passes_test(is_admin)
+def job_metrics(request):
+    """
+    Machine-readable timings of the scheduled jobs: daily rollups and the recent slow runs.
+    """
+    try:
+        days = min(max(int(request.GET.get('days', 7)), 1), 90)
+    except ValueError:
+        days = 7
+    since = timezone.localdate() - timedelta(days=days - 1)
+
+    daily = list(
+        JobRunDaily.objects.filter(day__gte=since)
+        .order_by('job_name', 'day')
+        .values('job_name', 'day', 'runs', 'errors', 'skipped', 'slow_runs',
+                'p50_ms', 'p95_ms', 'max_ms', 'avg_queries', 'rows_scanned', 'items_processed', 'emails_sent')
+    )
+    slow_runs = list(
+        JobRun.objects.filter(slow=True, started_at__date__gte=since)
+        .order_by('-started_at')
+        .values('job_name', 'started_at', 'duration_ms', 'queries', 'rows_scanned', 'items_processed',
+                'emails_sent', 'owner')[:50]
+    )
+
+    return JsonResponse({
+        'since': since,
+        'slow_ratio': float(getattr(settings, 'JOB_SLOW_RATIO', 0.8)),
+        'daily': daily,
+        'slow_runs': slow_runs,
+    })
+
 
-    if user.age >= 18 and (user.studies or user.works):
-        user.is_approved = True
-        user.save()
+@login_required
+@user_passes_test(is_admin)
+def request_stats_dump(request):
+    """
+    Per-URL histograms collected by RequestTimingMiddleware in this process.
+    ?reset=1 clears them after the dump.
+    """
+    return JsonResponse({
+        'enabled': getattr(settings, 'REQUEST_TIMING_ENABLE', False),
+        'views': request_stats.snapshot(reset=request.GET.get('reset') == '1'),
+    })
+
+
+@login_required
+@user_passes_test(is_admin)
+def approve_user(request, user_id):
+    user = get_object_or_404(CustomUser, id=user_id)
+    # the same rules and path as the batch approval, so a missing age is simply not eligible
+    approved = approvals.approve(
+        CustomUser.objects.filter(pk=user.pk), actor=request.user.pk, source=AuditEntry.SOURCE_PANEL,
+    )
+    if not approved and not user.is_approved:
+        messages.warning(request, f"Потребителят {user.email} не отговаря на условията за одобрение.")
     return redirect('admin_panel')
 
+
+@login_required
+@user_passes_test(is_admin)
+def approval_queue(request):
+    """
+    Batch approval of the pending users: a preview of what the rules decide and,
+    on POST, the approval of the eligible ones with one UPDATE (core.approvals).
+    """
+    if request.method == 'POST':
+        approved = approvals.approve(actor=request.user.pk)
+        messages.success(request, f"Одобрени потребители: {approved}. Имейлите са в опашката за изпращане.")
+        return redirect('approval_queue')
+
+    preview_size = 50
+    return render(request, 'core/admin_approvals.html', {
+        'summary': approvals.summary(),
+        'eligible': approvals.pending_users().filter(approvals.eligible_q()).order_by('date_joined', 'pk')[:preview_size],
+        'ineligible': approvals.ineligible_users().order_by('date_joined', 'pk')[:preview_size],
+        'preview_size': preview_size,
+        'min_age': approvals.min_age(),
+        'batch_limit': getattr(settings, 'APPROVAL_BATCH_LIMIT', 5000),
+        'queued_emails': QueuedEmail.objects.count(),
+    })
+
+
+# the periods the analytics dashboard offers, in days
+ANALYTICS_RANGES = (7, 30, 90, 365)
+
+
+@login_required
+@user_passes_test(is_admin)
+def analytics_dashboard(request):
+    """
+    Signups, approvals, event registrations, questionnaire answers and fill rates,
+    read from the rollups that rollup_analytics_job keeps up to date (events.analytics).
+    """
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        days = 30
+    if days not in ANALYTICS_RANGES:
+        days = 30
+    return render(request, 'core/admin_analytics.html', {
+        **analytics.dashboard(days),
+        'days': days,
+        'ranges': ANALYTICS_RANGES,
+    })
+
+def _delete_user(request, user):
+    user_id, state = user.pk, audit.membership(user)
+    user.delete()
+    audit.record(AuditEntry.TARGET_USER, [(user_id, state)], 'deleted',
+                 actor=request.user.pk, source=AuditEntry.SOURCE_PANEL)
+
+
 @login_required
 @user_passes_test(is_admin)
 def reject_user(request, user_id):
     try:
         user = CustomUser.objects.get(id=user_id)
-        user.delete() 
+        _delete_user(request, user)
         messages.info(request, f"Потребителят {user.email} беше отхвърлен и изтрит.")
     except CustomUser.DoesNotExist:
         messages.error(request, "Потребителят не съществува.")
@@ -105,11 +241,12 @@ def reject_user(request, user_id):
 @user_passes_test(is_admin)
 def delete_user(request, user_id):
     user = get_object_or_404(CustomUser, id=user_id)
-    user.delete()
+    _delete_user(request, user)
     messages.success(request, "Потребителят беше успешно изтрит.")
     return redirect('admin_panel')
 
 
+@ratelimit('register')
 def register(request):
     if request.method == 'POST':
         form = CustomUserRegistrationForm(request.POST)
@@ -141,6 +278,7 @@ def register(request):
 def home(request):
     return render(request, 'home.html')
 
+@ratelimit('login')
 def custom_login(request):
     if request.method == 'POST':
         username = request.POST.get('username')
@@ -200,12 +338,16 @@ def edit_questionnaire(request):
 @login_required
 @user_passes_test(is_admin)
 def admin_event_registrations(request):
-    pending_regs = EventRegistration.objects.filter(status='pending').order_by('-created_at')
-    approved_regs = EventRegistration.objects.filter(status='approved').order_by('-created_at')
-    rejected_regs = EventRegistration.objects.filter(status='rejected').order_by('-created_at')
+    regs = EventRegistration.objects.select_related('event', 'user').order_by('-created_at')
+    pending_regs = regs.filter(status='pending')
+    approved_regs = regs.filter(status='approved')
+    rejected_regs = regs.filter(status='rejected')
+    # in the order promote_from_waitlist takes them, event by event
+    waitlisted_regs = regs.filter(status='waitlisted').order_by('event__date_time', 'event_id', 'created_at', 'id')
 
     return render(request, 'core/admin_event_registrations.html', {
         'pending_regs': pending_regs,
+        'waitlisted_regs': waitlisted_regs,
         'approved_regs': approved_regs,
         'rejected_regs': rejected_regs,
     })
@@ -216,8 +358,10 @@ def admin_event_registrations(request):
 def approve_registration(request, reg_id):
     reg = get_object_or_404(EventRegistration, id=reg_id)
     if reg.status != 'approved':
-        reg.status = 'approved'
+        old_status, reg.status = reg.status, 'approved'
         reg.save() 
+        audit.record(AuditEntry.TARGET_REGISTRATION, [(reg.pk, old_status)], reg.status,
+                     actor=request.user.pk, source=AuditEntry.SOURCE_PANEL)
         messages.success(request, f'Заявката на {reg.full_name or reg.user.username} е одобрена.')
     else:
         messages.info(request, 'Заявката вече е одобрена.')
@@ -229,125 +373,91 @@ def approve_registration(request, reg_id):
 def reject_registration(request, reg_id):
     reg = get_object_or_404(EventRegistration, id=reg_id)
     if reg.status != 'rejected':
-        reg.status = 'rejected'
+        old_status, reg.status = reg.status, 'rejected'
         reg.save()
+        audit.record(AuditEntry.TARGET_REGISTRATION, [(reg.pk, old_status)], reg.status,
+                     actor=request.user.pk, source=AuditEntry.SOURCE_PANEL)
         messages.success(request, f'Заявката на {reg.full_name or reg.user.username} е отхвърлена.')
     else:
         messages.info(request, 'Заявката вече е отхвърлена.')
     return redirect('admin_event_registrations')
 
+def _lazy_form(form_class, **kwargs):
+    """The form is only built if the template actually touches it."""
+    return SimpleLazyObject(lambda: form_class(**kwargs))
+
+
 @login_required
 def my_profile(request):
-    user = request.user
-    questionnaire, _ = Questionnaire.objects.get_or_create(
+    # one query for the user with the questionnaire and the notification settings;
+    # rows that do not exist yet are created only when their form is submitted
+    user = (
+        CustomUser.objects
+        .select_related('questionnaire', 'notificationsettings')
+        .get(pk=request.user.pk)
+    )
+    questionnaire = getattr(user, 'questionnaire', None) or Questionnaire(
         user=user,
-        defaults={
-            "full_name": (user.get_full_name() or user.username or "Потребител").strip(),
-            "city": getattr(user, "city", "") or "",
-            "can_travel_to_sofia": False,
-            "about": "",
-            "has_children": False,
-            "wants_events_with_children": False,
-            "why_join": "",
-            "how_did_you_hear": "instagram",  
-            "completed": False,
-        },
+        full_name=(user.get_full_name() or user.username or "Потребител").strip(),
+        city=getattr(user, "city", "") or "",
+        can_travel_to_sofia=False,
+        about="",
+        has_children=False,
+        wants_events_with_children=False,
+        why_join="",
+        how_did_you_hear="instagram",
+        completed=False,
     )
+    prefs = getattr(user, 'notificationsettings', None) or NotificationSettings(user=user)
 
-    prefs, _ = NotificationSettings.objects.get_or_create(user=user)
+    which = request.POST.get('form', 'profile') if request.method == 'POST' else None
 
-    if request.method == 'POST':
-        which = request.POST.get('form', 'profile')
-
-        if which == 'profile':
-            form = ProfileForm(request.POST, request.FILES, instance=user)
-            q_form = UserQuestionnaireForm(instance=questionnaire)
-            notif_form = NotificationSettingsForm(instance=prefs)
-            if form.is_valid():
-                form.save()
-
-                prefs = getattr(request.user, 'notificationsettings', None)
-                should_email = (not prefs) or prefs.email_profile_changes
-                if should_email and request.user.email:
-                    ctx = {"recipient_name": request.user.first_name or request.user.username}
-                    send_templated_email(
-                        subject="LuxeLadies – Профилът е обновен",
-                        to=[request.user.email],
-                        txt_template="email/profile_updated.txt",
-                        html_template="email/profile_updated.html",
-                        context=ctx,
-                    )
-
-                messages.success(request, 'Профилът е обновен.')
-                return redirect('my_profile')
-
-        elif which == 'questionnaire':
-            form = ProfileForm(instance=user)
-            q_form = UserQuestionnaireForm(request.POST, instance=questionnaire)
-            notif_form = NotificationSettingsForm(instance=prefs)
-            if q_form.is_valid():
-                q_form.save()
-
-                should_email = (not prefs) or prefs.email_questionnaire_changes
-                if should_email and user.email:
-                    ctx = {"recipient_name": user.first_name or user.username}
-                    send_templated_email(
-                        subject="LuxeLadies – Отговорите във въпросника са обновени",
-                        to=[user.email],
-                        txt_template="email/questionnaire_updated.txt",
-                        html_template="email/questionnaire_updated.html",
-                        context=ctx,
-                    )
-
-                messages.success(request, 'Отговорите от въпросника са запазени.')
-                return redirect('my_profile')
-
-        elif which == 'notifications':
-            form = ProfileForm(instance=user)
-            q_form = UserQuestionnaireForm(instance=questionnaire)
-            notif_form = NotificationSettingsForm(request.POST, instance=prefs)
-            if notif_form.is_valid():
-                prefs = notif_form.save()
-
-                if user.email:
-                    ctx = {
-                        "recipient_name": user.first_name or user.username,
-                        "prefs": prefs,
-                    }
-                    send_templated_email(
-                        subject="LuxeLadies – Настройките за имейл известия са обновени",
-                        to=[user.email],
-                        txt_template="email/notifications_updated.txt",
-                        html_template="email/notifications_updated.html",
-                        context=ctx,
-                    )
-
-                messages.success(request, 'Настройките за известия са запазени.')
-                return redirect('my_profile')
+    if which == 'profile':
+        form = ProfileForm(request.POST, request.FILES, instance=user)
+    else:
+        form = _lazy_form(ProfileForm, instance=user)
+    if which == 'questionnaire':
+        q_form = UserQuestionnaireForm(request.POST, instance=questionnaire)
+    else:
+        q_form = _lazy_form(UserQuestionnaireForm, instance=questionnaire)
+    if which == 'notifications':
+        notif_form = NotificationSettingsForm(request.POST, instance=prefs)
+    else:
+        notif_form = _lazy_form(NotificationSettingsForm, instance=prefs)
 
-        else:
-            form = ProfileForm(instance=user)
-            q_form = UserQuestionnaireForm(instance=questionnaire)
-            notif_form = NotificationSettingsForm(instance=prefs)
+    if which == 'profile' and form.is_valid():
+        form.save()
+        notify(user, 'profile_updated', prefs=prefs)
 
-    else:
-        form = ProfileForm(instance=user)
-        q_form = UserQuestionnaireForm(instance=questionnaire)
-        notif_form = NotificationSettingsForm(instance=prefs)
+        messages.success(request, 'Профилът е обновен.')
+        return redirect('my_profile')
 
-    approved_regs = (
-        EventRegistration.objects
-        .filter(user=user, status='approved', event__date_time__gte=timezone.now())
-        .select_related('event').order_by('event__date_time')
-    )
-    approved_events = [r.event for r in approved_regs]
+    if which == 'questionnaire' and q_form.is_valid():
+        q_form.save()
+        notify(user, 'questionnaire_updated', prefs=prefs)
+
+        messages.success(request, 'Отговорите от въпросника са запазени.')
+        return redirect('my_profile')
 
-    past_regs = (
+    if which == 'notifications' and notif_form.is_valid():
+        notif_form.save()
+        # the settings are read when the email is sent, so a digest shows the last ones
+        notify(user, 'notifications_updated', prefs=prefs)
+
+        messages.success(request, 'Настройките за известия са запазени.')
+        return redirect('my_profile')
+
+    # one query for all approved registrations, split into upcoming and past here
+    now = timezone.now()
+    approved_events, past_events = [], []
+    regs = (
         EventRegistration.objects
-        .filter(user=user, status='approved', event__date_time__lt=timezone.now())
-        .select_related('event').order_by('-event__date_time')
+        .filter(user=user, status='approved')
+        .select_related('event').order_by('event__date_time')
     )
-    past_events = [r.event for r in past_regs]
+    for reg in regs:
+        (approved_events if reg.event.date_time >= now else past_events).append(reg.event)
+    past_events.reverse()
 
     return render(request, 'core/my_profile.html', {
         'form': form,
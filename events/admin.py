@@ -1,13 +1,86 @@
+import csv
 from django.contrib import admin, messages
-from .models import Event, EventRegistration
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from core import audit, exports
+from core.models import AuditEntry
+from .forms import EventImportForm
+from .importers import import_events, read_rows
+from .models import Event, EventRegistration, EventSeries, JobLease, JobRun, JobRunDaily
+from .series import RECURRENCE_FIELDS, OCCURRENCE_FIELDS, propagate_series
 
 @admin.register(Event)
 class EventAdmin(admin.ModelAdmin):
     list_display = ("title", "city", "date_time", "price")
     search_fields = ("title", "city", "description")
-    list_filter = ("city",)
+    list_filter = ("city", "series")
     date_hierarchy = "date_time"
     ordering = ("-date_time",)
+    actions = ["export_attendees_csv", "export_attendees_xlsx"]
+
+    def get_urls(self):
+        urls = [
+            path("import/", self.admin_site.admin_view(self.import_view), name="events_event_import"),
+        ]
+        return urls + super().get_urls()
+
+    def import_view(self, request):
+        if not self.has_add_permission(request):
+            return redirect("admin:events_event_changelist")
+
+        result = None
+        form = EventImportForm(request.POST or None, request.FILES or None)
+        if request.method == "POST" and form.is_valid():
+            upload = form.cleaned_data["file"]
+            try:
+                result = import_events(
+                    read_rows(upload.file, upload.import_format),
+                    dry_run=form.cleaned_data["dry_run"],
+                )
+            except (ValueError, csv.Error) as exc:
+                form.add_error("file", f"Файлът не може да бъде прочетен: {exc}")
+            else:
+                if result and not form.cleaned_data["dry_run"]:
+                    self.message_user(request, f"Импортирани {result.created} събития.", level=messages.SUCCESS)
+                    return redirect("admin:events_event_changelist")
+
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Импорт на събития",
+            "form": form,
+            "result": result,
+        }
+        return TemplateResponse(request, "admin/events/event/import_events.html", context)
+
+    @admin.action(description="Експорт на записаните (CSV)")
+    def export_attendees_csv(self, request, queryset):
+        return exports.registrations_response(EventRegistration.objects.filter(event__in=queryset), "csv", request)
+
+    @admin.action(description="Експорт на записаните (XLSX)")
+    def export_attendees_xlsx(self, request, queryset):
+        return exports.registrations_response(EventRegistration.objects.filter(event__in=queryset), "xlsx", request)
+
+@admin.register(EventSeries)
+class EventSeriesAdmin(admin.ModelAdmin):
+    list_display = ["title", "city", "starts_at", "frequency", "interval", "is_active", "materialized_until"]
+    list_filter = ["is_active", "frequency", "city"]
+    search_fields = ["title", "city"]
+    filter_horizontal = ["interests"]
+
+    def save_related(self, request, form, formset, change):
+        super().save_related(request, form, formset, change)
+        # after the M2M is saved, so the occurrences get the new interests
+        changed = set(form.changed_data)
+        updated = propagate_series(
+            form.instance,
+            recurrence_changed=change and bool(changed & set(RECURRENCE_FIELDS)),
+            interests_changed=change and "interests" in changed,
+        )
+        if change and changed & set(OCCURRENCE_FIELDS + ["interests"]):
+            self.message_user(request, f"Обновени {updated} предстоящи срещи.", level=messages.INFO)
+
 
 @admin.register(EventRegistration)
 class EventRegistrationAdmin(admin.ModelAdmin):
@@ -17,22 +90,56 @@ class EventRegistrationAdmin(admin.ModelAdmin):
     raw_id_fields = ['user', 'event']
     actions = ['approve_registration', 'reject_registration']
 
+    def _set_status(self, request, queryset, status):
+        changes = []
+        for registration in queryset:
+            if registration.status != status:
+                changes.append((registration.pk, registration.status))
+                registration.status = status
+                registration.save()
+        audit.record(AuditEntry.TARGET_REGISTRATION, changes, status,
+                     actor=request.user.pk, source=AuditEntry.SOURCE_ADMIN)
+        return len(changes)
+
     @admin.action(description="Одобри избраните заявки")
     def approve_registration(self, request, queryset):
-        changed = 0
-        for registration in queryset:
-            if registration.status != 'approved':
-                registration.status = 'approved'
-                registration.save()  
-                changed += 1
+        changed = self._set_status(request, queryset, 'approved')
         self.message_user(request, f"Одобрени {changed} заявки.", level=messages.SUCCESS)
 
     @admin.action(description="Откажи избраните заявки")
     def reject_registration(self, request, queryset):
-        changed = 0
-        for registration in queryset:
-            if registration.status != 'rejected':
-                registration.status = 'rejected'
-                registration.save()  
-                changed += 1
-        self.message_user(request, f"Отказани {changed} заявки.", level=messages.WARNING)
\ No newline at end of file
+        changed = self._set_status(request, queryset, 'rejected')
+        self.message_user(request, f"Отказани {changed} заявки.", level=messages.WARNING)
+
+
+@admin.register(JobLease)
+class JobLeaseAdmin(admin.ModelAdmin):
+    list_display = ['name', 'owner', 'token', 'expires_at']
+    readonly_fields = ['name', 'owner', 'token', 'expires_at']
+
+
+@admin.register(JobRun)
+class JobRunAdmin(admin.ModelAdmin):
+    list_display = ['job_name', 'started_at', 'duration_ms', 'queries', 'rows_scanned', 'items_processed', 'emails_sent',
+                    'slow', 'outcome', 'owner', 'token']
+    list_filter = ['job_name', 'outcome', 'slow']
+    date_hierarchy = 'started_at'
+    readonly_fields = ['job_name', 'owner', 'token', 'started_at', 'duration_ms', 'outcome', 'error',
+                       'queries', 'rows_scanned', 'items_processed', 'emails_sent', 'slow']
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(JobRunDaily)
+class JobRunDailyAdmin(admin.ModelAdmin):
+    list_display = ['day', 'job_name', 'runs', 'p50_ms', 'p95_ms', 'max_ms', 'slow_runs',
+                    'errors', 'skipped', 'avg_queries', 'rows_scanned', 'items_processed', 'emails_sent']
+    list_filter = ['job_name']
+    date_hierarchy = 'day'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,235 @@
+from collections import Counter
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from core.models import Questionnaire
+from .metrics import incr
+from .models import (
+    AnalyticsWatermark, DailyProfileAnswer, DailyRegistrations, DailySignups,
+    Event, EventFillRate, EventRegistration,
+)
+
+User = get_user_model()
+
+WATERMARK = 'analytics'
+# dirty days further apart than this are recomputed as separate ranges
+MAX_GAP_DAYS = 7
+# answers per question shown on the dashboard
+TOP_ANSWERS = 10
+
+
+def _members():
+    return User.objects.filter(is_superuser=False)
+
+
+def _bounds(first, last):
+    """The aware [start, end) of the local days first..last."""
+    return (
+        timezone.make_aware(datetime.combine(first, time.min)),
+        timezone.make_aware(datetime.combine(last + timedelta(days=1), time.min)),
+    )
+
+
+def _days(queryset, field) -> set:
+    return set(
+        queryset.annotate(day=TruncDate(field)).order_by().values_list('day', flat=True).distinct()
+    )
+
+
+def _spans(days):
+    """Sorted days -> (first, last) ranges, split where MAX_GAP_DAYS or more are missing."""
+    spans = []
+    for day in sorted(days):
+        if spans and (day - spans[-1][1]).days < MAX_GAP_DAYS:
+            spans[-1][1] = day
+        else:
+            spans.append([day, day])
+    return [tuple(span) for span in spans]
+
+
+def _per_day(queryset, field, *values):
+    return (
+        queryset.annotate(day=TruncDate(field)).order_by()
+        .values('day', *values).annotate(n=Count('pk'))
+        .values_list('day', *values, 'n')
+    )
+
+
+def rollup_signups(first, last) -> None:
+    start, end = _bounds(first, last)
+    members = _members()
+    signups = dict(_per_day(members.filter(date_joined__gte=start, date_joined__lt=end), 'date_joined'))
+    approvals = dict(_per_day(members.filter(approved_at__gte=start, approved_at__lt=end), 'approved_at'))
+    with transaction.atomic():
+        DailySignups.objects.filter(day__range=(first, last)).delete()
+        DailySignups.objects.bulk_create([
+            DailySignups(day=day, signups=signups.get(day, 0), approvals=approvals.get(day, 0))
+            for day in sorted(signups.keys() | approvals.keys())
+        ])
+
+
+def rollup_registrations(first, last) -> None:
+    start, end = _bounds(first, last)
+    rows = _per_day(EventRegistration.objects.filter(created_at__gte=start, created_at__lt=end), 'created_at', 'status')
+    with transaction.atomic():
+        DailyRegistrations.objects.filter(day__range=(first, last)).delete()
+        DailyRegistrations.objects.bulk_create([
+            DailyRegistrations(day=day, status=status, count=n) for day, status, n in rows
+        ])
+
+
+def rollup_profile_answers(first, last) -> None:
+    """Keyed by the day the member signed up: the questionnaire has no creation time of its own."""
+    start, end = _bounds(first, last)
+    joined = {'user__is_superuser': False, 'user__date_joined__gte': start, 'user__date_joined__lt': end}
+    questionnaires = Questionnaire.objects.filter(**joined)
+
+    counts = Counter()
+    for question, field in (('channel', 'how_did_you_hear'), ('city', 'city'), ('has_children', 'has_children')):
+        for day, value, n in _per_day(questionnaires, 'user__date_joined', field):
+            if isinstance(value, bool):
+                value = 'yes' if value else 'no'
+            answer = str(value).strip()
+            if answer:
+                counts[day, question, answer] += n
+    Interests = Questionnaire.interests.through
+    interest_rows = _per_day(
+        Interests.objects.filter(**{f'questionnaire__{key}': value for key, value in joined.items()}),
+        'questionnaire__user__date_joined', 'interest__name',
+    )
+    for day, name, n in interest_rows:
+        counts[day, 'interest', name] += n
+
+    with transaction.atomic():
+        DailyProfileAnswer.objects.filter(day__range=(first, last)).delete()
+        DailyProfileAnswer.objects.bulk_create([
+            DailyProfileAnswer(day=day, question=question, answer=answer[:255], count=n)
+            for (day, question, answer), n in counts.items()
+        ])
+
+
+def rollup_fill_rates(event_ids) -> None:
+    seats = {
+        status: Count('registrations', filter=Q(registrations__status=status))
+        for status in ('approved', 'pending', 'waitlisted', 'rejected')
+    }
+    rows = [
+        EventFillRate(event_id=event.pk, title=event.title, date_time=event.date_time, capacity=event.capacity,
+                      **{status: getattr(event, status) for status in seats})
+        for event in Event.objects.filter(pk__in=event_ids).annotate(**seats).only('title', 'date_time', 'capacity')
+    ]
+    with transaction.atomic():
+        EventFillRate.objects.filter(event_id__in=event_ids).delete()
+        EventFillRate.objects.bulk_create(rows)
+
+
+def update_rollups(now=None, rebuild=False) -> dict:
+    """
+    Brings the rollups up to date with the rows changed since the watermark (or with
+    everything, with rebuild=True) and moves the watermark to `now`.
+
+    Every day with a changed row is recomputed from scratch, so the runs are idempotent
+    and each one re-reads ANALYTICS_OVERLAP_MINUTES before the watermark, which covers
+    transactions that committed after the previous run had started. A deleted member
+    (and with them their registrations) leaves no changed row behind: the last
+    ANALYTICS_RECOMPUTE_DAYS are recomputed on every run, older days and the fill rates
+    of untouched events only by a rebuild.
+    Returns how many days and events were recomputed.
+    """
+    now = now or timezone.now()
+    watermark, _ = AnalyticsWatermark.objects.get_or_create(name=WATERMARK)
+    since = None
+    if watermark.position and not rebuild:
+        since = watermark.position - timedelta(minutes=getattr(settings, 'ANALYTICS_OVERLAP_MINUTES', 10))
+
+    def changed(queryset, field):
+        return queryset if since is None else queryset.filter(**{f'{field}__gte': since})
+
+    today = timezone.localdate(now)
+    recent = {today - timedelta(days=n) for n in range(getattr(settings, 'ANALYTICS_RECOMPUTE_DAYS', 2))}
+    members = _members()
+    signup_days = (
+        recent
+        | _days(changed(members, 'date_joined'), 'date_joined')
+        | _days(changed(members.filter(approved_at__isnull=False), 'approved_at'), 'approved_at')
+    )
+    registrations = changed(EventRegistration.objects.all(), 'updated_at')
+    registration_days = recent | _days(registrations, 'created_at')
+    answer_days = recent | _days(
+        changed(Questionnaire.objects.filter(user__is_superuser=False), 'updated_at'), 'user__date_joined'
+    )
+    event_ids = (
+        set(registrations.order_by().values_list('event_id', flat=True))
+        | set(changed(Event.objects.all(), 'updated_at').values_list('pk', flat=True))
+    )
+
+    for rollup, days in (
+        (rollup_signups, signup_days),
+        (rollup_registrations, registration_days),
+        (rollup_profile_answers, answer_days),
+    ):
+        for first, last in _spans(days):
+            rollup(first, last)
+            incr("items_processed", (last - first).days + 1)
+    if event_ids:
+        rollup_fill_rates(event_ids)
+
+    watermark.position = now
+    watermark.save(update_fields=['position'])
+    return {
+        'signup_days': len(signup_days),
+        'registration_days': len(registration_days),
+        'answer_days': len(answer_days),
+        'events': len(event_ids),
+    }
+
+
+def dashboard(days, now=None) -> dict:
+    """
+    The numbers of the admin analytics dashboard for the last `days` days, read from
+    the rollup tables only: one query per table, however many members and
+    registrations there are.
+    """
+    now = now or timezone.now()
+    since = timezone.localdate(now) - timedelta(days=days - 1)
+    statuses = [status for status, _ in EventRegistration.STATUS_CHOICES]
+
+    rows = {}
+    for row in DailySignups.objects.filter(day__gte=since).values('day', 'signups', 'approvals'):
+        rows[row['day']] = dict(row)
+    for day, status, n in DailyRegistrations.objects.filter(day__gte=since).values_list('day', 'status', 'count'):
+        rows.setdefault(day, {'day': day, 'signups': 0, 'approvals': 0})[status] = n
+    daily = []
+    for day in sorted(rows, reverse=True):
+        row = rows[day]
+        for status in statuses:
+            row.setdefault(status, 0)
+        row['registrations'] = sum(row[status] for status in statuses)
+        daily.append(row)
+    totals = {
+        key: sum(row[key] for row in daily)
+        for key in ('signups', 'approvals', 'registrations', *statuses)
+    }
+
+    answers = {question: [] for question, _ in DailyProfileAnswer.QUESTION_CHOICES}
+    answer_rows = (
+        DailyProfileAnswer.objects.filter(day__gte=since)
+        .values('question', 'answer').annotate(total=Sum('count'))
+        .order_by('question', '-total', 'answer')
+    )
+    for row in answer_rows:
+        if len(answers[row['question']]) < TOP_ANSWERS:
+            answers[row['question']].append((row['answer'], row['total']))
+
+    return {
+        'since': since,
+        'daily': daily,
+        'totals': totals,
+        'answers': answers,
+        'fill_rates': list(EventFillRate.objects.filter(date_time__gte=now)[:20]),
+        'updated_at': AnalyticsWatermark.objects.filter(name=WATERMARK).values_list('position', flat=True).first(),
+    }
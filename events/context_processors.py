@@ -0,0 +1,10 @@
+from django.core.handlers.asgi import ASGIRequest
+
+
+def live_push(request):
+    """
+    `live_push`: whether the pages may subscribe to events.views.live_counters.
+    Only an ASGI server keeps the stream open; under WSGI every subscriber would
+    reconnect and rerun the whole request, so the pages keep their rendered counters.
+    """
+    return {'live_push': isinstance(request, ASGIRequest)}
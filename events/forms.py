@@ -1,4 +1,5 @@
 from django import forms
+from core.forms import interest_choices
 from core.models import Interest
 from .models import Event, EventRegistration
 
@@ -36,13 +37,28 @@ class EventFilterForm(forms.Form):
         super().__init__(*args, **kwargs)
         cities = Event.objects.values_list('city', flat=True).distinct()
         self.fields['city'].choices = [('', '--- Всички ---')] + [(city, city) for city in cities]
+        self.fields['interests'].choices = [('', '--- Всички ---')] + interest_choices()
+
+
+class EventImportForm(forms.Form):
+    file = forms.FileField(label="Файл (CSV, JSON или JSON Lines)")
+    dry_run = forms.BooleanField(required=False, label="Само проверка, без запис")
+
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        fmt = upload.name.rsplit('.', 1)[-1].lower()
+        if fmt not in ('csv', 'json', 'jsonl'):
+            raise forms.ValidationError("Поддържат се само .csv, .json и .jsonl файлове.")
+        upload.import_format = fmt
+        return upload
 
 
 class EventRegistrationForm(forms.ModelForm):
     class Meta:
         model = EventRegistration
-        fields = ['full_name', 'child_name', 'child_age']
+        fields = ['full_name', 'child_name', 'child_age', 'idempotency_key']
         widgets = {
+            'idempotency_key': forms.HiddenInput(),
             'full_name': forms.TextInput(attrs={'placeholder': 'Три имена'}),
             'child_name': forms.TextInput(attrs={'placeholder': 'Две имена на детето'}),
             'child_age': forms.NumberInput(attrs={'min': 0, 'placeholder': 'Възраст'}),
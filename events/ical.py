@@ -0,0 +1,98 @@
+import hashlib
+from datetime import timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+
+PRODID = '-//LuxeLadies//Events//BG'
+# part of the fragment cache keys and the ETags: bump it when the output format changes
+FORMAT_VERSION = 1
+FRAGMENT_TTL = 7 * 24 * 60 * 60
+
+
+def _escape(text) -> str:
+    """TEXT value escaping of RFC 5545 3.3.11."""
+    text = str(text).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+    return text.replace('\r\n', '\\n').replace('\n', '\\n').replace('\r', '\\n')
+
+
+def _fold(line) -> str:
+    """Content lines longer than 75 octets continue after CRLF + space, never inside a UTF-8 character."""
+    data = line.encode('utf-8')
+    parts, start, limit = [], 0, 75
+    while len(data) - start > limit:
+        end = start + limit
+        while data[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(data[start:end].decode('utf-8'))
+        start, limit = end, 74
+    parts.append(data[start:].decode('utf-8'))
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _utc(value) -> str:
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def render_vevent(event) -> str:
+    """The VEVENT of one event; it only depends on the event row, so it is cached per updated_at."""
+    duration = timedelta(minutes=getattr(settings, 'CALENDAR_EVENT_MINUTES', 120))
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:event-{event.pk}@luxeladies',
+        f'DTSTAMP:{_utc(event.updated_at)}',
+        f'LAST-MODIFIED:{_utc(event.updated_at)}',
+        f'DTSTART:{_utc(event.date_time)}',
+        f'DTEND:{_utc(event.date_time + duration)}',
+        f'SUMMARY:{_escape(event.title)}',
+        f'LOCATION:{_escape(f"{event.location_details}, {event.city}")}',
+        f'DESCRIPTION:{_escape(event.description)}',
+    ]
+    site_url = getattr(settings, 'SITE_URL', '')
+    if site_url:
+        lines.append(f"URL:{site_url.rstrip('/')}{reverse('event_detail', args=[event.pk])}")
+    lines.append('END:VEVENT')
+    return ''.join(_fold(line) for line in lines)
+
+
+def _fragment_key(event_id, updated_at) -> str:
+    return f"ics:{FORMAT_VERSION}:{event_id}:{updated_at.timestamp():.6f}"
+
+
+def vevents(entries, load_events) -> list[str]:
+    """
+    The VEVENTs for (event id, updated_at) pairs, in order. Cached fragments are read
+    with one get_many; only the events edited since they were cached are loaded (with
+    load_events(ids) -> events) and rendered.
+    """
+    keys = [_fragment_key(event_id, updated_at) for event_id, updated_at in entries]
+    cached = cache.get_many(keys)
+    missing = {event_id for (event_id, _), key in zip(entries, keys) if key not in cached}
+    if missing:
+        rendered = {
+            _fragment_key(event.pk, event.updated_at): render_vevent(event)
+            for event in load_events(missing)
+        }
+        cache.set_many(rendered, FRAGMENT_TTL)
+        cached.update(rendered)
+    return [cached[key] for key in keys if key in cached]
+
+
+def calendar(fragments, name='LuxeLadies') -> str:
+    head = ''.join(_fold(line) for line in [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODID}',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{_escape(name)}',
+    ])
+    return head + ''.join(fragments) + 'END:VCALENDAR\r\n'
+
+
+def etag(entries) -> str:
+    """ETag of a calendar made of these (event id, updated_at) pairs."""
+    digest = hashlib.sha1(FORMAT_VERSION.to_bytes(2, 'big'))
+    for event_id, updated_at in entries:
+        digest.update(f"{event_id}:{updated_at.timestamp():.6f};".encode())
+    return f'"{digest.hexdigest()}"'
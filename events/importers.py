@@ -0,0 +1,191 @@
+import csv
+import io
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from core.forms import invalidate_interest_choices
+from core.models import Interest
+from .models import Event
+
+FIELDS = ['title', 'description', 'date_time', 'city', 'location', 'capacity', 'price', 'kid_friendly', 'interests']
+# alternative column names accepted in the files
+ALIASES = {'location_details': 'location', 'is_kid_friendly': 'kid_friendly'}
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'да', 'x'}
+DATE_FORMATS = ['%d.%m.%Y %H:%M', '%d.%m.%Y %H:%M:%S']
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.interests_created = 0
+        # (line/position in the file, message)
+        self.errors = []
+
+    def __bool__(self):
+        return not self.errors
+
+
+def read_rows(fileobj, fmt):
+    """
+    Yields (line number, dict) from a CSV, JSON array or JSON Lines file (bytes or text).
+    CSV and JSON Lines are read row by row; a JSON array is parsed as a whole.
+    """
+    if isinstance(fileobj.read(0), bytes):
+        fileobj = io.TextIOWrapper(fileobj, encoding='utf-8-sig')
+
+    if fmt == 'csv':
+        # line 1 is the header
+        for n, row in enumerate(csv.DictReader(fileobj), 2):
+            yield n, row
+    elif fmt == 'jsonl':
+        for n, line in enumerate(fileobj, 1):
+            if line.strip():
+                yield n, json.loads(line)
+    elif fmt == 'json':
+        data = json.load(fileobj)
+        if isinstance(data, dict):
+            data = data.get('events', [])
+        if not isinstance(data, list):
+            raise ValueError("JSON must be an array or an object with an 'events' array")
+        for n, row in enumerate(data, 1):
+            yield n, row
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
+
+
+def _parse_date_time(value):
+    value = str(value).strip()
+    dt = parse_datetime(value)
+    if dt is None:
+        for fmt in DATE_FORMATS:
+            try:
+                dt = datetime.strptime(value, fmt)
+                break
+            except ValueError:
+                continue
+    if dt is None:
+        raise ValueError(f"невалидна дата и час „{value}“")
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return dt
+
+
+def _parse_interests(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.replace('|', ';').split(';')
+    elif not isinstance(value, (list, tuple)):
+        raise ValueError(f"невалидни интереси „{value}“")
+    return list(dict.fromkeys(str(name).strip() for name in value if str(name).strip()))
+
+
+def validate_row(raw):
+    """Returns (cleaned row, list of errors) for one row of the file."""
+    if not isinstance(raw, dict):
+        return None, ["редът не е обект"]
+    row = {ALIASES.get(key.strip(), key.strip()): value for key, value in raw.items() if key}
+    errors = []
+
+    def text(name, max_length, required=True):
+        value = str(row.get(name) or '').strip()
+        if required and not value:
+            errors.append(f"липсва {name}")
+        elif len(value) > max_length:
+            errors.append(f"{name} е по-дълго от {max_length} знака")
+        return value
+
+    cleaned = {
+        'title': text('title', 200),
+        'description': text('description', 100_000, required=False),
+        'city': text('city', 100),
+        'location_details': text('location', 300),
+    }
+
+    try:
+        cleaned['date_time'] = _parse_date_time(row.get('date_time') or '')
+    except ValueError as exc:
+        errors.append(str(exc))
+
+    try:
+        cleaned['capacity'] = int(row.get('capacity'))
+        if cleaned['capacity'] <= 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        errors.append(f"невалиден капацитет „{row.get('capacity')}“")
+
+    try:
+        price = Decimal(str(row.get('price') or 0).replace(',', '.'))
+        if price < 0 or price >= 10_000:
+            raise InvalidOperation
+        cleaned['price'] = price.quantize(Decimal('0.01'))
+    except InvalidOperation:
+        errors.append(f"невалидна цена „{row.get('price')}“")
+
+    kid = row.get('kid_friendly')
+    cleaned['is_kid_friendly'] = kid if isinstance(kid, bool) else str(kid or '').strip().lower() in TRUE_VALUES
+    try:
+        cleaned['interests'] = _parse_interests(row.get('interests'))
+    except ValueError as exc:
+        cleaned['interests'] = []
+        errors.append(str(exc))
+    max_length = Interest._meta.get_field('name').max_length
+    for name in cleaned['interests']:
+        if len(name) > max_length:
+            errors.append(f"интересът „{name[:30]}…“ е по-дълъг от {max_length} знака")
+    return cleaned, errors
+
+
+def _resolve_interests(names):
+    """name -> Interest id for all names, creating the missing ones with one bulk_create."""
+    ids = {}
+    for interest_id, name in Interest.objects.filter(name__in=names).order_by('id').values_list('id', 'name'):
+        ids.setdefault(name, interest_id)
+    missing = [Interest(name=name) for name in names if name not in ids]
+    if missing:
+        Interest.objects.bulk_create(missing)
+        invalidate_interest_choices()
+    ids.update({interest.name: interest.id for interest in missing})
+    return ids, len(missing)
+
+
+def import_events(rows, batch_size=1000, dry_run=False):
+    """
+    Validates all rows first and reports every error with its line.
+    Only a file without errors is written: the interests are resolved with one
+    lookup and one bulk_create, the events and the event/interest links with
+    one bulk_create each (in batches of batch_size), all in one transaction.
+    """
+    result = ImportResult()
+    valid = []
+    for line, raw in rows:
+        cleaned, errors = validate_row(raw)
+        if errors:
+            result.errors.extend((line, message) for message in errors)
+        else:
+            valid.append(cleaned)
+
+    if result.errors or dry_run:
+        return result
+
+    names = list(dict.fromkeys(name for row in valid for name in row['interests']))
+    EventInterest = Event.interests.through
+    with transaction.atomic():
+        interest_ids, result.interests_created = _resolve_interests(names)
+        events = Event.objects.bulk_create(
+            [Event(**{k: v for k, v in row.items() if k != 'interests'}) for row in valid],
+            batch_size=batch_size,
+        )
+        EventInterest.objects.bulk_create(
+            [
+                EventInterest(event_id=event.id, interest_id=interest_ids[name])
+                for event, row in zip(events, valid)
+                for name in row['interests']
+            ],
+            batch_size=batch_size,
+        )
+    result.created = len(events)
+    return result
@@ -2,57 +2,38 @@ from datetime import timedelta
 from decimal import Decimal, ROUND_HALF_UP
 from django.conf import settings
 from django.core.cache import cache
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
 from django.utils import timezone
+from core import audit
+from core.approvals import approve
+from core.models import AuditEntry
+from core.emails import send_queued_emails
+from core.notifications import dispatch, send_due_notifications
+from .analytics import update_rollups
+from .locks import leased_job, ensure_lease_held
+from .metrics import incr
+from .series import materialize_event_series
 
 
 def _already_sent_cache_key(reg_id: int, event_ts: int, label: str) -> str:
     return f"evrem:{reg_id}:{event_ts}:{label}"
 
 
-def _send_reminder_email(reg, label: str):
-    user = reg.user
-    event = reg.event
-    if not user or not user.email:
-        return
-
-    prefs = getattr(user, "notificationsettings", None)
-    if prefs and not prefs.email_event_reminders:
-        return
-
+def _reminder(reg, label: str):
+    """The dispatcher notification of one reminder."""
     rate = Decimal(getattr(settings, "EVENTS_EUR_RATE", "0.51"))
-    price_eur = (Decimal(event.price_bgn) * rate).quantize(Decimal("0.1"), rounding=ROUND_HALF_UP)
-
-    ctx = {
-        "recipient_name": user.first_name or user.username,
-        "event": event,
-        "reg": reg,
-        "label": label,
-        "price_eur": price_eur,
-    }
-
-    subject = f"Напомняне: {event.title} – скоро започва"
-    txt = render_to_string("email/event_reminder.txt", ctx)
-    html = render_to_string("email/event_reminder.html", ctx)
-
-    email = EmailMultiAlternatives(
-        subject=subject,
-        body=txt,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        to=[user.email],
-    )
-    email.attach_alternative(html, "text/html")
-    email.send(fail_silently=True)
+    price_eur = (Decimal(reg.event.price) * rate).quantize(Decimal("0.1"), rounding=ROUND_HALF_UP)
+    return (reg.user, "event_reminder", reg.event, {"label": label, "price_eur": str(price_eur)})
 
 
+@leased_job(interval_seconds=5 * 60)
 def send_event_reminders_job():
     """
     Стартира се на всеки 5 мин. Праща напомняния:
       - 5 дни преди
       - 1 ден преди
       - 1 час преди
-    Избягва дублиране чрез cache ключове (ASCII).
+    Избягва дублиране чрез cache ключове (ASCII), а leased_job гарантира,
+    че при няколко node-а задачата се изпълнява само веднъж на интервал.
     """
     now = timezone.now()
 
@@ -74,7 +55,9 @@ def send_event_reminders_job():
 
     tolerance = timedelta(minutes=3)
 
+    due = {}
     for reg in approved_qs:
+        incr("rows_scanned")
         event_dt = reg.event.date_time
         remaining = event_dt - now
         event_ts = int(event_dt.timestamp())
@@ -82,8 +65,69 @@ def send_event_reminders_job():
         for label, delta in windows:
             if abs(remaining - delta) <= tolerance:
                 key = _already_sent_cache_key(reg.id, event_ts, label)
-                if cache.get(key):
-                    continue
+                if not cache.get(key):
+                    due[key] = _reminder(reg, label)
+
+    if due:
+        # one preference lookup for all the recipients; the turned off reminders are dropped there
+        ensure_lease_held()
+        dispatch(due.values())
+        cache.set_many(dict.fromkeys(due, 1), timeout=24 * 60 * 60)
+
+
+@leased_job(interval_seconds=60 * 60)
+def materialize_event_series_job():
+    """
+    Creates the occurrences of the recurring series for the next SERIES_MATERIALIZE_DAYS.
+    """
+    materialize_event_series()
+
+
+@leased_job(interval_seconds=60)
+def send_queued_emails_job():
+    """
+    Sends the emails queued by bulk operations (core.emails.queue_templated_emails),
+    one batch of EMAIL_QUEUE_BATCH per run over a single connection.
+    """
+    ensure_lease_held()
+    incr("emails_sent", send_queued_emails())
+
 
-                _send_reminder_email(reg, label)
-                cache.set(key, 1, timeout=24 * 60 * 60)
+@leased_job(interval_seconds=60)
+def send_notifications_job():
+    """
+    Sends the member notifications whose window has ended (core.notifications),
+    one email per member: the notification itself or a digest of all of them.
+    """
+    ensure_lease_held()
+    incr("emails_sent", send_due_notifications())
+
+
+@leased_job(interval_seconds=15 * 60)
+def auto_approve_members_job():
+    """
+    With AUTO_APPROVE_ENABLE, approves the pending members that pass the approval
+    rules (core.approvals), the same way as the batch approval in the admin panel.
+    """
+    if not getattr(settings, "AUTO_APPROVE_ENABLE", False):
+        return
+    incr("items_processed", approve(source=AuditEntry.SOURCE_AUTO))
+
+
+@leased_job(interval_seconds=15 * 60)
+def rollup_analytics_job():
+    """
+    Brings the analytics rollups (events.analytics) up to date with the rows changed
+    since the previous run; the admin analytics dashboard reads only those tables.
+    """
+    update_rollups()
+
+
+@leased_job(interval_seconds=24 * 60 * 60)
+def archive_audit_log_job():
+    """
+    Moves the audit entries older than AUDIT_HOT_DAYS, whole months at a time, into
+    the packed monthly archives (core.audit.archive), so the audit table stays small.
+    """
+    cutoff = timezone.localdate() - timedelta(days=getattr(settings, "AUDIT_HOT_DAYS", 90))
+    incr("items_processed", audit.archive(audit.month_start(cutoff.replace(day=1))))
@@ -0,0 +1,192 @@
+import asyncio
+import json
+import logging
+import threading
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count, Q
+from core.db import close_stale_connections
+from .models import Event, EventRegistration
+
+logger = logging.getLogger(__name__)
+
+QUEUE_TOPIC = 'queue'
+
+
+def event_topic(event_id) -> str:
+    return f'event:{event_id}'
+
+
+def registration_queue_counts() -> dict:
+    """The pending/approved/rejected counters of the admin panel, in one query."""
+    return EventRegistration.objects.aggregate(
+        pending=Count('id', filter=Q(status='pending')),
+        approved=Count('id', filter=Q(status='approved')),
+        rejected=Count('id', filter=Q(status='rejected')),
+    )
+
+
+def seat_counts(event_ids) -> dict:
+    """event id -> free seats and waitlist length, for all events in one query."""
+    rows = (
+        Event.objects
+        .filter(pk__in=event_ids)
+        .annotate(
+            taken=Count('registrations', filter=Q(registrations__status__in=EventRegistration.ACTIVE_STATUSES)),
+            waitlisted=Count('registrations', filter=Q(registrations__status='waitlisted')),
+        )
+        .values_list('id', 'capacity', 'taken', 'waitlisted')
+    )
+    return {
+        event_id: {'event': event_id, 'free_spots': max(0, capacity - taken), 'waitlisted': waitlisted}
+        for event_id, capacity, taken, waitlisted in rows
+    }
+
+
+def snapshot(topics) -> dict:
+    """topic -> payload for the given topics, with at most two queries."""
+    event_ids = [int(topic.split(':', 1)[1]) for topic in topics if topic.startswith('event:')]
+    payloads = {event_topic(event_id): seats for event_id, seats in seat_counts(event_ids).items()} if event_ids else {}
+    if QUEUE_TOPIC in topics:
+        payloads[QUEUE_TOPIC] = registration_queue_counts()
+    return payloads
+
+
+def format_sse(topic, payload) -> str:
+    name = 'queue' if topic == QUEUE_TOPIC else 'seats'
+    return f"event: {name}\ndata: {json.dumps(payload)}\n\n"
+
+
+class Subscription:
+    """
+    One open stream. Only the newest payload per topic is kept, so a slow client
+    skips intermediate values instead of building up a backlog.
+    """
+    def __init__(self, topics):
+        self.topics = frozenset(topics)
+        self._pending = {}
+        self._ready = asyncio.Event()
+
+    def push(self, topic, payload):
+        self._pending[topic] = payload
+        self._ready.set()
+
+    async def next(self, timeout):
+        """The payloads changed since the last call; an empty dict after `timeout` seconds."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return {}
+        self._ready.clear()
+        pending, self._pending = self._pending, {}
+        return pending
+
+
+class LivePublisher:
+    """
+    Process-wide fan-out of the seat and queue counters to the open SSE streams.
+
+    Saves of registrations only mark their event dirty (from any thread). The first
+    mark schedules a flush on the event loop after LIVE_COALESCE_MS; the flush
+    recomputes every dirty topic that has subscribers with one snapshot() and pushes
+    the values that changed to all their subscribers. However many tabs are open,
+    a burst of registrations costs one or two queries.
+
+    Changes made by other processes are picked up by a refresh of all subscribed
+    topics every LIVE_REFRESH_SECONDS.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._subscribers = {}
+        self._dirty = set()
+        self._flush_scheduled = False
+        self._refresher = None
+        self.latest = {}
+
+    def subscribe(self, topics) -> Subscription:
+        """Called from the event loop that serves the streams."""
+        sub = Subscription(topics)
+        with self._lock:
+            loop = asyncio.get_running_loop()
+            if loop is not self._loop:
+                # first stream, or the server started a new loop: nothing scheduled on the old one counts
+                self._loop, self._flush_scheduled, self._refresher = loop, False, None
+            for topic in sub.topics:
+                self._subscribers.setdefault(topic, set()).add(sub)
+        for topic in sub.topics:
+            if topic in self.latest:
+                sub.push(topic, self.latest[topic])
+        self.mark_dirty(topics=[topic for topic in sub.topics if topic not in self.latest])
+        if self._refresher is None or self._refresher.done():
+            self._refresher = self._loop.create_task(self._refresh())
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            for topic in sub.topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(sub)
+                    if not subscribers:
+                        del self._subscribers[topic]
+                        self.latest.pop(topic, None)
+
+    def mark_dirty(self, event_ids=(), topics=()):
+        """Thread-safe; a no-op while nobody in this process is subscribed."""
+        wanted = {event_topic(event_id) for event_id in event_ids} | set(topics)
+        if event_ids:
+            wanted.add(QUEUE_TOPIC)
+        with self._lock:
+            wanted &= self._subscribers.keys()
+            if not wanted or self._loop is None or self._loop.is_closed():
+                return
+            self._dirty |= wanted
+            if self._flush_scheduled:
+                return
+            self._flush_scheduled = True
+            loop = self._loop
+        loop.call_soon_threadsafe(loop.create_task, self._flush())
+
+    async def _flush(self):
+        await asyncio.sleep(getattr(settings, 'LIVE_COALESCE_MS', 500) / 1000)
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            self._flush_scheduled = False
+        try:
+            payloads = await sync_to_async(self._snapshot)(dirty)
+        except Exception:
+            logger.exception("Live counters: snapshot of %s failed", sorted(dirty))
+            return
+        with self._lock:
+            targets = [
+                (topic, payload, list(self._subscribers.get(topic, ())))
+                for topic, payload in payloads.items()
+                if self.latest.get(topic) != payload
+            ]
+            for topic, payload, _ in targets:
+                self.latest[topic] = payload
+        for topic, payload, subscribers in targets:
+            for sub in subscribers:
+                sub.push(topic, payload)
+
+    @staticmethod
+    def _snapshot(topics):
+        # runs in the thread of sync_to_async, outside of any request
+        close_stale_connections()
+        try:
+            return snapshot(topics)
+        finally:
+            close_stale_connections()
+
+    async def _refresh(self):
+        while True:
+            await asyncio.sleep(getattr(settings, 'LIVE_REFRESH_SECONDS', 15))
+            with self._lock:
+                topics = list(self._subscribers)
+            if not topics:
+                return
+            self.mark_dirty(topics=topics)
+
+
+publisher = LivePublisher()
@@ -0,0 +1,133 @@
+import logging
+import os
+import socket
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import timedelta
+from functools import wraps
+from django.db.models import Case, F, Q, When
+from django.utils import timezone
+from core.db import close_stale_connections
+from .metrics import job_metrics, new_job_metrics, count_queries, is_slow
+from .models import JobLease, JobRun
+
+logger = logging.getLogger(__name__)
+
+# (lease name, fencing token) of the job running in the current thread
+current_lease = ContextVar('current_lease', default=None)
+
+
+class LeaseLost(Exception):
+    """Another node took over the lease while this run was still working."""
+
+
+def process_owner_id() -> str:
+    """Identifies this process among all nodes: host:pid."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def acquire_lease(name: str, owner: str, ttl: int):
+    """
+    Takes (or renews) the lease `name` for `ttl` seconds and returns its fencing token,
+    or None if somebody else holds it.
+    Succeeds if nobody holds it, the previous holder let it expire, or `owner` already holds it.
+    The check and the takeover are one UPDATE, so two processes can never both win.
+    """
+    now = timezone.now()
+    JobLease.objects.get_or_create(name=name, defaults={'expires_at': now})
+    updated = (
+        JobLease.objects
+        .filter(name=name)
+        .filter(Q(owner=owner) | Q(expires_at__lte=now))
+        .update(
+            owner=owner,
+            expires_at=now + timedelta(seconds=ttl),
+            token=Case(When(owner=owner, then=F('token')), default=F('token') + 1),
+        )
+    )
+    if updated != 1:
+        return None
+    return JobLease.objects.filter(name=name, owner=owner).values_list('token', flat=True).first()
+
+
+def release_lease(name: str, owner: str) -> None:
+    JobLease.objects.filter(name=name, owner=owner).update(owner='', expires_at=timezone.now())
+
+
+def ensure_lease_held() -> None:
+    """
+    Called by a job before a side effect (e.g. sending an email).
+    Raises LeaseLost if the fencing token of the current run is no longer the current one.
+    Outside of a leased job it does nothing.
+    """
+    lease = current_lease.get()
+    if lease is None:
+        return
+    name, token = lease
+    if not JobLease.objects.filter(name=name, token=token).exists():
+        raise LeaseLost(f"{name}: token {token} is stale")
+
+
+def leased_job(interval_seconds: int):
+    """
+    Decorator for APScheduler jobs: the job runs at most once per interval
+    across all nodes. Every attempt takes a fresh lease that is kept (not released)
+    for 90% of the interval, so the other nodes firing in the same interval skip it.
+    Each attempt is recorded in JobRun together with its duration, query count
+    and the counters the job reported through events.metrics.incr.
+    """
+    ttl = max(1, int(interval_seconds * 0.9))
+
+    def decorator(func):
+        name = func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            close_stale_connections()
+            owner = f"{process_owner_id()}:{uuid.uuid4().hex[:8]}"
+            started_at = timezone.now()
+            start = time.perf_counter()
+            try:
+                token = acquire_lease(name, owner, ttl)
+                if token is None:
+                    JobRun.objects.create(job_name=name, owner=owner, started_at=started_at, outcome='skipped')
+                    return None
+
+                outcome, error = 'success', ''
+                metrics = new_job_metrics()
+                ctx = current_lease.set((name, token))
+                metrics_ctx = job_metrics.set(metrics)
+                try:
+                    with count_queries(metrics):
+                        return func(*args, **kwargs)
+                except LeaseLost as exc:
+                    outcome, error = 'fenced', str(exc)
+                    logger.warning("Job %s stopped: %s", name, exc)
+                except Exception as exc:
+                    outcome, error = 'error', repr(exc)
+                    raise
+                finally:
+                    job_metrics.reset(metrics_ctx)
+                    current_lease.reset(ctx)
+                    duration_ms = int((time.perf_counter() - start) * 1000)
+                    slow = is_slow(duration_ms, interval_seconds)
+                    if slow:
+                        logger.warning("Job %s took %d ms of its %d s interval.", name, duration_ms, interval_seconds)
+                    JobRun.objects.create(
+                        job_name=name,
+                        owner=owner,
+                        token=token,
+                        started_at=started_at,
+                        duration_ms=duration_ms,
+                        outcome=outcome,
+                        error=error,
+                        slow=slow,
+                        **metrics,
+                    )
+            finally:
+                close_stale_connections()
+
+        return wrapper
+
+    return decorator
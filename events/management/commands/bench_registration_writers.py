@@ -0,0 +1,115 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, OperationalError
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import Questionnaire
+from events.metrics import percentile
+from events.models import Event, EventRegistration
+
+User = get_user_model()
+
+BENCH_PREFIX = "bench_writer_"
+
+
+class Command(BaseCommand):
+    help = "Пуска паралелни писачи срещу записването за събитие и мери пропускателна способност и 'database is locked' грешки"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=8, help="Брой паралелни нишки")
+        parser.add_argument("--per-writer", type=int, default=25, help="Записвания на нишка")
+        parser.add_argument("--capacity", type=int, help="Капацитет на събитието (по подразбиране колкото са заявките)")
+        parser.add_argument("--keep", action="store_true", help="Не изтривай тестовите данни")
+
+    def handle(self, *args, **opts):
+        writers = opts["writers"]
+        per_writer = opts["per_writer"]
+        total = writers * per_writer
+
+        self._cleanup()
+        event = Event.objects.create(
+            title=f"{BENCH_PREFIX}event",
+            description="",
+            city="София",
+            location_details="-",
+            date_time=timezone.now() + timedelta(days=30),
+            capacity=opts["capacity"] if opts["capacity"] is not None else total,
+        )
+        User.objects.bulk_create([
+            User(username=f"{BENCH_PREFIX}{i}", email=f"{BENCH_PREFIX}{i}@example.com",
+                 password="!", is_approved=True, age=25)
+            for i in range(total)
+        ])
+        users = list(User.objects.filter(username__startswith=BENCH_PREFIX).order_by("id"))
+        Questionnaire.objects.bulk_create([
+            Questionnaire(user=u, full_name=u.username, city="София", can_travel_to_sofia=True,
+                          about="", has_children=False, wants_events_with_children=False,
+                          why_join="", how_did_you_hear="instagram", completed=True)
+            for u in users
+        ])
+        connection.close()
+
+        url = reverse("register_for_event", args=[event.id])
+        latencies = []
+        errors = {"locked": 0, "other": 0}
+        lock = threading.Lock()
+
+        def worker(chunk):
+            client = Client()
+            try:
+                for user in chunk:
+                    client.force_login(user)
+                    start = time.perf_counter()
+                    try:
+                        resp = client.post(url, data={"full_name": user.username})
+                        ok = resp.status_code in (200, 302)
+                    except OperationalError as exc:
+                        ok = False
+                        with lock:
+                            errors["locked" if "locked" in str(exc) else "other"] += 1
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        if ok:
+                            latencies.append(elapsed)
+            finally:
+                connection.close()
+
+        setup_test_environment()
+        try:
+            threads = [
+                threading.Thread(target=worker, args=(users[i::writers],))
+                for i in range(writers)
+            ]
+            wall = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            wall = time.perf_counter() - wall
+        finally:
+            teardown_test_environment()
+
+        created = EventRegistration.objects.filter(event=event).count()
+        waitlisted = EventRegistration.objects.filter(event=event, status="waitlisted").count()
+        latencies.sort()
+        p50, p95 = percentile(latencies, 50), percentile(latencies, 95)
+
+        self.stdout.write(f"Писачи: {writers}, заявки: {total}, време: {wall:.2f} s")
+        self.stdout.write(f"Записвания/сек: {created / wall:.1f}")
+        self.stdout.write(f"p50: {p50 * 1000:.1f} ms, p95: {p95 * 1000:.1f} ms")
+        self.stdout.write(f"Създадени: {created}, 'locked' грешки: {errors['locked']}, други: {errors['other']}")
+        self.stdout.write(f"Заети места: {created - waitlisted}/{event.capacity}, в листата на чакащите: {waitlisted}")
+
+        if not opts["keep"]:
+            self._cleanup()
+
+    def _cleanup(self):
+        Event.objects.filter(title__startswith=BENCH_PREFIX).delete()
+        User.objects.filter(username__startswith=BENCH_PREFIX).delete()
@@ -0,0 +1,47 @@
+import csv
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from events.importers import import_events, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Импортира събития от CSV, JSON или JSON Lines файл "
+        "(title, description, date_time, city, location, capacity, price, kid_friendly, interests). "
+        "Файл с грешки не се записва – всички грешни редове се изброяват."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Път до файла")
+        parser.add_argument("--format", choices=["csv", "json", "jsonl"], help="По подразбиране според разширението")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--dry-run", action="store_true", help="Само проверява файла")
+
+    def handle(self, *args, **opts):
+        path = opts["path"]
+        fmt = opts["format"] or os.path.splitext(path)[1].lstrip(".").lower()
+        if fmt not in ("csv", "json", "jsonl"):
+            raise CommandError("Непознат формат – използвайте --format csv|json|jsonl")
+
+        start = time.perf_counter()
+        try:
+            with open(path, encoding="utf-8-sig", newline="") as fh:
+                result = import_events(read_rows(fh, fmt), batch_size=opts["batch_size"], dry_run=opts["dry_run"])
+        except (OSError, ValueError, csv.Error) as exc:
+            raise CommandError(f"Файлът не може да бъде прочетен: {exc}")
+        elapsed = time.perf_counter() - start
+
+        for line, message in result.errors:
+            self.stderr.write(f"Ред {line}: {message}")
+        if result.errors:
+            raise CommandError(f"{len(result.errors)} грешки – нищо не е импортирано.")
+
+        if opts["dry_run"]:
+            self.stdout.write(self.style.SUCCESS(f"Файлът е валиден ({elapsed:.2f} s)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Импортирани {result.created} събития, нови интереси: {result.interests_created} ({elapsed:.2f} s)."
+            ))
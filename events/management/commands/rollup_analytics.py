@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from events.analytics import update_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Обновява обобщените таблици на аналитиката с променените след последното изпълнение "
+        "редове (както rollup_analytics_job). С --rebuild ги изчислява наново от всички данни."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true", help="Преизчислява всички дни и събития")
+
+    def handle(self, *args, **opts):
+        start = time.perf_counter()
+        stats = update_rollups(rebuild=opts["rebuild"])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Преизчислени дни: потребители {stats['signup_days']}, заявки {stats['registration_days']}, "
+            f"въпросник {stats['answer_days']}; събития: {stats['events']} ({elapsed:.2f} s)."
+        ))
@@ -0,0 +1,90 @@
+import logging
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from events.locks import acquire_lease, release_lease, process_owner_id
+from events.scheduler import SCHEDULER_LEASE, build_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Стартира APScheduler като отделен дълготраен процес. "
+        "Само процесът, държащ lease-а в базата, изпълнява задачите; останалите чакат в резерва."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lease-ttl", type=int, default=60,
+                            help="Секунди, за които lease-ът е валиден без подновяване")
+        parser.add_argument("--retry", type=int, default=15,
+                            help="През колко секунди резервен процес опитва да поеме lease-а")
+
+    def handle(self, *args, **opts):
+        if not getattr(settings, "APSCHEDULER_ENABLE", True):
+            self.stdout.write(self.style.WARNING("APSCHEDULER_ENABLE е изключен – няма какво да се стартира."))
+            return
+
+        ttl = opts["lease_ttl"]
+        owner = process_owner_id()
+        stop = threading.Event()
+        scheduler = None
+
+        def _shutdown(signum, frame):
+            stop.set()
+            if scheduler is not None and scheduler.running:
+                # waits for the running jobs to finish
+                scheduler.shutdown(wait=True)
+
+        signal.signal(signal.SIGTERM, _shutdown)
+        signal.signal(signal.SIGINT, _shutdown)
+
+        self.stdout.write(f"[{owner}] Чакам lease '{SCHEDULER_LEASE}'...")
+        while not stop.is_set():
+            if acquire_lease(SCHEDULER_LEASE, owner, ttl):
+                break
+            close_old_connections()
+            stop.wait(opts["retry"])
+        if stop.is_set():
+            return
+
+        scheduler = build_scheduler()
+        interval = max(1, ttl // 3)
+
+        def _renew_lease():
+            # a plain thread, so the heartbeat is not logged as a DjangoJobExecution
+            renewed_at = time.monotonic()
+            while not stop.wait(interval):
+                attempt_at = time.monotonic()
+                try:
+                    renewed = acquire_lease(SCHEDULER_LEASE, owner, ttl)
+                except Exception:
+                    # e.g. "database is locked" or a dropped connection: the lease is still ours
+                    # until it expires, so retry while the next attempt comes before that
+                    logger.exception("Renewing the scheduler lease failed for %s.", owner)
+                    if time.monotonic() + interval < renewed_at + ttl:
+                        continue
+                    renewed = None
+                finally:
+                    close_old_connections()
+                if not renewed:
+                    logger.error("Scheduler lease lost by %s, stopping.", owner)
+                    stop.set()
+                    scheduler.shutdown(wait=False)
+                    return
+                renewed_at = attempt_at
+
+        threading.Thread(target=_renew_lease, name="scheduler-lease", daemon=True).start()
+
+        self.stdout.write(self.style.SUCCESS(f"[{owner}] Lease взет, scheduler-ът стартира."))
+        try:
+            scheduler.start()
+        finally:
+            stop.set()
+            release_lease(SCHEDULER_LEASE, owner)
+            self.stdout.write(f"[{owner}] Scheduler-ът е спрян, lease-ът е освободен.")
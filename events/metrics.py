@@ -0,0 +1,102 @@
+import math
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from .models import JobRun, JobRunDaily
+
+# counters of the job running in the current thread (set by events.locks.leased_job)
+job_metrics = ContextVar('job_metrics', default=None)
+
+
+def new_job_metrics() -> dict:
+    return {'queries': 0, 'rows_scanned': 0, 'items_processed': 0, 'emails_sent': 0}
+
+
+def incr(name: str, amount: int = 1) -> None:
+    """Adds to a counter of the current job run. Outside of a job it does nothing."""
+    metrics = job_metrics.get()
+    if metrics is not None:
+        metrics[name] += amount
+
+
+@contextmanager
+def count_queries(metrics: dict):
+    def wrapper(execute, sql, params, many, context):
+        metrics['queries'] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield
+
+
+def is_slow(duration_ms: int, interval_seconds: int) -> bool:
+    """A run is slow once it takes JOB_SLOW_RATIO (default 80%) of its interval."""
+    ratio = float(getattr(settings, "JOB_SLOW_RATIO", 0.8))
+    return duration_ms >= interval_seconds * 1000 * ratio
+
+
+def percentile(sorted_values, pct):
+    """Nearest rank: the smallest value that at least pct% of the values do not exceed."""
+    if not sorted_values:
+        return 0
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def rollup_day(day) -> int:
+    """
+    (Re)computes the JobRunDaily rows for `day` from JobRun. Returns how many jobs were rolled up.
+    """
+    runs = JobRun.objects.filter(started_at__date=day)
+    totals = (
+        runs.values('job_name')
+        .annotate(
+            runs=Count('id'),
+            errors=Count('id', filter=Q(outcome__in=['error', 'fenced'])),
+            skipped=Count('id', filter=Q(outcome='skipped')),
+            slow_runs=Count('id', filter=Q(slow=True)),
+            queries=Sum('queries'),
+            rows_scanned=Sum('rows_scanned'),
+            items_processed=Sum('items_processed'),
+            emails_sent=Sum('emails_sent'),
+        )
+    )
+
+    durations = {}
+    for job_name, duration in (
+        runs.exclude(outcome='skipped').order_by('duration_ms').values_list('job_name', 'duration_ms')
+    ):
+        durations.setdefault(job_name, []).append(duration)
+
+    for row in totals:
+        values = durations.get(row['job_name'], [])
+        executed = len(values)
+        JobRunDaily.objects.update_or_create(
+            job_name=row['job_name'],
+            day=day,
+            defaults={
+                'runs': row['runs'],
+                'errors': row['errors'],
+                'skipped': row['skipped'],
+                'slow_runs': row['slow_runs'],
+                'p50_ms': percentile(values, 50),
+                'p95_ms': percentile(values, 95),
+                'max_ms': values[-1] if values else 0,
+                'avg_queries': (row['queries'] or 0) // executed if executed else 0,
+                'rows_scanned': row['rows_scanned'] or 0,
+                'items_processed': row['items_processed'] or 0,
+                'emails_sent': row['emails_sent'] or 0,
+            },
+        )
+    return len(totals)
+
+
+def rollup_recent_job_runs() -> None:
+    """Rolls up today and yesterday, so the last runs before midnight are not missed."""
+    today = timezone.localdate()
+    for day in (today - timedelta(days=1), today):
+        rollup_day(day)
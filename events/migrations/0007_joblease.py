@@ -0,0 +1,34 @@
+# Generated by Django 5.1.15 on 2026-10-18 22:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("events", "0006_alter_eventregistration_options_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="JobLease",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100, unique=True)),
+                ("owner", models.CharField(blank=True, default="", max_length=255)),
+                ("expires_at", models.DateTimeField()),
+            ],
+            options={
+                "verbose_name": "Заключване на задача",
+                "verbose_name_plural": "Заключвания на задачи",
+            },
+        ),
+    ]
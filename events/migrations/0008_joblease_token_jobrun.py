@@ -0,0 +1,61 @@
+# Generated by Django 5.1.15 on 2026-10-18 22:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("events", "0007_joblease"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="joblease",
+            name="token",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name="JobRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("job_name", models.CharField(max_length=100)),
+                ("owner", models.CharField(max_length=255)),
+                ("token", models.PositiveBigIntegerField(blank=True, null=True)),
+                ("started_at", models.DateTimeField()),
+                ("duration_ms", models.PositiveIntegerField(default=0)),
+                (
+                    "outcome",
+                    models.CharField(
+                        choices=[
+                            ("success", "Успешно"),
+                            ("error", "Грешка"),
+                            ("skipped", "Пропуснато (lease-ът е зает)"),
+                            ("fenced", "Прекъснато (lease-ът е изгубен)"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("error", models.TextField(blank=True, default="")),
+            ],
+            options={
+                "verbose_name": "Изпълнение на задача",
+                "verbose_name_plural": "Изпълнения на задачи",
+                "ordering": ["-started_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["job_name", "started_at"],
+                        name="events_jobr_job_nam_323681_idx",
+                    )
+                ],
+            },
+        ),
+    ]
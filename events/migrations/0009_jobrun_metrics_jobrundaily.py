@@ -0,0 +1,65 @@
+# Generated by Django 5.1.15 on 2026-10-18 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("events", "0008_joblease_token_jobrun"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="jobrun",
+            name="emails_sent",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="jobrun",
+            name="queries",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="jobrun",
+            name="rows_scanned",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="jobrun",
+            name="slow",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name="JobRunDaily",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("job_name", models.CharField(max_length=100)),
+                ("day", models.DateField()),
+                ("runs", models.PositiveIntegerField(default=0)),
+                ("errors", models.PositiveIntegerField(default=0)),
+                ("skipped", models.PositiveIntegerField(default=0)),
+                ("slow_runs", models.PositiveIntegerField(default=0)),
+                ("p50_ms", models.PositiveIntegerField(default=0)),
+                ("p95_ms", models.PositiveIntegerField(default=0)),
+                ("max_ms", models.PositiveIntegerField(default=0)),
+                ("avg_queries", models.PositiveIntegerField(default=0)),
+                ("rows_scanned", models.PositiveIntegerField(default=0)),
+                ("emails_sent", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "Дневна статистика на задача",
+                "verbose_name_plural": "Дневни статистики на задачи",
+                "ordering": ["-day", "job_name"],
+                "unique_together": {("job_name", "day")},
+            },
+        ),
+    ]
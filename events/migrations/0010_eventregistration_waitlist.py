@@ -0,0 +1,48 @@
+# Generated by Django 5.1.15 on 2026-10-18 22:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("events", "0009_jobrun_metrics_jobrundaily"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="eventregistration",
+            name="idempotency_key",
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AlterField(
+            model_name="eventregistration",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Очаква одобрение"),
+                    ("approved", "Одобрено"),
+                    ("rejected", "Отказано"),
+                    ("waitlisted", "В листата на чакащите"),
+                ],
+                default="pending",
+                max_length=20,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="eventregistration",
+            index=models.Index(
+                fields=["event", "status", "created_at"],
+                name="events_even_event_i_6e879c_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="eventregistration",
+            constraint=models.UniqueConstraint(
+                fields=("user", "idempotency_key"),
+                name="unique_registration_idempotency_key",
+            ),
+        ),
+    ]
@@ -0,0 +1,139 @@
+# Generated by Django 5.1.15 on 2026-10-18 22:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0006_notificationsettings"),
+        ("events", "0010_eventregistration_waitlist"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EventSeries",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "title",
+                    models.CharField(
+                        max_length=200, verbose_name="Заглавие на събитието"
+                    ),
+                ),
+                ("description", models.TextField(verbose_name="Описание")),
+                ("city", models.CharField(max_length=100, verbose_name="Град")),
+                (
+                    "location_details",
+                    models.CharField(
+                        max_length=300, verbose_name="Точно местоположение"
+                    ),
+                ),
+                (
+                    "is_kid_friendly",
+                    models.BooleanField(
+                        default=False, verbose_name="Подходящо за деца"
+                    ),
+                ),
+                (
+                    "capacity",
+                    models.PositiveIntegerField(verbose_name="Максимален капацитет"),
+                ),
+                (
+                    "price",
+                    models.DecimalField(decimal_places=2, default=0.0, max_digits=6),
+                ),
+                ("starts_at", models.DateTimeField(verbose_name="Първа дата и час")),
+                (
+                    "frequency",
+                    models.CharField(
+                        choices=[
+                            ("DAILY", "Всеки ден"),
+                            ("WEEKLY", "Всяка седмица"),
+                            ("MONTHLY", "Всеки месец"),
+                        ],
+                        default="WEEKLY",
+                        max_length=10,
+                        verbose_name="Честота",
+                    ),
+                ),
+                (
+                    "interval",
+                    models.PositiveSmallIntegerField(
+                        default=1, verbose_name="На всеки (брой периоди)"
+                    ),
+                ),
+                (
+                    "by_weekday",
+                    models.CharField(
+                        blank=True,
+                        help_text="Само за седмични: MO,TU,WE,TH,FR,SA,SU (по подразбиране денят на първата дата)",
+                        max_length=30,
+                        verbose_name="Дни от седмицата",
+                    ),
+                ),
+                (
+                    "count",
+                    models.PositiveIntegerField(
+                        blank=True, null=True, verbose_name="Брой повторения"
+                    ),
+                ),
+                (
+                    "until",
+                    models.DateField(blank=True, null=True, verbose_name="До дата"),
+                ),
+                (
+                    "is_active",
+                    models.BooleanField(default=True, verbose_name="Активна"),
+                ),
+                (
+                    "materialized_until",
+                    models.DateTimeField(blank=True, editable=False, null=True),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "interests",
+                    models.ManyToManyField(
+                        blank=True,
+                        related_name="event_series",
+                        to="core.interest",
+                        verbose_name="Интереси",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Поредица от събития",
+                "verbose_name_plural": "Поредици от събития",
+            },
+        ),
+        migrations.AddField(
+            model_name="event",
+            name="series",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="occurrences",
+                to="events.eventseries",
+                verbose_name="Поредица",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="event",
+            constraint=models.UniqueConstraint(
+                fields=("series", "date_time"), name="unique_series_occurrence"
+            ),
+        ),
+    ]
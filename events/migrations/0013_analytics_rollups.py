@@ -0,0 +1,176 @@
+# Generated by Django 5.1.15 on 2026-10-18 23:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("events", "0012_event_updated_at_calendarfeed"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AnalyticsWatermark",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=50, unique=True)),
+                ("position", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "verbose_name": "Позиция на анализите",
+                "verbose_name_plural": "Позиции на анализите",
+            },
+        ),
+        migrations.CreateModel(
+            name="DailyProfileAnswer",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                (
+                    "question",
+                    models.CharField(
+                        choices=[
+                            ("channel", "Откъде научи"),
+                            ("city", "Град"),
+                            ("has_children", "Има деца"),
+                            ("interest", "Интерес"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("answer", models.CharField(max_length=255)),
+                ("count", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "Дневни отговори от въпросника",
+                "verbose_name_plural": "Дневни отговори от въпросника",
+            },
+        ),
+        migrations.CreateModel(
+            name="DailyRegistrations",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Очаква одобрение"),
+                            ("approved", "Одобрено"),
+                            ("rejected", "Отказано"),
+                            ("waitlisted", "В листата на чакащите"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("count", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "Дневни заявки за събития",
+                "verbose_name_plural": "Дневни заявки за събития",
+                "ordering": ["-day", "status"],
+            },
+        ),
+        migrations.CreateModel(
+            name="DailySignups",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(unique=True)),
+                ("signups", models.PositiveIntegerField(default=0)),
+                ("approvals", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "Дневни регистрации на членове",
+                "verbose_name_plural": "Дневни регистрации на членове",
+                "ordering": ["-day"],
+            },
+        ),
+        migrations.CreateModel(
+            name="EventFillRate",
+            fields=[
+                (
+                    "event",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="fill_rate",
+                        serialize=False,
+                        to="events.event",
+                    ),
+                ),
+                ("title", models.CharField(max_length=200)),
+                ("date_time", models.DateTimeField(db_index=True)),
+                ("capacity", models.PositiveIntegerField(default=0)),
+                ("approved", models.PositiveIntegerField(default=0)),
+                ("pending", models.PositiveIntegerField(default=0)),
+                ("waitlisted", models.PositiveIntegerField(default=0)),
+                ("rejected", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "Запълняемост на събитие",
+                "verbose_name_plural": "Запълняемост на събитията",
+                "ordering": ["date_time"],
+            },
+        ),
+        migrations.AddField(
+            model_name="eventregistration",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name="eventregistration",
+            index=models.Index(
+                fields=["created_at"], name="events_even_created_60dc75_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="dailyprofileanswer",
+            index=models.Index(
+                fields=["question", "day"], name="events_dail_questio_d144ec_idx"
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="dailyprofileanswer",
+            unique_together={("day", "question", "answer")},
+        ),
+        migrations.AlterUniqueTogether(
+            name="dailyregistrations",
+            unique_together={("day", "status")},
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.15 on 2026-10-18 23:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("events", "0013_analytics_rollups"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="jobrun",
+            name="items_processed",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="jobrundaily",
+            name="items_processed",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,3 +1,4 @@
+import secrets
 from django.db import models
 from django.conf import settings
 from decimal import Decimal, ROUND_HALF_UP
@@ -7,6 +8,85 @@ from core.models import Interest
 EUR_BGN = Decimal('1.95583')
 
 
+class EventSeries(models.Model):
+    """
+    Recurring event (e.g. a weekly meetup). Its Event occurrences are created
+    lazily, a rolling window ahead, by events.series.materialize_event_series.
+    The recurrence follows RRULE: FREQ, INTERVAL, BYDAY (weekly only), COUNT, UNTIL.
+    """
+    FREQUENCY_CHOICES = [
+        ('DAILY', 'Всеки ден'),
+        ('WEEKLY', 'Всяка седмица'),
+        ('MONTHLY', 'Всеки месец'),
+    ]
+    WEEKDAYS = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+
+    title = models.CharField(max_length=200, verbose_name="Заглавие на събитието")
+    description = models.TextField(verbose_name="Описание")
+    city = models.CharField(max_length=100, verbose_name="Град")
+    location_details = models.CharField(max_length=300, verbose_name="Точно местоположение")
+    is_kid_friendly = models.BooleanField(default=False, verbose_name="Подходящо за деца")
+    interests = models.ManyToManyField(Interest, related_name='event_series', blank=True, verbose_name="Интереси")
+    capacity = models.PositiveIntegerField(verbose_name="Максимален капацитет")
+    price = models.DecimalField(max_digits=6, decimal_places=2, default=0.00)
+
+    starts_at = models.DateTimeField(verbose_name="Първа дата и час")
+    frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES, default='WEEKLY', verbose_name="Честота")
+    interval = models.PositiveSmallIntegerField(default=1, verbose_name="На всеки (брой периоди)")
+    by_weekday = models.CharField(
+        max_length=30, blank=True, verbose_name="Дни от седмицата",
+        help_text="Само за седмични: MO,TU,WE,TH,FR,SA,SU (по подразбиране денят на първата дата)",
+    )
+    count = models.PositiveIntegerField(null=True, blank=True, verbose_name="Брой повторения")
+    until = models.DateField(null=True, blank=True, verbose_name="До дата")
+    is_active = models.BooleanField(default=True, verbose_name="Активна")
+
+    # occurrences up to this moment already exist as Event rows
+    materialized_until = models.DateTimeField(null=True, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Поредица от събития"
+        verbose_name_plural = "Поредици от събития"
+
+    def __str__(self):
+        return f"{self.title} ({self.city}) – {self.recurrence_label}"
+
+    def clean(self):
+        from django.core.exceptions import ValidationError
+        days = self.weekdays
+        if any(day not in self.WEEKDAYS for day in days):
+            raise ValidationError({'by_weekday': "Позволени са само MO, TU, WE, TH, FR, SA, SU."})
+        if days and self.frequency != 'WEEKLY':
+            raise ValidationError({'by_weekday': "Дни от седмицата се задават само за седмични поредици."})
+        if self.interval < 1:
+            raise ValidationError({'interval': "Интервалът трябва да е поне 1."})
+
+    @property
+    def weekdays(self):
+        return [day.strip().upper() for day in self.by_weekday.split(',') if day.strip()]
+
+    @property
+    def rrule(self):
+        parts = [f"FREQ={self.frequency}", f"INTERVAL={self.interval}"]
+        if self.weekdays:
+            parts.append(f"BYDAY={','.join(self.weekdays)}")
+        if self.count:
+            parts.append(f"COUNT={self.count}")
+        if self.until:
+            parts.append(f"UNTIL={self.until:%Y%m%d}")
+        return ';'.join(parts)
+
+    @property
+    def recurrence_label(self):
+        label = self.get_frequency_display()
+        if self.interval > 1:
+            unit = {'DAILY': 'дни', 'WEEKLY': 'седмици', 'MONTHLY': 'месеца'}[self.frequency]
+            label = f"На всеки {self.interval} {unit}"
+        return label
+
+
 class Event(models.Model):
     title = models.CharField(max_length=200, verbose_name="Заглавие на събитието")
     description = models.TextField(verbose_name="Описание")
@@ -31,14 +111,26 @@ class Event(models.Model):
 
     price = models.DecimalField(max_digits=6, decimal_places=2, default=0.00)
     created_at = models.DateTimeField(auto_now_add=True)
+    # part of the cache key of the event's iCalendar entry (events.ical); queryset.update() must set it too
+    updated_at = models.DateTimeField(auto_now=True)
+    series = models.ForeignKey(
+        EventSeries, null=True, blank=True, on_delete=models.SET_NULL,
+        related_name='occurrences', verbose_name="Поредица",
+    )
+
+    class Meta:
+        constraints = [
+            # also the index behind "next occurrence of a series" lookups
+            models.UniqueConstraint(fields=['series', 'date_time'], name='unique_series_occurrence'),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.city}) - {self.date_time.strftime('%d.%m.%Y')}"
 
     @property
     def free_spots(self):
-        approved_count = self.registrations.filter(status='approved').count()
-        return max(0, self.capacity - approved_count)
+        taken = self.registrations.filter(status__in=EventRegistration.ACTIVE_STATUSES).count()
+        return max(0, self.capacity - taken)
     
     @property
     def price_eur(self):
@@ -56,7 +148,10 @@ class EventRegistration(models.Model):
         ('pending', 'Очаква одобрение'),
         ('approved', 'Одобрено'),
         ('rejected', 'Отказано'),
+        ('waitlisted', 'В листата на чакащите'),
     ]
+    # statuses that hold a seat; the rest of the requests wait on the waitlist or are closed
+    ACTIVE_STATUSES = ('pending', 'approved')
 
     event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='registrations')
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -64,12 +159,243 @@ class EventRegistration(models.Model):
     child_name = models.CharField(max_length=150, blank=True, null=True)
     child_age = models.PositiveIntegerField(blank=True, null=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    # sent with the registration form, so a resubmitted request returns the same registration
+    idempotency_key = models.CharField(max_length=64, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # status changes are picked up by the analytics rollups through it; queryset.update() must set it too
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         unique_together = ('event', 'user')
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='unique_registration_idempotency_key'),
+        ]
+        indexes = [
+            # seat counts and the head of the waitlist are index lookups
+            models.Index(fields=['event', 'status', 'created_at']),
+            # the days the analytics rollups recompute
+            models.Index(fields=['created_at']),
+        ]
         verbose_name = "Заявка за събитие"
         verbose_name_plural = "Заявки за събития"
 
     def __str__(self):
         return f"{self.full_name} - {self.event.title} ({self.get_status_display()})"
+
+    def _waitlisted_ahead(self):
+        return EventRegistration.objects.filter(event_id=self.event_id, status='waitlisted').filter(
+            models.Q(created_at__lt=self.created_at) | models.Q(created_at=self.created_at, id__lt=self.id)
+        )
+
+    @property
+    def waitlist_position(self):
+        if self.status != 'waitlisted':
+            return None
+        return self._waitlisted_ahead().count() + 1
+
+    async def awaitlist_position(self):
+        if self.status != 'waitlisted':
+            return None
+        return await self._waitlisted_ahead().acount() + 1
+
+
+def new_feed_token():
+    return secrets.token_urlsafe(32)
+
+
+class CalendarFeed(models.Model):
+    """
+    The secret address of a member's iCalendar feed. Calendar apps cannot log in,
+    so the token is the credential; a new token revokes the old address.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='calendar_feed')
+    token = models.CharField(max_length=64, unique=True, default=new_feed_token)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Календарен абонамент"
+        verbose_name_plural = "Календарни абонаменти"
+
+    def __str__(self):
+        return f"Календар: {self.user}"
+
+
+class JobLease(models.Model):
+    """
+    Expiring lease in the shared DB. Only the holder of a lease may do the work
+    it guards (e.g. run the APScheduler jobs), no matter how many processes try.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    owner = models.CharField(max_length=255, blank=True, default='')
+    expires_at = models.DateTimeField()
+    # fencing token: grows on every change of holder, never on renewal
+    token = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Заключване на задача"
+        verbose_name_plural = "Заключвания на задачи"
+
+    def __str__(self):
+        return f"{self.name} – {self.owner or 'свободно'} (до {self.expires_at:%d.%m.%Y %H:%M:%S})"
+
+
+class JobRun(models.Model):
+    """
+    One attempt of a scheduled job on one node: who ran it, with which
+    fencing token, how long it took and how it ended.
+    """
+    OUTCOME_CHOICES = [
+        ('success', 'Успешно'),
+        ('error', 'Грешка'),
+        ('skipped', 'Пропуснато (lease-ът е зает)'),
+        ('fenced', 'Прекъснато (lease-ът е изгубен)'),
+    ]
+
+    job_name = models.CharField(max_length=100)
+    owner = models.CharField(max_length=255)
+    token = models.PositiveBigIntegerField(null=True, blank=True)
+    started_at = models.DateTimeField()
+    duration_ms = models.PositiveIntegerField(default=0)
+    outcome = models.CharField(max_length=10, choices=OUTCOME_CHOICES)
+    error = models.TextField(blank=True, default='')
+    queries = models.PositiveIntegerField(default=0)
+    # rows the job read, and the units of work it did (e.g. approved members, archived
+    # entries); the latter means something different for every job
+    rows_scanned = models.PositiveIntegerField(default=0)
+    items_processed = models.PositiveIntegerField(default=0)
+    emails_sent = models.PositiveIntegerField(default=0)
+    # took JOB_SLOW_RATIO or more of the job's interval
+    slow = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ['-started_at']
+        indexes = [models.Index(fields=['job_name', 'started_at'])]
+        verbose_name = "Изпълнение на задача"
+        verbose_name_plural = "Изпълнения на задачи"
+
+    def __str__(self):
+        return f"{self.job_name} @ {self.started_at:%d.%m.%Y %H:%M:%S} – {self.get_outcome_display()}"
+
+
+class JobRunDaily(models.Model):
+    """
+    Daily rollup of JobRun per job. Kept for good, while the raw JobRun rows are pruned.
+    """
+    job_name = models.CharField(max_length=100)
+    day = models.DateField()
+    runs = models.PositiveIntegerField(default=0)
+    errors = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+    slow_runs = models.PositiveIntegerField(default=0)
+    p50_ms = models.PositiveIntegerField(default=0)
+    p95_ms = models.PositiveIntegerField(default=0)
+    max_ms = models.PositiveIntegerField(default=0)
+    avg_queries = models.PositiveIntegerField(default=0)
+    rows_scanned = models.PositiveIntegerField(default=0)
+    items_processed = models.PositiveIntegerField(default=0)
+    emails_sent = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-day', 'job_name']
+        unique_together = ('job_name', 'day')
+        verbose_name = "Дневна статистика на задача"
+        verbose_name_plural = "Дневни статистики на задачи"
+
+    def __str__(self):
+        return f"{self.job_name} – {self.day:%d.%m.%Y}"
+
+
+class AnalyticsWatermark(models.Model):
+    """How far the analytics rollups (events.analytics) have read the source tables."""
+    name = models.CharField(max_length=50, unique=True)
+    position = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Позиция на анализите"
+        verbose_name_plural = "Позиции на анализите"
+
+    def __str__(self):
+        return f"{self.name}: {self.position}"
+
+
+class DailySignups(models.Model):
+    """Members who signed up and who were approved, per local day."""
+    day = models.DateField(unique=True)
+    signups = models.PositiveIntegerField(default=0)
+    approvals = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-day']
+        verbose_name = "Дневни регистрации на членове"
+        verbose_name_plural = "Дневни регистрации на членове"
+
+    def __str__(self):
+        return f"{self.day:%d.%m.%Y}: {self.signups} / {self.approvals}"
+
+
+class DailyRegistrations(models.Model):
+    """Event registrations made on a local day, by their current status."""
+    day = models.DateField()
+    status = models.CharField(max_length=20, choices=EventRegistration.STATUS_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-day', 'status']
+        unique_together = ('day', 'status')
+        verbose_name = "Дневни заявки за събития"
+        verbose_name_plural = "Дневни заявки за събития"
+
+    def __str__(self):
+        return f"{self.day:%d.%m.%Y} {self.status}: {self.count}"
+
+
+class DailyProfileAnswer(models.Model):
+    """
+    Questionnaire answers of the members who signed up on a local day: the
+    acquisition channel, the city, whether they have children and every interest.
+    """
+    QUESTION_CHOICES = [
+        ('channel', 'Откъде научи'),
+        ('city', 'Град'),
+        ('has_children', 'Има деца'),
+        ('interest', 'Интерес'),
+    ]
+
+    day = models.DateField()
+    question = models.CharField(max_length=20, choices=QUESTION_CHOICES)
+    answer = models.CharField(max_length=255)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('day', 'question', 'answer')
+        # the dashboard sums one question over a range of days
+        indexes = [models.Index(fields=['question', 'day'])]
+        verbose_name = "Дневни отговори от въпросника"
+        verbose_name_plural = "Дневни отговори от въпросника"
+
+    def __str__(self):
+        return f"{self.day:%d.%m.%Y} {self.question}={self.answer}: {self.count}"
+
+
+class EventFillRate(models.Model):
+    """Seats of an event by registration status, with the title and date copied for the dashboard."""
+    event = models.OneToOneField(Event, on_delete=models.CASCADE, primary_key=True, related_name='fill_rate')
+    title = models.CharField(max_length=200)
+    date_time = models.DateTimeField(db_index=True)
+    capacity = models.PositiveIntegerField(default=0)
+    approved = models.PositiveIntegerField(default=0)
+    pending = models.PositiveIntegerField(default=0)
+    waitlisted = models.PositiveIntegerField(default=0)
+    rejected = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['date_time']
+        verbose_name = "Запълняемост на събитие"
+        verbose_name_plural = "Запълняемост на събитията"
+
+    def __str__(self):
+        return f"{self.title}: {self.approved}/{self.capacity}"
+
+    @property
+    def percent(self):
+        return round(100 * self.approved / self.capacity) if self.capacity else 0
@@ -1,26 +1,43 @@
-import os
+from datetime import timedelta
 from django.conf import settings
-from apscheduler.schedulers.background import BackgroundScheduler
+from django.utils import timezone
+from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 from django_apscheduler.jobstores import DjangoJobStore, register_events
 from django_apscheduler.models import DjangoJobExecution
+from .locks import leased_job
+from .metrics import incr, rollup_recent_job_runs
+from .models import JobRun
 
-_scheduler = None 
+# name of the JobLease row held by the active scheduler process
+SCHEDULER_LEASE = "scheduler"
 
+# JobRun rows are kept longer than DjangoJobExecution, to compare run durations over a week
+JOB_RUN_MAX_AGE = timedelta(days=7)
+
+
+@leased_job(interval_seconds=24 * 60 * 60)
 def delete_old_job_executions(max_age=60 * 60 * 24):
     """
     Cleaning up old performance recordings.
     """
     DjangoJobExecution.objects.delete_old_job_executions(max_age)
+    deleted, _ = JobRun.objects.filter(started_at__lt=timezone.now() - JOB_RUN_MAX_AGE).delete()
+    incr("items_processed", deleted)
 
-def start_scheduler():
-    global _scheduler
-    if _scheduler is not None:
-        return _scheduler
 
-    scheduler = BackgroundScheduler(timezone=settings.TIME_ZONE)
-    scheduler.add_jobstore(DjangoJobStore(), "default")
+@leased_job(interval_seconds=60 * 60)
+def rollup_job_runs():
+    """
+    Keeps JobRunDaily (p50/p95/max per job and day) up to date.
+    """
+    rollup_recent_job_runs()
+
 
+def add_jobs(scheduler):
+    """
+    Registers the periodic jobs in the shared DjangoJobStore.
+    """
     scheduler.add_job(
         func="events.jobs:send_event_reminders_job",
         trigger=IntervalTrigger(minutes=5),
@@ -32,6 +49,72 @@ def start_scheduler():
         misfire_grace_time=300,
     )
 
+    scheduler.add_job(
+        func="events.jobs:materialize_event_series_job",
+        trigger=IntervalTrigger(hours=1),
+        id="materialize_event_series_job",
+        name="Създава предстоящите срещи на повтарящите се събития",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        misfire_grace_time=300,
+    )
+
+    scheduler.add_job(
+        func="events.jobs:send_queued_emails_job",
+        trigger=IntervalTrigger(minutes=1),
+        id="send_queued_emails_job",
+        name="Изпраща имейлите от опашката (напр. при групово одобрение)",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        misfire_grace_time=60,
+    )
+
+    scheduler.add_job(
+        func="events.jobs:send_notifications_job",
+        trigger=IntervalTrigger(minutes=1),
+        id="send_notifications_job",
+        name="Изпраща известията на членовете (по един имейл/обобщение на член)",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        misfire_grace_time=60,
+    )
+
+    scheduler.add_job(
+        func="events.jobs:auto_approve_members_job",
+        trigger=IntervalTrigger(minutes=15),
+        id="auto_approve_members_job",
+        name="Одобрява автоматично чакащите потребители по правилата (AUTO_APPROVE_ENABLE)",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        misfire_grace_time=300,
+    )
+
+    scheduler.add_job(
+        func="events.jobs:rollup_analytics_job",
+        trigger=IntervalTrigger(minutes=15),
+        id="rollup_analytics_job",
+        name="Обновява обобщените таблици на аналитиката",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        misfire_grace_time=300,
+    )
+
+    scheduler.add_job(
+        func="events.jobs:archive_audit_log_job",
+        trigger=IntervalTrigger(hours=24),
+        id="archive_audit_log_job",
+        name="Архивира старите записи от одита по месеци",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        misfire_grace_time=300,
+    )
+
     scheduler.add_job(
         func="events.scheduler:delete_old_job_executions",
         trigger=IntervalTrigger(hours=24),
@@ -43,14 +126,25 @@ def start_scheduler():
         misfire_grace_time=300,
     )
 
+    scheduler.add_job(
+        func="events.scheduler:rollup_job_runs",
+        trigger=IntervalTrigger(hours=1),
+        id="rollup_job_runs",
+        name="Обобщава времената на изпълнение на задачите по дни",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        misfire_grace_time=300,
+    )
+
+
+def build_scheduler():
+    """
+    Scheduler for the dedicated `manage.py run_scheduler` process.
+    Web workers never start one.
+    """
+    scheduler = BlockingScheduler(timezone=settings.TIME_ZONE)
+    scheduler.add_jobstore(DjangoJobStore(), "default")
+    add_jobs(scheduler)
     register_events(scheduler)
-    scheduler.start()
-    _scheduler = scheduler
-    return _scheduler
-
-def maybe_start_scheduler():
-    if settings.DEBUG:
-        if os.environ.get("RUN_MAIN") == "true" or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
-            start_scheduler()
-    else:
-        start_scheduler()
\ No newline at end of file
+    return scheduler
@@ -0,0 +1,157 @@
+import calendar
+from datetime import timedelta
+from itertools import count as counter
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+from .metrics import incr
+from .models import Event, EventSeries
+
+# fields copied from a series to its occurrences
+OCCURRENCE_FIELDS = ['title', 'description', 'city', 'location_details', 'is_kid_friendly', 'capacity', 'price']
+# changing any of these moves the future occurrences
+RECURRENCE_FIELDS = ['starts_at', 'frequency', 'interval', 'by_weekday', 'count', 'until']
+
+
+def materialize_window() -> timedelta:
+    return timedelta(days=int(getattr(settings, "SERIES_MATERIALIZE_DAYS", 60)))
+
+
+def _naive_occurrences(series):
+    """Endless local (naive) datetimes of the series, starting with starts_at."""
+    start = timezone.localtime(series.starts_at).replace(tzinfo=None)
+    step = series.interval or 1
+
+    if series.frequency == 'DAILY':
+        for n in counter(0, step):
+            yield start + timedelta(days=n)
+
+    elif series.frequency == 'WEEKLY':
+        weekdays = sorted(EventSeries.WEEKDAYS.index(day) for day in series.weekdays) or [start.weekday()]
+        monday = start - timedelta(days=start.weekday())
+        for week in counter(0, step):
+            for weekday in weekdays:
+                moment = monday + timedelta(days=week * 7 + weekday)
+                if moment >= start:
+                    yield moment
+
+    elif series.frequency == 'MONTHLY':
+        for n in counter(0, step):
+            year, month = divmod(start.month - 1 + n, 12)
+            year += start.year
+            # like RRULE: months without that day (e.g. the 31st) are skipped
+            if start.day <= calendar.monthrange(year, month + 1)[1]:
+                yield start.replace(year=year, month=month + 1)
+
+
+def occurrence_times(series, after, until):
+    """
+    Aware datetimes of the occurrences in (after, until], honouring COUNT and UNTIL.
+    The wall-clock time stays the same across DST changes.
+    """
+    for n, naive in enumerate(_naive_occurrences(series), 1):
+        if series.count and n > series.count:
+            return
+        if series.until and naive.date() > series.until:
+            return
+        moment = timezone.make_aware(naive)
+        if moment > until:
+            return
+        if after is None or moment > after:
+            yield moment
+
+
+def materialize_series(series, now=None) -> int:
+    """
+    Creates the missing occurrences of `series` up to now + SERIES_MATERIALIZE_DAYS
+    with one bulk_create for the events and one for their interests.
+    """
+    now = now or timezone.now()
+    horizon = now + materialize_window()
+    if not series.is_active or (series.materialized_until and series.materialized_until >= horizon):
+        return 0
+
+    after = max(series.materialized_until or now, now)
+    times = list(occurrence_times(series, after, horizon))
+    with transaction.atomic():
+        existing = set(
+            Event.objects.filter(series=series, date_time__in=times).values_list('date_time', flat=True)
+        )
+        template = {field: getattr(series, field) for field in OCCURRENCE_FIELDS}
+        events = Event.objects.bulk_create([
+            Event(series=series, date_time=moment, **template)
+            for moment in times if moment not in existing
+        ])
+        interest_ids = list(series.interests.values_list('id', flat=True))
+        EventInterest = Event.interests.through
+        EventInterest.objects.bulk_create([
+            EventInterest(event_id=event.id, interest_id=interest_id)
+            for event in events
+            for interest_id in interest_ids
+        ])
+        EventSeries.objects.filter(pk=series.pk).update(materialized_until=horizon)
+    series.materialized_until = horizon
+    return len(events)
+
+
+def materialize_event_series() -> int:
+    """Tops up the rolling window of every active series that needs it."""
+    horizon = timezone.now() + materialize_window()
+    pending = EventSeries.objects.filter(is_active=True).filter(
+        Q(materialized_until__isnull=True) | Q(materialized_until__lt=horizon)
+    )
+    created = 0
+    for series in pending.iterator():
+        incr("rows_scanned")
+        created += materialize_series(series)
+    return created
+
+
+def propagate_series(series, recurrence_changed=False, interests_changed=False, now=None) -> int:
+    """
+    Applies an edit of the series to its future occurrences: one UPDATE for the
+    copied fields and, when the interests changed, one DELETE + one bulk_create
+    of the through rows. If the recurrence changed, the future occurrences nobody
+    registered for are dropped and the window is materialized again.
+    Returns how many future occurrences were updated.
+    """
+    now = now or timezone.now()
+    future = Event.objects.filter(series=series, date_time__gt=now)
+    with transaction.atomic():
+        if recurrence_changed:
+            future.filter(registrations__isnull=True).delete()
+            EventSeries.objects.filter(pk=series.pk).update(materialized_until=None)
+            series.materialized_until = None
+
+        updated = future.update(updated_at=now, **{field: getattr(series, field) for field in OCCURRENCE_FIELDS})
+
+        if interests_changed:
+            EventInterest = Event.interests.through
+            future_ids = list(future.values_list('id', flat=True))
+            EventInterest.objects.filter(event_id__in=future_ids).delete()
+            interest_ids = list(series.interests.values_list('id', flat=True))
+            EventInterest.objects.bulk_create([
+                EventInterest(event_id=event_id, interest_id=interest_id)
+                for event_id in future_ids
+                for interest_id in interest_ids
+            ])
+
+    materialize_series(series, now=now)
+    return updated
+
+
+def collapse_series(events, now=None):
+    """
+    Keeps standalone events and only the next upcoming occurrence of every series,
+    so a weekly meetup shows up once in the listings instead of once per week.
+    The correlated subquery is an index seek on (series, date_time).
+    """
+    now = now or timezone.now()
+    next_occurrence = (
+        Event.objects
+        .filter(series_id=OuterRef('series_id'), date_time__gte=now)
+        .order_by('date_time')
+        .values('date_time')[:1]
+    )
+    return events.filter(Q(series__isnull=True) | Q(date_time=Subquery(next_occurrence)))
@@ -0,0 +1,104 @@
+from django.db import transaction
+from django.http import Http404
+from django.utils import timezone
+from core import audit
+from core.models import AuditEntry
+from .live import publisher
+from .models import Event, EventRegistration
+
+
+def _seats_taken(event_id) -> int:
+    return EventRegistration.objects.filter(
+        event_id=event_id, status__in=EventRegistration.ACTIVE_STATUSES
+    ).count()
+
+
+class RegistrationClosed(Exception):
+    """The event has already taken place."""
+
+
+def _lock_event(event_id):
+    # Serialises the registrations of one event: a row lock on PostgreSQL, on SQLite
+    # the IMMEDIATE transaction already holds the database write lock.
+    return (
+        Event.objects.select_for_update()
+        .only('id', 'capacity', 'date_time', 'is_kid_friendly')
+        .filter(pk=event_id)
+        .first()
+    )
+
+
+def register_user(event_id, user, *, full_name, child_name=None, child_age=None, idempotency_key=None):
+    """
+    The only way members register for an event. Returns (registration, created) like get_or_create.
+    The event is read once, with the lock, so callers only need its id.
+
+    A request replayed with the same idempotency key returns the registration it created.
+    A user has at most one registration per event (the unique (event, user) constraint);
+    a rejected one is reopened as a new request, dated now so that it queues behind everyone
+    already waiting. While the event has free seats the request is pending, otherwise it goes
+    to the end of the waitlist. Raises Http404 if the event does not exist and RegistrationClosed
+    if it has already taken place.
+    """
+    idempotency_key = idempotency_key or None
+
+    with transaction.atomic():
+        event = _lock_event(event_id)
+        if event is None:
+            raise Http404("No Event matches the given query.")
+        if idempotency_key:
+            replayed = EventRegistration.objects.filter(user=user, idempotency_key=idempotency_key).first()
+            if replayed is not None:
+                return replayed, False
+        if event.date_time <= timezone.now():
+            raise RegistrationClosed
+        if not event.is_kid_friendly:
+            child_name, child_age = None, None
+
+        status = 'pending' if _seats_taken(event_id) < event.capacity else 'waitlisted'
+        fields = {
+            'full_name': full_name,
+            'child_name': child_name,
+            'child_age': child_age,
+            'status': status,
+            'idempotency_key': idempotency_key,
+        }
+        reg, created = EventRegistration.objects.get_or_create(event_id=event_id, user=user, defaults=fields)
+        if not created and reg.status == 'rejected':
+            for name, value in fields.items():
+                setattr(reg, name, value)
+            # the waitlist is ordered by created_at: a reopened request starts a new place in it
+            reg.created_at = timezone.now()
+            reg.save()
+            created = True
+    return reg, created
+
+
+def promote_from_waitlist(event_id) -> int:
+    """
+    Moves the head of the waitlist to pending for every free seat of the event.
+    Called whenever a seat is freed; returns how many requests were promoted.
+    Costs a count of the event's taken seats and an index seek on the waitlist head,
+    whatever the length of the waitlist. The UPDATE sends no post_save, so the live
+    counters and the audit log are told about the promoted requests here.
+    """
+    with transaction.atomic():
+        event = _lock_event(event_id)
+        if event is None:
+            return 0
+        free = event.capacity - _seats_taken(event_id)
+        if free <= 0:
+            return 0
+        head = list(
+            EventRegistration.objects
+            .filter(event_id=event_id, status='waitlisted')
+            .order_by('created_at', 'id')
+            .values_list('id', flat=True)[:free]
+        )
+        if not head:
+            return 0
+        promoted = EventRegistration.objects.filter(pk__in=head).update(status='pending', updated_at=timezone.now())
+        audit.record(AuditEntry.TARGET_REGISTRATION, [(pk, 'waitlisted') for pk in head], 'pending',
+                     source=AuditEntry.SOURCE_AUTO)
+        transaction.on_commit(lambda: publisher.mark_dirty([event_id]))
+    return promoted
@@ -1,12 +1,10 @@
-import logging
-from django.db.models.signals import pre_save, post_save
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
-from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
+from django.db import transaction
+from core.notifications import notify
 from .models import EventRegistration
-
-logger = logging.getLogger(__name__)
+from .live import publisher
+from .services import promote_from_waitlist
 
 
 @receiver(pre_save, sender=EventRegistration)
@@ -28,50 +26,29 @@ def notify_on_status_change(sender, instance: EventRegistration, created, **kwar
 
     if created and new == 'pending':
         return
-    if old == new:
-        return
-    if not instance.user or not instance.user.email:
-        return
-
-    prefs = getattr(instance.user, 'notificationsettings', None)
-    if prefs and not prefs.email_event_status_changes:
+    if old == new or new not in ('approved', 'rejected'):
         return
 
+    # the dispatcher drops it if the member turned these notifications off
     recipient_name = instance.full_name or (instance.user.first_name or instance.user.username)
-    event = instance.event
+    notify(instance.user, f"event_{new}", event=instance.event, recipient_name=recipient_name)
 
-    if new == 'approved':
-        subject = f"Одобрение за участие: {event.title}"
-        txt_template = "email/status_approved.txt"
-        html_template = "email/status_approved.html"
-    elif new == 'rejected':
-        subject = f"Отказ за участие: {event.title}"
-        txt_template = "email/status_rejected.txt"
-        html_template = "email/status_rejected.html"
-    else:
-        return
 
-    ctx = {
-        "recipient_name": recipient_name,
-        "event": event,
-        "reg": instance,
-    }
+@receiver(post_save, sender=EventRegistration)
+def promote_on_freed_seat(sender, instance: EventRegistration, created, **kwargs):
+    old = getattr(instance, "_old_status", None)
+    if old in EventRegistration.ACTIVE_STATUSES and instance.status not in EventRegistration.ACTIVE_STATUSES:
+        promote_from_waitlist(instance.event_id)
 
-    try:
-        text_body = render_to_string(txt_template, ctx)
-        try:
-            html_body = render_to_string(html_template, ctx)
-        except Exception:
-            html_body = None
 
-        email = EmailMultiAlternatives(
-            subject=subject,
-            body=text_body,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[instance.user.email],
-        )
-        if html_body:
-            email.attach_alternative(html_body, "text/html")
-        email.send(fail_silently=True)
-    except Exception as exc:
-        logger.warning("Failed to send status change email for reg %s: %s", instance.pk, exc)
+@receiver(post_delete, sender=EventRegistration)
+def promote_on_deleted_registration(sender, instance: EventRegistration, **kwargs):
+    if instance.status in EventRegistration.ACTIVE_STATUSES:
+        promote_from_waitlist(instance.event_id)
+
+
+@receiver(post_save, sender=EventRegistration)
+@receiver(post_delete, sender=EventRegistration)
+def publish_live_counters(sender, instance: EventRegistration, **kwargs):
+    event_id = instance.event_id
+    transaction.on_commit(lambda: publisher.mark_dirty([event_id]))
@@ -7,6 +7,10 @@ urlpatterns = [
     path('all/', views.all_events, name='all_events'),
     path('recommended/', views.recommended_events, name='recommended_events'),
     path('<int:event_id>/', views.event_detail, name='event_detail'),
+    path('<int:event_id>/event.ics', views.event_ics, name='event_ics'),
+    path('calendar/', views.calendar_subscription, name='calendar_subscription'),
+    path('calendar/<str:token>.ics', views.calendar_feed, name='calendar_feed'),
+    path('live/', views.live_counters, name='live_counters'),
     path('register/<int:event_id>/', views.register_for_event, name='register_for_event'),
     path('register/<int:event_id>/thanks/', views.register_thanks, name='register_thanks'),
 ]
\ No newline at end of file
@@ -1,24 +1,46 @@
+import uuid
+from datetime import timedelta
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, get_object_or_404, redirect
-from core.models import Questionnaire
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from core.models import Interest, Questionnaire
+from core.ratelimit import ratelimit
 from django.utils import timezone
 from django.contrib import messages
-from django.http import HttpResponseNotAllowed
-from .models import Event, EventRegistration
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseNotAllowed,
+    StreamingHttpResponse,
+)
+from . import ical
+from .models import CalendarFeed, Event, EventRegistration, new_feed_token
 from .forms import EventFilterForm, EventRegistrationForm
+from .live import QUEUE_TOPIC, event_topic, format_sse, publisher, snapshot
+from .series import collapse_series
+from .services import RegistrationClosed, register_user
+
+WAITLIST_MESSAGE = "Събитието е пълно – добавихме Ви в листата на чакащите. Ще Ви преместим автоматично, щом се освободи място."
 
 @login_required
 def events_home(request):
     return render(request, 'events/events_home.html')
 
-@login_required
-def all_events(request):
+async def _alist(queryset):
+    return [obj async for obj in queryset]
+
+
+def _filtered_events(params):
+    """The filter form (its choices and validation query the DB) and the upcoming events it selects."""
     events = (
         Event.objects
         .filter(date_time__gte=timezone.now())  
         .order_by('date_time')
     )
-    form = EventFilterForm(request.GET or None)
+    form = EventFilterForm(params or None)
+    date = None
 
     if form.is_valid():
         date = form.cleaned_data.get('date')
@@ -40,49 +62,73 @@ def all_events(request):
         elif kid_friendly == 'no':
             events = events.filter(is_kid_friendly=False)
 
-    return render(request, 'events/all_events.html', {'events': events, 'form': form})
+    # a series is listed once (its next occurrence), unless a specific date is asked for
+    if not date:
+        events = collapse_series(events)
+    return form, events.select_related('series')
+
 
 @login_required
-def event_detail(request, event_id):
-    event = get_object_or_404(Event, pk=event_id)
-    is_past = event.date_time <= timezone.now()
+async def all_events(request):
+    form, events = await sync_to_async(_filtered_events)(request.GET)
+    events = await _alist(events)
+    return render(request, 'events/all_events.html', {'events': events, 'form': form})
 
+@login_required
+@ratelimit('register_for_event')
+async def event_detail(request, event_id):
     if request.method == "POST" and request.POST.get("action") == "register":
-        if is_past:
-            messages.warning(request, "Събитието вече е минало.")
-            return redirect("event_detail", event_id=event.id)
-
         full_name = (
             request.POST.get("full_name")
             or request.user.get_full_name()
             or request.user.username
         )
 
-        EventRegistration.objects.get_or_create(
-            user=request.user,
-            event=event,
-            defaults={"status": "pending", "full_name": full_name},
-        )
-        return redirect("event_detail", event_id=event.id)
+        # register_user() reads the event (404, already past), counts the seats and looks up
+        # the registration itself under the lock
+        try:
+            reg, created = await sync_to_async(register_user)(
+                event_id, request.user,
+                full_name=full_name,
+                idempotency_key=request.POST.get("idempotency_key"),
+            )
+        except RegistrationClosed:
+            messages.warning(request, "Събитието вече е минало.")
+            return redirect("event_detail", event_id=event_id)
+        if created and reg.status == "waitlisted":
+            messages.info(request, WAITLIST_MESSAGE)
+        return redirect("event_detail", event_id=event_id)
+
+    # the async ORM runs every query on the one thread-sensitive worker thread, so these
+    # are awaited one after the other; the event only has to exist for the 404
+    event = await Event.objects.select_related('series').filter(pk=event_id).afirst()
+    if event is None:
+        raise Http404("No Event matches the given query.")
+    registrations = EventRegistration.objects.filter(event_id=event_id)
+    interests = await _alist(Interest.objects.filter(events__id=event_id).order_by('id'))
+    taken = await registrations.filter(status__in=EventRegistration.ACTIVE_STATUSES).acount()
+    existing_registration = await registrations.filter(user_id=request.user.pk).afirst()
+    is_past = event.date_time <= timezone.now()
 
-    existing_registration = None
-    if request.user.is_authenticated:
-        existing_registration = EventRegistration.objects.filter(
-            event=event, user=request.user
-        ).first()
+    waitlist_position = None
+    if existing_registration is not None:
+        waitlist_position = await existing_registration.awaitlist_position()
 
     return render(request, "events/event_detail.html", {
         "event": event,
+        "interests": interests,
+        "free_spots": max(0, event.capacity - taken),
         "existing_registration": existing_registration,
+        "waitlist_position": waitlist_position,
         "is_past": is_past,
     })
 
 @login_required
-def recommended_events(request):
+async def recommended_events(request):
     user = request.user
 
     try:
-        questionnaire = Questionnaire.objects.get(user=user)
+        questionnaire = await Questionnaire.objects.aget(user=user)
     except Questionnaire.DoesNotExist:
         return render(request, 'events/events_home.html')
 
@@ -106,20 +152,70 @@ def recommended_events(request):
     else:
         events = events.filter(is_kid_friendly=False)
 
-    events = events.distinct().order_by('date_time')
+    events = collapse_series(events).select_related('series').distinct().order_by('date_time')
 
-    return render(request, 'events/recommended_events.html', {'events': events})
+    return render(request, 'events/recommended_events.html', {'events': await _alist(events)})
 
 
-def past_events_list(request):
+async def past_events_list(request):
     events = (
         Event.objects
         .filter(date_time__lt=timezone.now())
         .order_by('-date_time')
     )
-    return render(request, 'events/past_events.html', {'events': events})
+    return render(request, 'events/past_events.html', {'events': await _alist(events)})
+
+# upper bound of the events one stream may follow
+LIVE_MAX_EVENTS = 50
+
+
+async def _live_stream(topics):
+    sub = publisher.subscribe(topics)
+    heartbeat = getattr(settings, 'LIVE_HEARTBEAT_SECONDS', 20)
+    try:
+        yield f"retry: {getattr(settings, 'LIVE_RETRY_MS', 5000)}\n\n"
+        while True:
+            payloads = await sub.next(heartbeat)
+            if payloads:
+                yield ''.join(format_sse(topic, payload) for topic, payload in payloads.items())
+            else:
+                # keeps proxies from closing an idle stream
+                yield ": ping\n\n"
+    finally:
+        publisher.unsubscribe(sub)
+
+
+@login_required
+async def live_counters(request):
+    """
+    Server-sent events with the free seats of ?event=<id> (repeatable) and, for admins,
+    the registration queue counters (?queue=1), pushed by events.live.publisher.
+    Live push needs ASGI. Under WSGI there is no stream and the pages do not subscribe
+    (events.context_processors.live_push); a direct request gets one snapshot and a
+    long `retry`, so a stray EventSource does not poll the full request stack.
+    """
+    topics = {event_topic(value) for value in request.GET.getlist('event')[:LIVE_MAX_EVENTS] if value.isdigit()}
+    if request.GET.get('queue'):
+        if not request.user.is_superuser:
+            return HttpResponseForbidden()
+        topics.add(QUEUE_TOPIC)
+    if not topics:
+        return HttpResponseBadRequest("event or queue is required")
+
+    if isinstance(request, ASGIRequest):
+        response = StreamingHttpResponse(_live_stream(topics), content_type='text/event-stream')
+    else:
+        payloads = await sync_to_async(snapshot)(topics)
+        body = f"retry: {getattr(settings, 'LIVE_WSGI_RETRY_MS', 10 * 60 * 1000)}\n\n"
+        body += ''.join(format_sse(topic, payload) for topic, payload in payloads.items())
+        response = HttpResponse(body, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx would otherwise buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 @login_required
+@ratelimit('register_for_event')
 def register_for_event(request, event_id):
     event = get_object_or_404(Event, pk=event_id)
 
@@ -130,27 +226,35 @@ def register_for_event(request, event_id):
     if request.method == "POST":
         form = EventRegistrationForm(request.POST)
         if form.is_valid():
-            reg = form.save(commit=False)
-            reg.user = request.user
-            reg.event = event
+            data = form.cleaned_data
 
-            if event.is_kid_friendly and (not reg.child_name or reg.child_age is None):
+            if event.is_kid_friendly and (not data["child_name"] or data["child_age"] is None):
                 form.add_error(None, "Това събитие е за деца – моля, попълни името и възрастта на детето.")
                 return render(request, "events/register_event.html", {"form": form, "event": event})
 
-            if not event.is_kid_friendly:
-                reg.child_name = None
-                reg.child_age = None
-
+            key = data["idempotency_key"]
             try:
-                reg.save()  
-            except Exception:
+                reg, created = register_user(
+                    event.id, request.user,
+                    full_name=data["full_name"],
+                    child_name=data["child_name"],
+                    child_age=data["child_age"],
+                    idempotency_key=key,
+                )
+            except RegistrationClosed:
+                # the event started while the form was being submitted
+                messages.warning(request, "Събитието вече е минало.")
+                return redirect("event_detail", event_id=event.id)
+            # a resubmitted form (double click, retry) carries the key of the registration it made
+            if not created and not (key and reg.idempotency_key == key):
                 form.add_error(None, "Вече имаш подадена заявка за това събитие.")
                 return render(request, "events/register_event.html", {"form": form, "event": event})
 
+            if reg.status == "waitlisted":
+                messages.info(request, WAITLIST_MESSAGE)
             return redirect("register_thanks", event_id=event.id)
     else:
-        initial = {}
+        initial = {"idempotency_key": uuid.uuid4().hex}
         if request.user.get_full_name():
             initial["full_name"] = request.user.get_full_name()
         else:
@@ -164,3 +268,68 @@ def register_thanks(request, event_id):
     event = get_object_or_404(Event, id=event_id)
     return render(request, 'events/register_thanks.html', {'event': event})
 
+
+def _ics_response(request, body, tag, filename=None):
+    response = HttpResponse(body, content_type='text/calendar; charset=utf-8')
+    response['ETag'] = tag
+    # clients may reuse the copy for a few minutes and then revalidate it with the ETag
+    patch_cache_control(response, private=True, max_age=getattr(settings, 'CALENDAR_MAX_AGE', 300))
+    if filename:
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def calendar_feed(request, token):
+    """
+    A member's approved registrations as an iCalendar feed, for calendar apps polling
+    the secret address. A poll is one indexed query; when nothing changed, the ETag
+    matches and the answer is a 304. Otherwise the feed is put together from the
+    cached VEVENT of each event (events.ical), rendering only the edited events.
+    """
+    since = timezone.now() - timedelta(days=getattr(settings, 'CALENDAR_PAST_DAYS', 30))
+    entries = list(
+        EventRegistration.objects
+        .filter(user__calendar_feed__token=token, status='approved', event__date_time__gte=since)
+        .order_by('event__date_time', 'event_id')
+        .values_list('event_id', 'event__updated_at')
+    )
+    if not entries and not CalendarFeed.objects.filter(token=token).exists():
+        raise Http404
+
+    tag = ical.etag(entries)
+    not_modified = get_conditional_response(request, etag=tag)
+    if not_modified is not None:
+        return not_modified
+
+    fragments = ical.vevents(entries, lambda ids: Event.objects.filter(pk__in=ids))
+    return _ics_response(request, ical.calendar(fragments), tag)
+
+
+@login_required
+def event_ics(request, event_id):
+    """One event as an .ics download, from the same cached VEVENT as the feeds."""
+    event = get_object_or_404(Event, pk=event_id)
+    entries = [(event.pk, event.updated_at)]
+    tag = ical.etag(entries)
+    not_modified = get_conditional_response(request, etag=tag)
+    if not_modified is not None:
+        return not_modified
+    body = ical.calendar(ical.vevents(entries, lambda ids: [event]), name=event.title)
+    return _ics_response(request, body, tag, filename=f'luxeladies-{event.pk}.ics')
+
+
+@login_required
+def calendar_subscription(request):
+    """The member's feed address; a POST replaces the token, which revokes the old address."""
+    feed, _ = CalendarFeed.objects.get_or_create(user=request.user)
+    if request.method == 'POST':
+        feed.token = new_feed_token()
+        feed.save(update_fields=['token'])
+        messages.success(request, "Създадохме нов адрес. Старият вече не работи.")
+        return redirect('calendar_subscription')
+
+    feed_url = request.build_absolute_uri(reverse('calendar_feed', args=[feed.token]))
+    return render(request, 'events/calendar_subscription.html', {
+        'feed_url': feed_url,
+        'webcal_url': 'webcal://' + feed_url.split('://', 1)[1],
+    })
@@ -11,27 +11,41 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
+import copy
+import importlib.util
 import os
 import sys
+from django.core.exceptions import ImproperlyConfigured
 
 TESTING = "test" in sys.argv
 APSCHEDULER_ENABLE = not TESTING
 
+# "development" (default) or "production"; see the checklist:
+# https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
+DEPLOY_PROFILE = os.environ.get("DEPLOY_PROFILE", "development")
+if DEPLOY_PROFILE not in ("development", "production"):
+    raise ImproperlyConfigured(f"Unknown DEPLOY_PROFILE: {DEPLOY_PROFILE}")
+PRODUCTION = DEPLOY_PROFILE == "production"
+
 STATIC_URL = '/static/'
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
-# Quick-start development settings - unsuitable for production
-# See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
-
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-lb7eh$*w%n97y$*wc+jvkdv$kh)x45w-#j^b-6t7l*p#k(62_m'
+SECRET_KEY = os.environ.get("SECRET_KEY", "")
+if not SECRET_KEY:
+    if PRODUCTION:
+        raise ImproperlyConfigured("SECRET_KEY must be set in production")
+    SECRET_KEY = 'django-insecure-lb7eh$*w%n97y$*wc+jvkdv$kh)x45w-#j^b-6t7l*p#k(62_m'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# With DEBUG every query is also kept in connection.queries (up to 9000 per connection).
+DEBUG = os.environ.get("DEBUG", str(not PRODUCTION)) == "True"
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [host.strip() for host in os.environ.get("ALLOWED_HOSTS", "").split(",") if host.strip()]
+CSRF_TRUSTED_ORIGINS = [origin.strip() for origin in os.environ.get("CSRF_TRUSTED_ORIGINS", "").split(",") if origin.strip()]
+SESSION_COOKIE_SECURE = CSRF_COOKIE_SECURE = os.environ.get("SECURE_COOKIES", str(PRODUCTION)) == "True"
 
 AUTH_USER_MODEL = 'core.CustomUser'
 # Application definition
@@ -50,13 +64,17 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.RequestTimingMiddleware',
+    'core.middleware.AuditMiddleware',
     'core.middleware.QuestionnaireRequiredMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'luxeladies.urls'
@@ -72,6 +90,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'events.context_processors.live_push',
             ],
         },
     },
@@ -80,20 +99,270 @@ TEMPLATES = [
 
 TEMPLATES[0]['DIRS'] = [os.path.join(BASE_DIR, 'templates')]
 
+if PRODUCTION:
+    # Templates are compiled once per process, whatever DEBUG says; changes need a restart.
+    # (loaders cannot be combined with APP_DIRS, so the app loader is listed explicitly)
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
+# Static files and uploads. In production both are served by the web server, not by Django:
+# collectstatic writes the static files, with content hashes in their names, to STATIC_ROOT;
+# uploads go to MEDIA_ROOT. In development Django serves the uploads (luxeladies/urls.py),
+# only from MEDIA_ROOT and never from the project directory itself.
+STATIC_ROOT = os.environ.get("STATIC_ROOT", os.path.join(BASE_DIR, 'staticfiles'))
+MEDIA_URL = os.environ.get("MEDIA_URL", "/media/")
+MEDIA_ROOT = os.environ.get("MEDIA_ROOT", os.path.join(BASE_DIR, 'media'))
+if PRODUCTION:
+    STORAGES = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'core.staticfiles.BundledManifestStaticFilesStorage'},
+    }
+
+# CSS bundles (one stylesheet per page) and resized image variants, built by collectstatic
+# (core.staticfiles) and linked with the static_bundles template tags. Without the build,
+# i.e. in development, the tags link the source files.
+STATIC_BUNDLES_ENABLED = PRODUCTION
+STATIC_BUNDLES = {
+    'site': ['css/style.css', 'css/components.css'],
+    'admin': ['css/style.css', 'css/components.css', 'css/admin.css'],
+    'admin-registrations': ['css/style.css', 'css/components.css', 'css/admin-registrations.css'],
+    'profile': ['css/style.css', 'css/components.css', 'css/profile.css'],
+}
+# widths in px; the logo is shown 180 px wide, 360 px covers 2x screens
+STATIC_IMAGE_VARIANTS = {
+    'images/logo.png': [360],
+}
+
 WSGI_APPLICATION = 'luxeladies.wsgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+DB_ENGINE = os.environ.get("DB_ENGINE", "sqlite")
+
+if DB_ENGINE == "postgres":
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get("DB_NAME", "luxeladies"),
+            'USER': os.environ.get("DB_USER", "luxeladies"),
+            'PASSWORD': os.environ.get("DB_PASSWORD", ""),
+            'HOST': os.environ.get("DB_HOST", "localhost"),
+            'PORT': os.environ.get("DB_PORT", "5432"),
+            # the psycopg pool keeps the connections open itself, so CONN_MAX_AGE must stay 0
+            'CONN_MAX_AGE': 0,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get("DB_POOL_MIN_SIZE", "2")),
+                    'max_size': int(os.environ.get("DB_POOL_MAX_SIZE", "10")),
+                    'timeout': int(os.environ.get("DB_POOL_TIMEOUT", "10")),
+                },
+            },
+        }
+    }
+    if os.environ.get("DB_REPLICA_HOST"):
+        DATABASES['replica'] = copy.deepcopy(DATABASES['default'])
+        DATABASES['replica'].update({
+            'HOST': os.environ["DB_REPLICA_HOST"],
+            'PORT': os.environ.get("DB_REPLICA_PORT", DATABASES['default']['PORT']),
+        })
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get("DB_NAME", BASE_DIR / 'db.sqlite3'),
+            # keep connections open between requests instead of reconnecting every time
+            'CONN_MAX_AGE': int(os.environ.get("DB_CONN_MAX_AGE", "600")),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # seconds the sqlite3 driver waits for a lock before raising; this is
+                # SQLite's busy_timeout, so SQLITE_PRAGMAS must not set it again
+                'timeout': 20,
+                # take the write lock at BEGIN, so two writers can't deadlock on upgrade
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
     }
+    if os.environ.get("DB_REPLICA_NAME"):
+        # e.g. a litestream/rsync copy of the primary file
+        DATABASES['replica'] = copy.deepcopy(DATABASES['default'])
+        DATABASES['replica']['NAME'] = os.environ["DB_REPLICA_NAME"]
+
+if 'replica' in DATABASES:
+    # the test runner does not create a separate replica database
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['core.db.PrimaryReplicaRouter']
+
+# GET requests to these URL names read from the 'replica' alias (core.middleware.ReplicaRoutingMiddleware)
+DB_REPLICA_VIEWS = ['all_events', 'events_past', 'recommended_events', 'event_detail']
+# after a POST the client keeps reading from the primary for this many seconds
+DB_REPLICA_STICKY_SECONDS = int(os.environ.get("DB_REPLICA_STICKY_SECONDS", "15"))
+
+# Per-request SQL/timing instrumentation (core.middleware.RequestTimingMiddleware)
+REQUEST_TIMING_ENABLE = TESTING or os.environ.get("REQUEST_TIMING_ENABLE", "False") == "True"
+# max queries per URL name; going over fails the request in tests and logs a warning otherwise
+QUERY_BUDGET_STRICT = TESTING
+QUERY_BUDGETS = {
+    'home': 2,
+    'all_events': 6,
+    'events_past': 4,
+    'recommended_events': 6,
+    'event_detail': 10,
+    'my_profile': 10,
+    'admin_panel': 7,
+    'admin_event_registrations': 5,
+    'analytics_dashboard': 8,
+}
+
+# how far ahead the occurrences of recurring event series exist as Event rows
+SERIES_MATERIALIZE_DAYS = int(os.environ.get("SERIES_MATERIALIZE_DAYS", 60))
+
+# Live seat/queue counters over server-sent events (events.live): saves within this
+# window are pushed together; every refresh interval the subscribed counters are
+# recomputed, which picks up changes made by other processes. Live push needs the ASGI
+# application (luxeladies.asgi): under WSGI the pages do not subscribe, and the endpoint
+# answers a direct request with one snapshot and a retry of LIVE_WSGI_RETRY_MS.
+LIVE_COALESCE_MS = int(os.environ.get("LIVE_COALESCE_MS", 500))
+LIVE_REFRESH_SECONDS = int(os.environ.get("LIVE_REFRESH_SECONDS", 15))
+LIVE_HEARTBEAT_SECONDS = 20
+LIVE_RETRY_MS = 5000
+LIVE_WSGI_RETRY_MS = 10 * 60 * 1000
+
+# iCalendar feeds (events.ical): events have no end time, so entries last
+# CALENDAR_EVENT_MINUTES; feeds keep approved events of the last CALENDAR_PAST_DAYS
+# and clients may reuse a copy for CALENDAR_MAX_AGE seconds before revalidating it.
+CALENDAR_EVENT_MINUTES = 120
+CALENDAR_PAST_DAYS = 30
+CALENDAR_MAX_AGE = 300
+# absolute base URL for links that leave the site, e.g. https://luxeladies.bg
+SITE_URL = os.environ.get("SITE_URL", "")
+
+# Member approval rules (core.approvals). The batch approval and the optional
+# auto_approve_members_job approve at most APPROVAL_BATCH_LIMIT users per run.
+APPROVAL_MIN_AGE = 18
+APPROVAL_BATCH_LIMIT = int(os.environ.get("APPROVAL_BATCH_LIMIT", 5000))
+AUTO_APPROVE_ENABLE = os.environ.get("AUTO_APPROVE_ENABLE", "False") == "True"
+# Emails queued by bulk operations, sent by send_queued_emails_job every minute
+EMAIL_QUEUE_BATCH = int(os.environ.get("EMAIL_QUEUE_BATCH", 200))
+EMAIL_QUEUE_MAX_ATTEMPTS = 5
+# Member notifications (core.notifications) arriving within this many seconds of the
+# first pending one go out together, as one digest email, via send_notifications_job
+NOTIFICATION_WINDOW_SECONDS = int(os.environ.get("NOTIFICATION_WINDOW_SECONDS", 120))
+
+# Analytics rollups (events.analytics), refreshed by rollup_analytics_job. Each run also
+# re-reads the rows changed ANALYTICS_OVERLAP_MINUTES before the previous run and
+# recomputes the last ANALYTICS_RECOMPUTE_DAYS days, which is where deletions show up.
+ANALYTICS_OVERLAP_MINUTES = 10
+ANALYTICS_RECOMPUTE_DAYS = 2
+
+# Audit log (core.audit): entries older than AUDIT_HOT_DAYS are packed into monthly
+# archives by archive_audit_log_job, whole months at a time.
+AUDIT_HOT_DAYS = 90
+
+# Response compression (core.middleware.CompressionMiddleware); brotli is used when the
+# brotli package is installed. Level and quality are the cheap end of the curve for
+# per-request compression, see bench_compression. Pages with a CSRF token get gzip with
+# up to COMPRESSION_MASK_BYTES random header bytes.
+COMPRESSION_ENABLE = os.environ.get("COMPRESSION_ENABLE", "True") == "True"
+COMPRESSION_MIN_SIZE = 512  # bytes
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 4
+COMPRESSION_MASK_BYTES = 100
+
+# PRAGMAs applied to every new SQLite connection (core.db.configure_sqlite_connection)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 128 * 1024 * 1024,  # bytes
+    'cache_size': -20000,            # negative = KiB, ~20 MB
+    'temp_store': 'MEMORY',
 }
 
 
+# Shared cache for sessions, the cached users and the interest choices. Without REDIS_URL
+# every process has its own local-memory cache, which is only right for a single process.
+REDIS_URL = os.environ.get("REDIS_URL", "")
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+
+# Performance auth profile (core.auth): sessions read from the cache (written through to
+# the DB) and the logged-in user cached per user id, invalidated on every save.
+# On by default with a shared cache, in development and in tests.
+AUTH_FAST_PATH = os.environ.get(
+    "AUTH_FAST_PATH", str(bool(REDIS_URL) or DEBUG or TESTING)
+) == "True"
+if AUTH_FAST_PATH:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+    # ModelBackend stays, so sessions created before the switch remain valid
+    AUTHENTICATION_BACKENDS = [
+        'core.auth.CachedModelBackend',
+        'django.contrib.auth.backends.ModelBackend',
+    ]
+AUTH_USER_CACHE_TTL = int(os.environ.get("AUTH_USER_CACHE_TTL", 300))
+# a login less than this many seconds after the stored last_login does not write it again
+LAST_LOGIN_RESOLUTION = int(os.environ.get("LAST_LOGIN_RESOLUTION", 3600))
+
+
+# Rate limits (core.ratelimit): "<requests>/<seconds>" per bucket and view group.
+# Off in tests, except in the tests of the limiter itself.
+# One round trip per request only with a Redis cache (Lua script); other backends
+# lock each bucket with cache.add and then read and write all of them with get_many/set_many.
+RATELIMIT_ENABLE = os.environ.get("RATELIMIT_ENABLE", str(not TESTING)) == "True"
+RATELIMITS = {
+    'login': {'ip': '30/300', 'username': '10/300'},
+    'register': {'ip': '10/3600'},
+    'register_for_event': {'user': '20/60'},
+}
+# request.META key with the client address when running behind a proxy, e.g. HTTP_X_FORWARDED_FOR
+RATELIMIT_IP_HEADER = os.environ.get("RATELIMIT_IP_HEADER", "")
+
+
+# Password hashing profile (core.hashers): argon2 (needs argon2-cffi), scrypt or pbkdf2.
+# Hashes made with another profile or other parameters still verify and are rehashed
+# with the current ones on the next successful login. Measure with bench_login.
+PASSWORD_HASHING_PROFILE = os.environ.get("PASSWORD_HASHING_PROFILE", "scrypt")
+PASSWORD_SCRYPT = {
+    'work_factor': int(os.environ.get("PASSWORD_SCRYPT_N", 2**14)),  # memory = 128 * r * n bytes (16 MiB)
+    'block_size': int(os.environ.get("PASSWORD_SCRYPT_R", 8)),
+    'parallelism': int(os.environ.get("PASSWORD_SCRYPT_P", 2)),      # CPU time grows linearly with p
+}
+PASSWORD_ARGON2 = {
+    'time_cost': int(os.environ.get("PASSWORD_ARGON2_T", 2)),
+    'memory_cost': int(os.environ.get("PASSWORD_ARGON2_M", 19456)),  # KiB
+    'parallelism': int(os.environ.get("PASSWORD_ARGON2_P", 1)),
+}
+_PASSWORD_HASHERS = {
+    'argon2': 'core.hashers.TunedArgon2PasswordHasher',
+    'scrypt': 'core.hashers.TunedScryptPasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+}
+if PASSWORD_HASHING_PROFILE not in _PASSWORD_HASHERS:
+    raise ImproperlyConfigured(f"Unknown PASSWORD_HASHING_PROFILE: {PASSWORD_HASHING_PROFILE}")
+if PASSWORD_HASHING_PROFILE == 'argon2' and importlib.util.find_spec('argon2') is None:
+    raise ImproperlyConfigured("PASSWORD_HASHING_PROFILE=argon2 needs the argon2-cffi package")
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHING_PROFILE]] + [
+    hasher for profile, hasher in _PASSWORD_HASHERS.items() if profile != PASSWORD_HASHING_PROFILE
+] + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+if TESTING:
+    # a real hash costs ~100 ms per created or logged-in user; tests that need one override this
+    PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -31,8 +31,14 @@ urlpatterns = [
     
     path('admin-panel/', core_views.admin_panel, name='admin_panel'),
     path('admin-panel/approve/<int:user_id>/', core_views.approve_user, name='approve_user'),
+    path('admin-panel/approvals/', core_views.approval_queue, name='approval_queue'),
+    path('admin-panel/analytics/', core_views.analytics_dashboard, name='analytics_dashboard'),
     path('admin-panel/reject/<int:user_id>/', core_views.reject_user, name='reject_user'),
     path('admin-panel/delete/<int:user_id>/', core_views.delete_user, name='delete_user'),
+    path('admin-panel/job-metrics/', core_views.job_metrics, name='job_metrics'),
+    path('admin-panel/request-stats/', core_views.request_stats_dump, name='request_stats'),
+    path('admin-panel/export/members/', core_views.export_members, name='export_members'),
+    path('admin-panel/export/registrations/', core_views.export_registrations, name='export_registrations'),
     path('questionnaire/', core_views.fill_questionnaire, name='questionnaire'),
     path('thank-you/', TemplateView.as_view(template_name='thank_you.html'), name='thank_you'),
     path('events/', include('events.urls')),